@@ -0,0 +1,141 @@
+"""Load test the stories API under WSGI (sync views) and ASGI (async views).
+
+Seeds a scratch database, then serves it twice as a separate process: a
+threaded WSGI server with the sync views, and uvicorn (if installed) on
+``cwk1.asgi`` with ``STORIES_ASYNC_VIEWS`` on. Each is driven at increasing
+concurrency with GET /api/stories, and requests per second and latency
+percentiles are reported. The listing cache is off unless ``--cache`` is
+given, so every request reaches the ORM.
+
+    python -m benchmarks.bench_asgi_wsgi --concurrency 1 8 32 --duration 10
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.common import ROOT, free_port, latency_summary, scratch_database, seed_authors, seed_stories
+
+SETTINGS_TEMPLATE = """\
+from cwk1.settings import *  # noqa: F401,F403
+
+DATABASES['default']['NAME'] = {db_path!r}
+STORIES_ASYNC_VIEWS = {async_views!r}
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1']
+if not {cache!r}:
+    STORY_CACHE_ALIAS = None
+"""
+
+
+def serve_wsgi(port):
+    import django
+    django.setup()
+    from benchmarks.common import wsgi_server
+
+    with wsgi_server(port=port):
+        threading.Event().wait()
+
+
+def start_server(kind, db_path, workdir, cache):
+    settings_dir = Path(workdir) / kind
+    settings_dir.mkdir()
+    (settings_dir / 'bench_settings.py').write_text(
+        SETTINGS_TEMPLATE.format(db_path=str(db_path), async_views=kind == 'asgi', cache=cache))
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='bench_settings',
+               PYTHONPATH=os.pathsep.join([str(settings_dir), str(ROOT)]))
+    port = free_port()
+    if kind == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'cwk1.asgi:application', '--port', str(port),
+                   '--log-level', 'warning', '--no-access-log']
+    else:
+        command = [sys.executable, '-m', 'benchmarks.bench_asgi_wsgi', '--serve-wsgi', str(port)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, f'http://127.0.0.1:{port}/'
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{kind} server did not start')
+
+
+def drive(url, concurrency, duration, params):
+    import requests
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker():
+        session = requests.Session()
+        local, failed = [], 0
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                ok = session.get(url + 'api/stories', params=params, timeout=30).status_code == 200
+            except requests.RequestException:
+                ok = False
+            local.append(time.perf_counter() - start)
+            failed += not ok
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies) / duration, latency_summary(latencies), errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--cache', action='store_true', help='leave the story listing cache on')
+    parser.add_argument('--serve-wsgi', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        serve_wsgi(args.serve_wsgi)
+        return
+
+    try:
+        import uvicorn  # noqa: F401
+        kinds = ['wsgi', 'asgi']
+    except ImportError:
+        print('uvicorn is not installed; only the WSGI deployment will be measured.')
+        kinds = ['wsgi']
+
+    params = {'story_cat': 'pol', 'limit': 20}
+    with scratch_database() as db_path:
+        seed_stories(args.rows, seed_authors(50))
+        from django.db import connections
+        connections.close_all()
+        with tempfile.TemporaryDirectory() as workdir:
+            for kind in kinds:
+                process, url = start_server(kind, db_path, workdir, args.cache)
+                try:
+                    print(f'\n== {kind} ==')
+                    for concurrency in args.concurrency:
+                        rps, summary, errors = drive(url, concurrency, args.duration, params)
+                        print(f"c={concurrency:<4} {rps:8.1f} req/s  p50={summary['p50_ms']:8.2f}ms "
+                              f"p99={summary['p99_ms']:8.2f}ms  errors={errors}")
+                finally:
+                    process.terminate()
+                    process.wait()
+
+
+if __name__ == '__main__':
+    main()
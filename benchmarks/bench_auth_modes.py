@@ -0,0 +1,50 @@
+"""Authenticated request throughput with cookie sessions versus bearer tokens.
+
+Each request is a POST /api/stories that fails validation after the
+authentication check, so timings and query counts are dominated by the auth
+path rather than by writes.
+
+    python -m benchmarks.bench_auth_modes --requests 5000
+"""
+import argparse
+import time
+
+from benchmarks.common import logged_in_client, scratch_database, seed_authors
+
+INVALID_STORY = {'headline': 'Auth', 'category': 'pol', 'region': 'nowhere', 'details': 'Rejected'}
+
+
+def run(client, count, **headers):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for _ in range(count):
+            response = client.post('/api/stories', INVALID_STORY, content_type='application/json', **headers)
+            assert response.content == b'Invalid region', response.content
+        elapsed = time.perf_counter() - start
+    return count / elapsed, len(queries) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    with scratch_database():
+        from django.test import Client
+        from cwk1.tokens import issue_token
+        from webcwk1.models import Author
+
+        author_id = seed_authors(1)[0]
+        session_client = logged_in_client(author_id)
+        token = issue_token(Author.objects.get(pk=author_id))
+        for name, client, headers in (('session', session_client, {}),
+                                      ('token', Client(), {'HTTP_AUTHORIZATION': f'Bearer {token}'})):
+            rate, queries = run(client, args.requests, **headers)
+            print(f'{name:<8} {rate:8.0f} req/s  {queries:.2f} queries/request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Deleting 100k stories: one request per story vs the bulk delete endpoint.
+
+Seeds a scratch database with one author's archive, then deletes it three
+ways: DELETE /api/stories/<key> per story (timed on a sample and
+extrapolated), POST /api/stories/delete with lists of keys, and a single
+POST /api/stories/delete with a date filter. Reports wall time, stories per
+second and the longest single DELETE statement, which is how long other
+writers can be kept waiting.
+
+    python -m benchmarks.bench_bulk_delete --rows 100000 --sample 1000
+"""
+import argparse
+import time
+from datetime import timedelta
+
+from benchmarks.common import logged_in_client, scratch_database, seed_authors, seed_stories
+
+
+class DeleteTimer:
+    """``execute_wrapper`` recording how long each DELETE statement runs."""
+
+    def __init__(self):
+        self.longest = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.startswith('DELETE'):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.longest = max(self.longest, time.perf_counter() - start)
+
+
+def report(label, count, seconds, timer):
+    print(f'{label:<28} {seconds:9.2f}s  {count / seconds:10.0f} stories/s  '
+          f'longest DELETE {timer.longest * 1000:8.2f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--sample', type=int, default=1000, help='stories deleted one request at a time')
+    parser.add_argument('--keys-per-request', type=int, default=10_000)
+    args = parser.parse_args()
+
+    with scratch_database():
+        from django.conf import settings
+        from django.db import connection
+        from django.utils import timezone
+        from webcwk1.models import NewsStory
+
+        settings.STORY_CACHE_ALIAS = None
+        author_id = seed_authors(1)[0]
+        client = logged_in_client(author_id)
+        keys = NewsStory.objects.values_list('pk', flat=True).order_by('pk')
+
+        def run(label, count, fn):
+            timer = DeleteTimer()
+            with connection.execute_wrapper(timer):
+                start = time.perf_counter()
+                fn()
+                seconds = time.perf_counter() - start
+            report(label, count, seconds, timer)
+            return seconds
+
+        seed_stories(args.rows, [author_id])
+        sample = list(keys[:args.sample])
+        seconds = run(f'one per request ({len(sample)})', len(sample),
+                      lambda: [client.delete(f'/api/stories/{key}') for key in sample])
+        print(f'{"  extrapolated":<28} {seconds * args.rows / len(sample):9.2f}s for {args.rows} stories')
+        NewsStory.objects.all().delete()
+
+        seed_stories(args.rows, [author_id])
+
+        def delete_by_keys():
+            while True:
+                chunk = list(keys[:args.keys_per_request])
+                if not chunk:
+                    return
+                client.post('/api/stories/delete', {'keys': chunk}, content_type='application/json')
+
+        run('bulk, lists of keys', args.rows, delete_by_keys)
+
+        seed_stories(args.rows, [author_id])
+        before = (timezone.now() + timedelta(days=2)).strftime('%d/%m/%Y')
+        run('bulk, date filter', args.rows,
+            lambda: client.post('/api/stories/delete', {'filter': {'before': before}},
+                                content_type='application/json'))
+        assert not NewsStory.objects.exists()
+
+
+if __name__ == '__main__':
+    main()
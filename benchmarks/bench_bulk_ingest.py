@@ -0,0 +1,46 @@
+"""Stories per second through POST /api/stories versus POST /api/stories/batch.
+
+    python -m benchmarks.bench_bulk_ingest --stories 5000 --batch-size 1000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import logged_in_client, scratch_database, seed_authors
+
+
+def story(i):
+    return {'headline': f'Wire {i}', 'category': 'tech', 'region': 'w', 'details': f'Wire story {i}'}
+
+
+def run_single(client, count):
+    for i in range(count):
+        response = client.post('/api/stories', story(i), content_type='application/json')
+        assert response.status_code == 201, response.content
+
+
+def run_batch(client, count, batch_size):
+    for start in range(0, count, batch_size):
+        body = ''.join(json.dumps(story(i)) + '\n' for i in range(start, min(start + batch_size, count)))
+        response = client.post('/api/stories/batch', body, content_type='application/x-ndjson')
+        assert response.status_code == 201, response.content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stories', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with scratch_database():
+        client = logged_in_client(seed_authors(1)[0])
+        for name, run in (('single', lambda: run_single(client, args.stories)),
+                          ('batch', lambda: run_batch(client, args.stories, args.batch_size))):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print(f'{name:<7} {args.stories} stories in {elapsed:7.2f}s = {args.stories / elapsed:10.0f} stories/s')
+
+
+if __name__ == '__main__':
+    main()
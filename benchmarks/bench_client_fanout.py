@@ -0,0 +1,87 @@
+"""Wall-clock time of ``client.Client`` fetching news from many agencies.
+
+Starts local stand-in agency servers, each answering ``/api/stories`` after an
+injected delay, and compares fetching them one after another with the
+concurrent fan-out used by the ``news`` command.
+
+    python -m benchmarks.bench_client_fanout --agencies 10 --max-latency 1.0
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from client import Client
+
+STORY = {
+    'key': '1', 'headline': 'Stand-in', 'story_cat': 'tech', 'story_region': 'uk',
+    'author': 'bench', 'story_date': '2024-01-01', 'story_details': 'Served by a stand-in agency.',
+}
+
+
+def start_agency(latency, stories=20):
+    body = json.dumps({'stories': [STORY] * stories}).encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_sequential(client, agencies, params):
+    count = 0
+    for agency in agencies:
+        for stories in client.iter_agency_pages(agency, params):
+            count += len(stories)
+    return count
+
+
+def run_concurrent(client, agencies, params):
+    count = 0
+    for _, stories, error in client.fetch_news_concurrently(agencies, params):
+        if not error:
+            count += len(stories)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agencies', type=int, default=10)
+    parser.add_argument('--min-latency', type=float, default=0.05)
+    parser.add_argument('--max-latency', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    latencies = [rng.uniform(args.min_latency, args.max_latency) for _ in range(args.agencies)]
+    servers = [start_agency(latency) for latency in latencies]
+    agencies = [{'agency_code': f'AG{i}', 'url': f'http://127.0.0.1:{server.server_port}/'}
+                for i, server in enumerate(servers)]
+    params = {'id': '*', 'cat': '*', 'reg': '*', 'date': '*'}
+
+    print(f'{args.agencies} agencies, sum of latencies {sum(latencies):.2f}s, slowest {max(latencies):.2f}s')
+    for name, run in (('sequential', run_sequential), ('concurrent', run_concurrent)):
+        client = Client()
+        start = time.perf_counter()
+        count = run(client, agencies, params)
+        print(f'{name:<11} {time.perf_counter() - start:6.2f}s  ({count} stories)')
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
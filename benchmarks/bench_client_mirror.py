@@ -0,0 +1,89 @@
+"""`news` answered from the client's local mirror vs fetched from the agency.
+
+Seeds a scratch database, serves it from a local WSGI server and points a
+``client.Client`` at it with its own mirror file. Times the first full
+``sync``, a no-op incremental sync, an incremental sync after some posts
+and deletes, and then each ``news`` filter shape both from the mirror and
+live over HTTP.
+
+    python -m benchmarks.bench_client_mirror --stories 100000 --repeat 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from benchmarks.common import latency_summary, scratch_database, seed_authors, seed_stories, time_calls
+
+FILTERS = [
+    ('everything', {}),
+    ('-cat', {'cat': 'pol'}),
+    ('-cat -reg', {'cat': 'pol', 'reg': 'uk'}),
+    ('-cat -reg -date', {'cat': 'pol', 'reg': 'uk', 'date': 'week'}),
+    ('-date', {'date': 'week'}),
+]
+
+
+def quietly(fn):
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        fn()
+    return out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stories', type=int, default=100_000)
+    parser.add_argument('--changes', type=int, default=500, help='stories posted and deleted before resyncing')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with scratch_database() as db_path, tempfile.TemporaryDirectory() as workdir:
+        from django.db import connections
+        from django.utils import timezone
+        from benchmarks.bench_asgi_wsgi import start_server
+        from client import Client, StoryMirror
+        from webcwk1.models import NewsStory
+
+        author_ids = seed_authors(10)
+        seed_stories(args.stories, author_ids)
+        connections.close_all()
+        process, url = start_server('wsgi', db_path, workdir, False)
+        try:
+            client = Client()
+            client.mirror = StoryMirror(os.path.join(workdir, 'mirror.sqlite3'))
+            client.directory.get = lambda offline=False: [{'agency_code': 'BENCH', 'url': url}]
+
+            def timed(label, fn):
+                start = time.perf_counter()
+                output = quietly(fn)
+                print(f'{label:<34} {time.perf_counter() - start:8.2f}s  {output.strip().splitlines()[-1]}')
+
+            timed('first sync', lambda: client.sync('sync'))
+            timed('incremental sync, no changes', lambda: client.sync('sync'))
+            seed_stories(args.changes, author_ids)
+            stale = NewsStory.objects.order_by('pk').values_list('pk', flat=True)[:args.changes]
+            NewsStory.objects.filter(pk__in=list(stale)).delete()
+            connections.close_all()
+            timed(f'incremental sync, {args.changes}+{args.changes}', lambda: client.sync('sync'))
+
+            week_ago = (timezone.now() - timedelta(days=7)).strftime('%d/%m/%Y')
+            print(f'\nnews, {args.repeat} runs each      mirror p50      live p50   stories')
+            for label, spec in FILTERS:
+                words = [f'-{key}={week_ago if value == "week" else value}' for key, value in spec.items()]
+                command = ' '.join(['news'] + words)
+                stories = quietly(lambda: client.get_news(command)).count('Key: ')
+                assert stories == quietly(lambda: client.get_news(command + ' --live')).count('Key: ')
+                local = latency_summary(time_calls(lambda: quietly(lambda: client.get_news(command)), args.repeat))
+                live = latency_summary(time_calls(lambda: quietly(lambda: client.get_news(command + ' --live')),
+                                                  args.repeat))
+                print(f"{label:<24} {local['p50_ms']:>12.1f}ms {live['p50_ms']:>12.1f}ms {stories:>9}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Payload size, encode and decode time: JSON listings vs the compact formats.
+
+Seeds a scratch database and, for a page of up to 1000 and a full listing,
+times the server building each body (SELECT included, as the views do), and
+the client turning it back into story dicts (``json.loads`` for JSON,
+``client.decode_listing`` for the compact ones). Sizes are given both raw
+and gzipped, since most clients also negotiate compression. The compact
+formats trade server time for size: encoding ``columns`` took about twice
+as long as JSON on a page of 1000 and about 28% longer on a 200k listing.
+
+    python -m benchmarks.bench_compact_format --stories 200000 --repeat 5
+"""
+import argparse
+import gzip
+
+from benchmarks.common import latency_summary, scratch_database, seed_authors, seed_stories, time_calls
+
+
+class FakeResponse:
+    """The parts of a ``requests`` response that ``decode_listing`` reads."""
+
+    def __init__(self, body, content_type):
+        import json
+
+        self.content = body
+        self.headers = {'Content-Type': content_type}
+        self.json = lambda: json.loads(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stories', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with scratch_database():
+        from client import decode_listing
+        from webcwk1 import compact
+        from webcwk1.queries import STORY_LIST_COLUMNS, stories_query, story_json, story_page, story_rows
+
+        seed_stories(args.stories, seed_authors(50))
+        stories = stories_query()
+        formats = ['json', 'columns'] + (['msgpack'] if compact.msgpack else [])
+        if compact.msgpack is None:
+            print('msgpack is not installed; skipping it')
+
+        def body(format, limit):
+            columns = STORY_LIST_COLUMNS if format == 'json' else compact.COMPACT_COLUMNS
+            rows = story_page(stories, None, limit, columns)[0] if limit else list(story_rows(stories, columns))
+            if format == 'json':
+                return ('{"stories": [%s]}' % ', '.join([story_json(row) for row in rows])).encode('utf-8')
+            return compact.encode(format, rows)
+
+        page = min(1000, args.stories)
+        for label, limit in ((f'page of {page}', page), (f'all {args.stories} stories', None)):
+            print(f'\n{label}')
+            print(f'{"format":<9}{"bytes":>13}{"gzipped":>12}{"encode p50":>13}{"decode p50":>13}')
+            for format in formats:
+                payload = body(format, limit)
+                response = FakeResponse(payload, compact.CONTENT_TYPES[format])
+                assert len(decode_listing(response)['stories']) == (limit or args.stories)
+                encode = latency_summary(time_calls(lambda: body(format, limit), args.repeat))
+                decode = latency_summary(time_calls(lambda: decode_listing(response), args.repeat))
+                print(f'{format:<9}{len(payload):>13,}{len(gzip.compress(payload, 6)):>12,}'
+                      f"{encode['p50_ms']:>11.1f}ms{decode['p50_ms']:>11.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
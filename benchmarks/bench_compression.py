@@ -0,0 +1,95 @@
+"""Bytes on the wire and CPU cost of each response encoding and level.
+
+Seeds a scratch database and fetches real listing bodies through the Django
+test client (pages of 100 and 1000 stories, and a 10k-story NDJSON stream),
+then compresses each with every installed codec at a range of levels:
+whole bodies in one shot, as ``CompressionMiddleware`` does for ordinary
+responses, and the stream chunk by chunk with a flush after each, as it
+does for streams. CPU time is process time, so it excludes waiting.
+
+    python -m benchmarks.bench_compression --repeat 20
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import logged_in_client, scratch_database, seed_authors, seed_stories
+
+LEVELS = {'gzip': (1, 6, 9), 'zstd': (1, 3, 9, 19), 'br': (1, 4, 9, 11)}
+
+
+def cpu_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        fn()
+        samples.append(time.process_time() - start)
+    return statistics.median(samples) * 1000
+
+
+def compress_stream(codec, chunks):
+    compress, finish = codec.compressor()
+    return b''.join([compress(chunk) for chunk in chunks]) + finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stories', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with scratch_database():
+        from django.conf import settings
+        from cwk1.compression import CODECS
+
+        settings.STORY_CACHE_ALIAS = None
+        author_ids = seed_authors(50)
+        seed_stories(args.stories, author_ids)
+        client = logged_in_client(author_ids[0])
+        stream = client.get('/api/stories', headers={'Accept': 'application/x-ndjson'})
+        bodies = [
+            ('page of 100', [client.get('/api/stories', {'limit': 100}).content]),
+            ('page of 1000', [client.get('/api/stories', {'limit': 1000}).content]),
+            (f'NDJSON stream of {args.stories}', list(stream.streaming_content)),
+        ]
+        missing = sorted(set(LEVELS) - set(CODECS))
+        if missing:
+            print(f'not installed: {", ".join(missing)}')
+
+        for label, chunks in bodies:
+            plain = b''.join(chunks)
+            print(f'\n{label}: {len(plain):,} bytes in {len(chunks)} chunk(s)')
+            print(f'{"encoding":<10}{"bytes":>12}{"ratio":>8}{"encode ms":>12}{"decode ms":>12}{"MB/s":>9}')
+            for encoding, codec_class in CODECS.items():
+                for level in LEVELS[encoding]:
+                    codec = codec_class(level)
+                    if len(chunks) == 1:
+                        encode = lambda: codec.compress(plain)  # noqa: E731
+                    else:
+                        encode = lambda: compress_stream(codec, chunks)  # noqa: E731
+                    body = encode()
+                    decode = decoder(encoding)
+                    assert decode(body) == plain
+                    encode_ms = cpu_ms(encode, args.repeat)
+                    decode_ms = cpu_ms(lambda: decode(body), args.repeat)
+                    print(f'{encoding + "-" + str(level):<10}{len(body):>12,}{len(plain) / len(body):>8.1f}'
+                          f'{encode_ms:>12.2f}{decode_ms:>12.2f}{len(plain) / 1e6 / (encode_ms / 1000):>9.0f}')
+
+
+def decoder(encoding):
+    """What the client (urllib3) runs on a body with this Content-Encoding."""
+    if encoding == 'gzip':
+        import zlib
+
+        return lambda body: zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body)
+    from cwk1.compression import brotli, zstd, zstandard
+
+    if encoding == 'zstd':
+        if zstd is not None:
+            return zstd.decompress
+        return lambda body: zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return brotli.decompress
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Logins per second on one core for each PASSWORD_HASH_POLICY.
+
+Runs single-threaded, so the rates are per core. Also reports how quickly
+repeated bad credentials are turned away by the failed-login cache.
+
+    python -m benchmarks.bench_login_throughput --logins 50
+"""
+import argparse
+import time
+
+from benchmarks.common import logged_in_client, scratch_database, seed_authors
+
+
+def login_rate(client, count, password):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.post('/api/login', {'username': 'author0', 'password': password})
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=50)
+    args = parser.parse_args()
+
+    with scratch_database():
+        from django.contrib.auth.hashers import make_password
+        from django.test import Client
+        from django.test.utils import override_settings
+        from cwk1.backend import failed_logins
+        from cwk1.hashers import POLICY_HASHERS, password_hashers
+        from webcwk1.models import Author
+
+        author_id = seed_authors(1)[0]
+        logged_in_client(author_id)
+        client = Client()
+        for policy in POLICY_HASHERS:
+            with override_settings(PASSWORD_HASHERS=password_hashers(policy)):
+                try:
+                    Author.objects.filter(pk=author_id).update(password=make_password('benchpass'))
+                except ValueError as e:
+                    print(f'{policy:<7} skipped: {e}')
+                    continue
+                good = login_rate(client, args.logins, 'benchpass')
+                failed_logins.clear()
+                bad = login_rate(client, 1, 'wrong')
+                repeated = login_rate(client, args.logins * 20, 'wrong')
+            print(f'{policy:<7} {good:8.1f} logins/s/core  first bad {bad:8.1f}/s  '
+                  f'repeated bad {repeated:8.1f}/s')
+
+
+if __name__ == '__main__':
+    main()
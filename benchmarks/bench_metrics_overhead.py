@@ -0,0 +1,71 @@
+"""Overhead of RequestMetricsMiddleware on the stories endpoints.
+
+Seeds a scratch database and times requests through the Django test client
+with the metrics middleware removed from ``MIDDLEWARE`` and with it in
+place, alternating short rounds of each so drift affects both equally. A
+cached listing is the worst case (the least work for the overhead to hide
+behind); an uncached page is the typical one.
+
+    python -m benchmarks.bench_metrics_overhead --rounds 20 --requests 200
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import logged_in_client, scratch_database, seed_authors, seed_stories
+
+METRICS_MIDDLEWARE = 'cwk1.metrics.RequestMetricsMiddleware'
+
+
+def client_with(middleware, author_id):
+    from django.conf import settings
+
+    settings.MIDDLEWARE = middleware
+    client = logged_in_client(author_id)
+    client.get('/api/stories')  # loads the middleware chain
+    return client
+
+
+def per_request(client, params, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.get('/api/stories', params)
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200, help='requests per round')
+    args = parser.parse_args()
+
+    with scratch_database():
+        from django.conf import settings
+        from django.core.cache import caches
+
+        author_id = seed_authors(10)[0]
+        seed_stories(args.rows, [author_id])
+        with_metrics = list(settings.MIDDLEWARE)
+        without_metrics = [name for name in with_metrics if name != METRICS_MIDDLEWARE]
+        clients = {'off': client_with(without_metrics, author_id), 'on': client_with(with_metrics, author_id)}
+
+        cases = [
+            ('cached listing', {'story_cat': 'pol', 'limit': 20}, True),
+            ('uncached page', {'story_cat': 'pol', 'limit': 20}, False),
+        ]
+        for label, params, cached in cases:
+            settings.STORY_CACHE_ALIAS = 'stories' if cached else None
+            caches['stories'].clear()
+            samples = {'off': [], 'on': []}
+            for _ in range(args.rounds):
+                for mode, client in clients.items():
+                    samples[mode].append(per_request(client, params, args.requests))
+            off = statistics.median(samples['off'])
+            on = statistics.median(samples['on'])
+            print(f'{label:<16} off={off * 1e6:9.1f}us  on={on * 1e6:9.1f}us  '
+                  f'overhead={(on - off) * 1e6:7.1f}us ({(on / off - 1) * 100:+.2f}%)')
+
+
+if __name__ == '__main__':
+    main()
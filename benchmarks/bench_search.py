@@ -0,0 +1,48 @@
+"""Full-text search through FTS5 versus ``icontains`` scans.
+
+Times the first page and the full match count for a few keywords, with and
+without the category filter, on a scratch database. FTS pages are ranked, so
+they score every match; icontains pages are newest-first and stop scanning
+as soon as the page is full, which flatters common words.
+
+    python -m benchmarks.bench_search --rows 1000000
+"""
+import argparse
+
+from benchmarks.common import latency_summary, scratch_database, seed_authors, seed_stories, time_calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--words', nargs='+', default=['election', 'rocket storm'])
+    args = parser.parse_args()
+
+    with scratch_database():
+        from django.db.models import Q
+        from webcwk1.queries import search_stories, stories_query
+
+        print(f'Seeding {args.rows} stories...')
+        seed_stories(args.rows, seed_authors(100))
+
+        def icontains(queryset, text):
+            for word in text.split():
+                queryset = queryset.filter(Q(headline__icontains=word) | Q(details__icontains=word))
+            return queryset
+
+        for text in args.words:
+            for category in ('*', 'pol'):
+                for name, search in (('fts5', search_stories), ('icontains', icontains)):
+                    queryset = search(stories_query(category, '*', '*'), text)
+                    page = latency_summary(time_calls(
+                        lambda: list(queryset.values_list('id', flat=True)[:args.page_size]), args.repeat))
+                    count = latency_summary(time_calls(lambda: queryset.count(), args.repeat))
+                    print(f'q={text!r:<15} cat={category:<4} {name:<10} '
+                          f"page p50={page['p50_ms']:>9.2f}ms p99={page['p99_ms']:>9.2f}ms  "
+                          f"count p50={count['p50_ms']:>9.2f}ms ({queryset.count()} matches)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Time to serialise 10k stories: per-story dicts vs pre-rendered fragments.
+
+Seeds a scratch database and times the listing body for 10,000 stories two
+ways: the old path (select every column, build a dict per story, strftime
+the date, ``json.dumps`` the lot) and the current one (select key, date and
+fragment, splice the fragments together). Each is timed for serialisation
+alone, on rows already in memory, and end to end including the SELECT.
+
+    python -m benchmarks.bench_serialisation --repeat 20
+"""
+import argparse
+import json
+
+from benchmarks.common import latency_summary, scratch_database, seed_authors, seed_stories, time_calls
+
+STORIES = 10_000
+
+DICT_COLUMNS = ('id', 'headline', 'category', 'region', 'author_username', 'date', 'details')
+
+
+def story_to_dict(row):
+    key, headline, category, region, author, date, details = row
+    return {
+        'key': str(key),
+        'headline': headline,
+        'story_cat': category,
+        'story_region': region,
+        'author': author,
+        'story_date': date.strftime('%Y-%m-%d'),
+        'story_details': details
+    }
+
+
+def dict_body(rows):
+    return json.dumps({'stories': [story_to_dict(row) for row in rows]}).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with scratch_database():
+        from webcwk1.models import NewsStory
+        from webcwk1.queries import stories_query, story_json, story_rows
+
+        seed_stories(STORIES, seed_authors(50))
+        assert NewsStory.objects.count() == STORIES
+        stories = stories_query()
+
+        def fragment_body(rows):
+            return ('{"stories": [%s]}' % ', '.join([story_json(row) for row in rows])).encode('utf-8')
+
+        dict_rows = list(stories.values_list(*DICT_COLUMNS))
+        fragment_rows = list(story_rows(stories))
+        assert json.loads(dict_body(dict_rows)) == json.loads(fragment_body(fragment_rows))
+
+        cases = [
+            ('dicts, serialise only', lambda: dict_body(dict_rows)),
+            ('fragments, serialise only', lambda: fragment_body(fragment_rows)),
+            ('dicts, fetch + serialise', lambda: dict_body(list(stories.values_list(*DICT_COLUMNS)))),
+            ('fragments, fetch + serialise', lambda: fragment_body(list(story_rows(stories)))),
+        ]
+        print(f'per {STORIES} stories, {args.repeat} runs each')
+        for label, fn in cases:
+            summary = latency_summary(time_calls(fn, args.repeat))
+            print(f"{label:<30} p50={summary['p50_ms']:>9.3f}ms p99={summary['p99_ms']:>9.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
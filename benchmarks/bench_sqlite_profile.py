@@ -0,0 +1,168 @@
+"""Mixed read/write load on SQLite, with and without the production profile.
+
+Seeds a scratch database and serves it from several WSGI server processes
+at once (like a multi-worker deployment), first with the stock settings and
+then with ``SQLITE_PRODUCTION_PROFILE`` on. Reader threads poll
+GET /api/stories while writer threads POST stories, and each side's
+requests per second, p99 latency and failed requests are reported. Failures
+are almost all "database is locked"; they are counted separately. The
+listing cache is off so every read reaches SQLite.
+
+    python -m benchmarks.bench_sqlite_profile --workers 4 --readers 16 --writers 4 --duration 10
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.common import ROOT, free_port, latency_summary, scratch_database, seed_authors, seed_stories
+
+SETTINGS_TEMPLATE = """\
+from cwk1.settings import *  # noqa: F401,F403
+
+DATABASES['default']['NAME'] = {db_path!r}
+SQLITE_PRODUCTION_PROFILE = {profile!r}
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1']
+STORY_CACHE_ALIAS = None
+"""
+
+STORY = {'headline': 'Load test', 'category': 'tech', 'region': 'uk', 'details': 'Written under load'}
+
+
+def serve_wsgi(port):
+    import django
+    django.setup()
+    from benchmarks.common import wsgi_server
+
+    with wsgi_server(port=port):
+        threading.Event().wait()
+
+
+def start_servers(count, db_path, workdir, profile):
+    settings_dir = Path(workdir) / ('production' if profile else 'default')
+    settings_dir.mkdir()
+    (settings_dir / 'bench_settings.py').write_text(SETTINGS_TEMPLATE.format(db_path=str(db_path), profile=profile))
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='bench_settings',
+               PYTHONPATH=os.pathsep.join([str(settings_dir), str(ROOT)]))
+    servers = []
+    for _ in range(count):
+        port = free_port()
+        process = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_sqlite_profile', '--serve-wsgi',
+                                    str(port)], cwd=ROOT, env=env)
+        servers.append((process, port))
+    deadline = time.monotonic() + 30
+    for process, port in servers:
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    stop_servers(servers)
+                    raise RuntimeError('WSGI server did not start')
+                time.sleep(0.1)
+    return servers
+
+
+def stop_servers(servers):
+    for process, _ in servers:
+        process.terminate()
+    for process, _ in servers:
+        process.wait()
+
+
+def drive(urls, readers, writers, duration, token):
+    import requests
+
+    results = {'read': ([], [0], [0]), 'write': ([], [0], [0])}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(kind, url):
+        session = requests.Session()
+        session.headers['Authorization'] = f'Bearer {token}'
+        local, failed, locked = [], 0, 0
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                if kind == 'read':
+                    response = session.get(url + 'api/stories', params={'story_cat': 'tech', 'limit': 20},
+                                           timeout=30)
+                    ok = response.status_code == 200
+                else:
+                    response = session.post(url + 'api/stories', json=STORY, timeout=30)
+                    ok = response.status_code == 201
+                # Writers report the OperationalError text; with DEBUG off a
+                # failed read is a bare 500, which under this load is a lock.
+                is_locked = not ok and ('locked' in response.text or response.status_code == 500)
+            except requests.RequestException:
+                ok, is_locked = False, False
+            local.append(time.perf_counter() - start)
+            failed += not ok
+            locked += is_locked
+        with lock:
+            latencies, failures, locks = results[kind]
+            latencies.extend(local)
+            failures[0] += failed
+            locks[0] += locked
+
+    threads = [threading.Thread(target=worker, args=('read', urls[i % len(urls)])) for i in range(readers)]
+    threads += [threading.Thread(target=worker, args=('write', urls[i % len(urls)])) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {kind: (len(latencies) / duration, latency_summary(latencies) if latencies else None, failed[0], locked[0])
+            for kind, (latencies, failed, locked) in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=4, help='server processes sharing the database')
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--serve-wsgi', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        serve_wsgi(args.serve_wsgi)
+        return
+
+    with scratch_database() as db_path:
+        from django.db import connection, connections
+        from cwk1.tokens import issue_token
+        from webcwk1.models import Author
+
+        author_ids = seed_authors(50)
+        seed_stories(args.rows, author_ids)
+        token = issue_token(Author.objects.get(pk=author_ids[0]))
+        with tempfile.TemporaryDirectory() as workdir:
+            for profile in (False, True):
+                # journal_mode is a property of the file; put it back to the
+                # stock rollback journal before the baseline run.
+                if not profile:
+                    with connection.cursor() as cursor:
+                        cursor.execute('PRAGMA journal_mode = DELETE')
+                connections.close_all()
+                servers = start_servers(args.workers, db_path, workdir, profile)
+                try:
+                    stats = drive([f'http://127.0.0.1:{port}/' for _, port in servers], args.readers,
+                                  args.writers, args.duration, token)
+                finally:
+                    stop_servers(servers)
+                print(f"\n== {'production profile' if profile else 'stock settings'} ==")
+                for kind, (rps, summary, failed, locked) in stats.items():
+                    p99 = f"{summary['p99_ms']:8.2f}ms" if summary else '       -'
+                    print(f'{kind:<5} {rps:8.1f} req/s  p99={p99}  failed={failed}  locked={locked}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Latency of the GET /api/stories filter combinations with and without indexes.
+
+Seeds a scratch database, then times the newest-first page produced by
+``webcwk1.queries.stories_query`` for every category/region/date combination,
+first with the ``NewsStory`` indexes dropped and then with them in place.
+
+    python -m benchmarks.bench_story_filters --rows 1000000
+"""
+import argparse
+import itertools
+import warnings
+from datetime import timedelta
+
+from benchmarks.common import latency_summary, scratch_database, seed_authors, seed_stories, time_calls
+
+
+def filter_combinations():
+    from django.utils import timezone
+
+    # The view filters on a bare date, which Django warns about under USE_TZ.
+    warnings.filterwarnings('ignore', message='DateTimeField .* received a naive datetime')
+    week_ago = (timezone.now() - timedelta(days=7)).date()
+    return list(itertools.product(['*', 'pol'], ['*', 'uk'], ['*', week_ago]))
+
+
+def run_pass(label, combinations, repeat, page_size):
+    from django.db import connection
+    from webcwk1.queries import stories_query
+
+    print(f'\n== {label} ==')
+    for category, region, date in combinations:
+        queryset = stories_query(category, region, date)
+        samples = time_calls(lambda: list(queryset.values_list('id', flat=True)[:page_size]), repeat)
+        sql, params = queryset.values_list('id', flat=True)[:page_size].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = '; '.join(row[-1] for row in cursor.fetchall())
+        summary = latency_summary(samples)
+        print(f'cat={category!s:<4} reg={region!s:<2} date={date!s:<10} '
+              f"p50={summary['p50_ms']:>9.3f}ms p99={summary['p99_ms']:>9.3f}ms  plan: {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--authors', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    with scratch_database():
+        from django.db import connection
+        from webcwk1.models import NewsStory
+
+        print(f'Seeding {args.rows} stories...')
+        seed_stories(args.rows, seed_authors(args.authors))
+        combinations = filter_combinations()
+        indexes = NewsStory._meta.indexes
+
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.remove_index(NewsStory, index)
+        run_pass('before: no filter indexes', combinations, args.repeat, args.page_size)
+
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.add_index(NewsStory, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        run_pass('after: composite filter indexes', combinations, args.repeat, args.page_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Peak RSS of buffered versus streamed GET /api/stories responses.
+
+For each row count a scratch database is seeded, then every response mode is
+rendered in a fresh subprocess, so each ``ru_maxrss`` reading belongs to that
+mode alone.
+
+    python -m benchmarks.bench_stream_memory --rows 100000 1000000
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.common import ROOT, scratch_database, seed_authors, seed_stories
+
+MODES = {
+    'json': {},
+    'stream': {'stream': '1'},
+    'ndjson': {'HTTP_ACCEPT': 'application/x-ndjson'},
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def render(mode, db_path):
+    from benchmarks.common import setup_django
+    setup_django(db_path)
+    from django.test import RequestFactory
+    from webcwk1.views import post_story
+
+    options = dict(MODES[mode])
+    headers = {k: options.pop(k) for k in list(options) if k.startswith('HTTP_')}
+    request = RequestFactory().get('/api/stories', options, **headers)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    response = post_story(request)
+    size = 0
+    if response.streaming:
+        for chunk in response.streaming_content:
+            size += len(chunk)
+    else:
+        size = len(response.content)
+    print(json.dumps({
+        'mode': mode,
+        'seconds': round(time.perf_counter() - start, 3),
+        'bytes': size,
+        'baseline_rss_mb': round(baseline, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--child', choices=sorted(MODES), help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        render(args.child, args.db)
+        return
+
+    for rows in args.rows:
+        with scratch_database() as db_path:
+            seed_stories(rows, seed_authors(50))
+            print(f'\n== {rows} rows ==')
+            for mode in MODES:
+                output = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_stream_memory', '--child', mode, '--db', str(db_path)],
+                    cwd=ROOT, check=True, capture_output=True, text=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{mode:<7} peak={result['peak_rss_mb']:>8.1f}MB "
+                      f"(+{result['peak_rss_mb'] - result['baseline_rss_mb']:.1f}MB over baseline) "
+                      f"time={result['seconds']:.2f}s bytes={result['bytes']}")
+
+
+if __name__ == '__main__':
+    main()
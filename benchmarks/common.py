@@ -0,0 +1,184 @@
+"""Shared helpers for the scripts in ``benchmarks/``.
+
+Every benchmark runs against a scratch SQLite file in a temporary directory,
+never against the project's ``db.sqlite3``.
+"""
+import logging
+import math
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CATEGORIES = ['pol', 'art', 'tech', 'trivia']
+REGIONS = ['uk', 'eu', 'w']
+# Headlines and details are drawn from this vocabulary so text search has
+# realistic selectivity (each word appears in roughly 1 in 10 stories).
+WORDS = ['election', 'budget', 'museum', 'gallery', 'launch', 'chip', 'storm', 'league', 'summit', 'festival',
+         'court', 'market', 'rocket', 'vaccine', 'strike', 'treaty', 'opera', 'startup', 'record', 'harvest',
+         'council', 'protest', 'satellite', 'novel', 'derby', 'merger', 'drought', 'archive', 'robot', 'ferry']
+
+
+def setup_django(db_path):
+    """Point the default database at ``db_path``, then set up and migrate."""
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cwk1.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = str(db_path)
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+@contextmanager
+def scratch_database():
+    """Yield the path of a freshly migrated scratch database, removed on exit."""
+    workdir = tempfile.mkdtemp(prefix='cwk1-bench-')
+    db_path = Path(workdir) / 'bench.sqlite3'
+    try:
+        setup_django(db_path)
+        yield db_path
+    finally:
+        from django.db import connections
+        connections.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def seed_authors(count, password='benchpass'):
+    """Create ``count`` authors sharing one pre-hashed password."""
+    from django.contrib.auth.hashers import make_password
+    from webcwk1.models import Author
+
+    hashed = make_password(password)
+    Author.objects.bulk_create(
+        [Author(username=f'author{i}', name=f'Author {i}', password=hashed) for i in range(count)],
+        batch_size=500,
+    )
+    return list(Author.objects.values_list('id', flat=True))
+
+
+def seed_stories(count, author_ids, days=365, category_weights=None, region_weights=None,
+                 seed=0, batch_size=10000):
+    """Insert ``count`` stories spread over the last ``days`` days.
+
+    Rows go in through raw ``executemany`` batches, which is an order of
+    magnitude quicker than ``bulk_create`` at the million-row scale.
+    """
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from webcwk1.models import Author
+    from webcwk1.queries import story_fragment
+
+    rng = random.Random(seed)
+    usernames = dict(Author.objects.filter(pk__in=author_ids).values_list('id', 'username'))
+    now = timezone.now()
+    span = days * 24 * 3600
+    adapt = connection.ops.adapt_datetimefield_value
+    sql = ('INSERT INTO webcwk1_newsstory '
+           '(headline, category, region, date, details, author_id, author_username, fragment) '
+           'VALUES (%s, %s, %s, %s, %s, %s, %s, %s)')
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, count, batch_size):
+            rows = []
+            for i in range(start, min(start + batch_size, count)):
+                author_id = rng.choice(author_ids)
+                username = usernames[author_id]
+                headline = f'Headline {i} {rng.choice(WORDS)} {rng.choice(WORDS)}'
+                category = rng.choices(CATEGORIES, category_weights)[0]
+                region = rng.choices(REGIONS, region_weights)[0]
+                date = now - timedelta(seconds=rng.randrange(span))
+                details = f'Details of story {i}: ' + ' '.join(rng.choices(WORDS, k=4))
+                rows.append((headline, category, region, adapt(date), details, author_id, username,
+                             story_fragment(headline, category, region, username, date, details)))
+            cursor.executemany(sql, rows)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def time_calls(fn, repeat):
+    """Call ``fn`` ``repeat`` times and return the wall-clock seconds of each call."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def latency_summary(samples):
+    """Summarise call durations (seconds) as p50/p99 milliseconds."""
+    return {
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def prepare_test_client():
+    """Ready this process for Django test clients; safe to call repeatedly."""
+    from django.test.utils import setup_test_environment
+
+    # Lets the test client's 'testserver' host through ALLOWED_HOSTS, turns
+    # DEBUG off so query logging doesn't skew timings, and keeps deliberate
+    # 4xx/5xx responses from flooding the output.
+    if not getattr(prepare_test_client, 'done', False):
+        setup_test_environment(debug=False)
+        logging.getLogger('django.request').disabled = True
+        prepare_test_client.done = True
+
+
+def logged_in_client(author_id):
+    """A Django test client with a session for ``author_id``."""
+    from django.test import Client
+    from webcwk1.models import Author
+
+    prepare_test_client()
+    client = Client()
+    client.force_login(Author.objects.get(pk=author_id))
+    return client
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def wsgi_server(port=0):
+    """Serve the project on localhost (a free port by default), yielding its base URL."""
+    import threading
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+    from django.core.wsgi import get_wsgi_application
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = make_server('127.0.0.1', port, get_wsgi_application(), server_class=ThreadingWSGIServer,
+                         handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}/'
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,298 @@
+"""End-to-end benchmark suite for the /api endpoints, with regression checks.
+
+``run`` seeds a scratch database (authors, stories and their category and
+region skew are all configurable), then drives login, post, list (every
+category/region/date filter combination) and delete at each concurrency
+level. Requests go through the Django test client in this process, or
+over HTTP to a local WSGI or ASGI server on the scratch database.
+Requests per second, latency percentiles and error counts are written
+as JSON.
+
+``compare`` checks a new results file against a baseline and exits 1 if any
+scenario's p50 latency rose, or its throughput fell, by more than the
+threshold.
+
+    python -m benchmarks.suite run --stories 100000 --concurrency 1 8 --output new.json
+    python -m benchmarks.suite compare baseline.json new.json --threshold 0.15
+"""
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from benchmarks.common import (
+    CATEGORIES, REGIONS, ROOT, latency_summary, prepare_test_client, scratch_database, seed_authors, seed_stories,
+)
+
+PASSWORD = 'benchpass'
+STORY = {'headline': 'Benchmark', 'category': 'tech', 'region': 'uk', 'details': 'Posted by the suite'}
+
+
+class ClientTarget:
+    """Requests through a Django test client, one per worker thread."""
+
+    def __init__(self):
+        from django.test import Client
+
+        prepare_test_client()
+        self.client = Client()
+
+    def request(self, method, path, token=None, params=None, data=None, json_body=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        call = getattr(self.client, method.lower())
+        if json_body is not None:
+            response = call(path, json_body, content_type='application/json', headers=headers)
+        else:
+            response = call(path, params or data, headers=headers)
+        return response.status_code
+
+    def close(self):
+        from django.db import connection
+
+        connection.close()
+
+
+class HttpTarget:
+    """Requests over HTTP to a server on ``base_url``."""
+
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, token=None, params=None, data=None, json_body=None):
+        import requests
+
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        try:
+            return self.session.request(method, self.base_url + path, params=params, data=data, json=json_body,
+                                        headers=headers, timeout=30).status_code
+        except requests.RequestException:
+            return 0
+
+    def close(self):
+        self.session.close()
+
+
+def drive(make_target, operation, concurrency, duration):
+    """Run ``operation(target, worker)`` in ``concurrency`` threads for ``duration`` seconds.
+
+    ``operation`` returns ``True`` on success, ``False`` on failure, or ``None``
+    when it has run out of work (e.g. no stories left to delete).
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(index):
+        target = make_target()
+        local, failed = [], 0
+        try:
+            while time.monotonic() < stop_at:
+                start = time.perf_counter()
+                ok = operation(target, index)
+                if ok is None:
+                    break
+                local.append(time.perf_counter() - start)
+                failed += not ok
+        finally:
+            target.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if not latencies:
+        return {'requests': 0, 'errors': errors[0]}
+    return {'requests': len(latencies), 'rps': round(len(latencies) / elapsed, 2), 'errors': errors[0],
+            **latency_summary(latencies)}
+
+
+def scenarios(authors, tokens, delete_keys, page_size):
+    """``(name, operation)`` pairs in the order they run; delete goes last."""
+    from django.utils import timezone
+
+    def login(target, worker):
+        username = authors[worker % len(authors)][1]
+        return target.request('POST', '/api/login', data={'username': username, 'password': PASSWORD}) == 200
+
+    def post(target, worker):
+        return target.request('POST', '/api/stories', token=tokens[worker % len(tokens)], json_body=STORY) == 201
+
+    def listing(params):
+        def run(target, worker):
+            return target.request('GET', '/api/stories', params=params) in (200, 404)
+        return run
+
+    def delete(target, worker):
+        keys = delete_keys[worker % len(delete_keys)]
+        try:
+            key = keys.pop()
+        except IndexError:
+            return None
+        return target.request('DELETE', f'/api/stories/{key}', token=tokens[worker % len(tokens)]) == 200
+
+    yield 'login', login
+    yield 'post', post
+    week_ago = (timezone.now() - timedelta(days=7)).strftime('%d/%m/%Y')
+    for category, region, date in itertools.product(['*'] + CATEGORIES, ['*'] + REGIONS, ['*', week_ago]):
+        params = {'story_cat': category, 'story_region': region, 'story_date': date}
+        if page_size:
+            params['limit'] = page_size
+        label = 'week' if date != '*' else '*'
+        yield f'list cat={category} reg={region} date={label}', listing(params)
+    yield 'delete', delete
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    with scratch_database() as db_path:
+        import django
+        from django.conf import settings
+        from django.db import connections
+        from cwk1.tokens import issue_token
+        from webcwk1.models import Author, NewsStory
+
+        if not args.cache:
+            settings.STORY_CACHE_ALIAS = None
+        author_ids = seed_authors(args.authors, PASSWORD)
+        seed_stories(args.stories, author_ids, days=args.days, category_weights=args.category_weights,
+                     region_weights=args.region_weights)
+        authors = list(Author.objects.filter(pk__in=author_ids).values_list('pk', 'username'))
+        tokens = [issue_token(author) for author in Author.objects.filter(pk__in=author_ids).order_by('pk')]
+        # One pool of deletable keys per author, in the same order as tokens;
+        # deque.pop() is atomic, so workers sharing an author can share a pool.
+        delete_keys = [deque(NewsStory.objects.filter(author_id=author_id).values_list('pk', flat=True))
+                       for author_id in sorted(author_ids)]
+        connections.close_all()
+
+        results = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'target': args.target,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'args': {key: value for key, value in vars(args).items() if key not in ('func', 'output')},
+            },
+            'results': {},
+        }
+        with tempfile.TemporaryDirectory() as workdir:
+            process = None
+            if args.target == 'client':
+                make_target = ClientTarget
+            else:
+                from benchmarks.bench_asgi_wsgi import start_server
+
+                process, url = start_server(args.target, db_path, workdir, args.cache)
+                make_target = lambda: HttpTarget(url)  # noqa: E731
+            try:
+                for name, operation in scenarios(authors, tokens, delete_keys, args.page_size):
+                    if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                        continue
+                    for concurrency in args.concurrency:
+                        result = drive(make_target, operation, concurrency, args.duration)
+                        results['results'].setdefault(name, {})[str(concurrency)] = result
+                        print(f"{name:<34} c={concurrency:<3} {result.get('rps', 0):9.1f} req/s  "
+                              f"p50={result.get('p50_ms', 0):9.2f}ms  p99={result.get('p99_ms', 0):9.2f}ms  "
+                              f"errors={result['errors']}")
+            finally:
+                if process is not None:
+                    process.terminate()
+                    process.wait()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f'Results written to {args.output}')
+    else:
+        print(output)
+
+
+def regressions(baseline, current, threshold):
+    """``(scenario, concurrency, message)`` for every result worse than ``threshold`` allows."""
+    found = []
+    for name, levels in current['results'].items():
+        for concurrency, result in levels.items():
+            base = baseline['results'].get(name, {}).get(concurrency)
+            if not base or not base.get('requests') or not result.get('requests'):
+                continue
+            if result['p50_ms'] > base['p50_ms'] * (1 + threshold):
+                found.append((name, concurrency, f"p50 {base['p50_ms']:.2f}ms -> {result['p50_ms']:.2f}ms"))
+            if result['rps'] < base['rps'] * (1 - threshold):
+                found.append((name, concurrency, f"throughput {base['rps']:.1f} -> {result['rps']:.1f} req/s"))
+    return found
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    found = regressions(baseline, current, args.threshold)
+    print(f"baseline {baseline['meta'].get('commit')}  current {current['meta'].get('commit')}  "
+          f'threshold {args.threshold:.0%}')
+    for name, concurrency, message in found:
+        print(f'REGRESSION {name} c={concurrency}: {message}')
+    if found:
+        sys.exit(1)
+    print('No regressions.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(required=True)
+
+    run_parser = commands.add_parser('run', help='seed a scratch database and run every scenario')
+    run_parser.add_argument('--authors', type=int, default=50)
+    run_parser.add_argument('--stories', type=int, default=100_000)
+    run_parser.add_argument('--days', type=int, default=365, help='spread story dates over this many days')
+    run_parser.add_argument('--category-weights', type=float, nargs=len(CATEGORIES), metavar='W',
+                            help=f'relative frequency of {", ".join(CATEGORIES)}')
+    run_parser.add_argument('--region-weights', type=float, nargs=len(REGIONS), metavar='W',
+                            help=f'relative frequency of {", ".join(REGIONS)}')
+    run_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    run_parser.add_argument('--duration', type=float, default=5, help='seconds per scenario and concurrency')
+    run_parser.add_argument('--page-size', type=int, default=100, help='listing limit; 0 lists everything')
+    run_parser.add_argument('--target', choices=['client', 'wsgi', 'asgi'], default='client')
+    run_parser.add_argument('--cache', action='store_true', help='leave the story listing cache on')
+    run_parser.add_argument('--only', nargs='+', metavar='PREFIX', help='run only scenarios starting with these')
+    run_parser.add_argument('--output', help='write JSON results here instead of stdout')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help='check results against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='allowed fractional change before it counts as a regression')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
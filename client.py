@@ -1,15 +1,375 @@
 import requests
 import json
+import os
+import queue
+import re
+import shlex
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from urllib3.util import make_headers
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 BASE_URL = "https://newssites.pythonanywhere.com/api/"
+NEWS_PAGE_SIZE = 100
+# Fan-out limits for `news`: agencies queried at once, (connect, read)
+# timeout per request, and the overall deadline in seconds for the command.
+NEWS_MAX_WORKERS = 8
+NEWS_TIMEOUT = (3.05, 10)
+NEWS_DEADLINE = 30
+DIRECTORY_URL = BASE_URL + "directory/"
+# Stories sent per request by `upload`.
+UPLOAD_CHUNK_SIZE = 1000
+# The directory is served from disk for DIRECTORY_TTL seconds, then for up to
+# DIRECTORY_MAX_STALE more while it is revalidated in the background.
+DIRECTORY_TTL = 3600
+DIRECTORY_MAX_STALE = 7 * 24 * 3600
+# Listing pages whose validators and body are kept for conditional GETs;
+# the least recently used is dropped first.
+VALIDATOR_CACHE_PAGES = 16
+# Changes asked for per request by `changes` and `sync`.
+CHANGES_PAGE_SIZE = 500
+# Listings are asked for in the compact formats first (see
+# webcwk1/compact.py); agencies without them ignore this and send JSON.
+COLUMNS_CONTENT_TYPE = "application/vnd.cwk1.columns+json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+LISTING_ACCEPT = (f"{MSGPACK_CONTENT_TYPE}, " if msgpack else "") + \
+    f"{COLUMNS_CONTENT_TYPE};q=0.9, application/json;q=0.8"
+# What a malformed listing body can raise while it is decoded: bad JSON or
+# msgpack, or a document missing the fields decode_listing expects.
+LISTING_DECODE_ERRORS = (ValueError, KeyError, IndexError, TypeError, AttributeError) + \
+    ((msgpack.exceptions.UnpackException,) if msgpack else ())
+# `news` answered from the local mirror warns about agencies last synced
+# longer ago than this, in seconds.
+MIRROR_STALE_AFTER = 15 * 60
+
+
+class AgencyError(Exception):
+    """An agency answered a stories request with a non-200 status."""
+
+
+class DirectoryUnavailable(Exception):
+    """No usable agency directory, e.g. offline with nothing cached yet."""
+
+
+class CursorExpired(Exception):
+    """An agency no longer recognises a saved change feed cursor."""
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "cwk1-client")
+
+
+class DirectoryCache:
+    """On-disk copy of the agency directory shared by `news` and `list`.
+
+    Fresh copies are used as they are. Stale ones are still returned, and a
+    background thread revalidates them with If-None-Match/If-Modified-Since.
+    Past DIRECTORY_MAX_STALE the directory is fetched before answering, and
+    the stale copy is only a fallback if that fails.
+    """
+
+    def __init__(self, path=None, ttl=DIRECTORY_TTL, max_stale=DIRECTORY_MAX_STALE):
+        self.path = path or os.path.join(default_cache_dir(), "directory.json")
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._refresh_lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, entry):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self.path)
+
+    def fetch(self, cached=None):
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        response = requests.get(DIRECTORY_URL, headers=headers, timeout=NEWS_TIMEOUT)
+        if response.status_code == 304 and cached:
+            entry = dict(cached, fetched_at=time.time())
+        else:
+            response.raise_for_status()
+            entry = {
+                "fetched_at": time.time(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "agencies": response.json(),
+            }
+        self.save(entry)
+        return entry
+
+    def refresh_in_background(self, cached):
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        def refresh():
+            try:
+                self.fetch(cached)
+            except (requests.RequestException, OSError, ValueError):
+                pass
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get(self, offline=False):
+        cached = self.load()
+        if offline:
+            if cached is None:
+                raise DirectoryUnavailable("no cached agency directory; run `list` once while online")
+            return cached["agencies"]
+
+        age = time.time() - cached["fetched_at"] if cached else None
+        if cached and age < self.ttl:
+            return cached["agencies"]
+        if cached and age < self.ttl + self.max_stale:
+            self.refresh_in_background(cached)
+            return cached["agencies"]
+        try:
+            return self.fetch(cached)["agencies"]
+        except requests.RequestException:
+            if cached:
+                return cached["agencies"]
+            raise
+
+
+class FeedCursors:
+    """Per-agency change feed cursors, kept on disk between runs.
+
+    Maps agency code to the `next` cursor from that agency's last
+    /api/stories/changes response, so `changes` only shows what is new.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(default_cache_dir(), "feed-cursors.json")
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, agency_code):
+        return self.load().get(agency_code)
+
+    def set(self, agency_code, cursor):
+        with self._lock:
+            cursors = self.load()
+            if cursor is None:
+                cursors.pop(agency_code, None)
+            else:
+                cursors[agency_code] = cursor
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cursors, f)
+            os.replace(tmp_path, self.path)
+
+
+STORY_FIELDS = ("key", "headline", "story_cat", "story_region", "author", "story_date", "story_details")
+
+
+def stories_from_columns(columns):
+    # Turns a compact listing's columns back into the usual story dicts.
+    # Dictionary-encoded columns come as {"values": [...], "codes": [...]}.
+    def expand(column):
+        if isinstance(column, dict):
+            values = column["values"]
+            return [values[code] for code in column["codes"]]
+        return column
+
+    keys = [str(key) for key in columns["key"]]
+    return [dict(zip(STORY_FIELDS, story))
+            for story in zip(keys, *(expand(columns[field]) for field in STORY_FIELDS[1:]))]
+
+
+def decode_listing(response):
+    # A listing body in whichever format the agency chose, as
+    # {"stories": [...], "next": ...} like the JSON one.
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+    if content_type == MSGPACK_CONTENT_TYPE and msgpack:
+        document = msgpack.unpackb(response.content)
+    elif content_type == COLUMNS_CONTENT_TYPE:
+        document = response.json()
+    else:
+        return response.json()
+    body = {"stories": stories_from_columns(document["columns"])}
+    if "next" in document:
+        body["next"] = document["next"]
+    return body
+
+
+def search_tokens(text):
+    # Words as the agencies' FTS5 index (unicode61 tokenizer) sees them:
+    # runs of letters and digits, case- and accent-folded, so "cafe"
+    # matches "Café" here as it does on the server.
+    decomposed = unicodedata.normalize("NFKD", text)
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    return re.findall(r"[^\W_]+", folded)
+
+
+def contains_phrase(tokens, phrase):
+    return any(tokens[i:i + len(phrase)] == phrase for i in range(len(tokens) - len(phrase) + 1))
+
+
+def normalise_story_date(value):
+    # Stored as YYYY-MM-DD where possible so `-date` is a string comparison
+    # on an index. Agencies send either that or a full ISO timestamp.
+    value = str(value or "")
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(value[:10], fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return value
+
+
+class StoryMirror:
+    """Local SQLite copy of every synced agency's stories, for `news` and `sync`.
+
+    Stories are keyed by (agency_code, key) and indexed on the `news`
+    filters, so listing them takes no network at all. Agencies with the
+    /api/stories/changes feed are synced incrementally from the cursor kept
+    here; the rest are re-read in full, and stories missing from the new
+    copy are dropped.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS stories (
+            agency_code TEXT NOT NULL,
+            key TEXT NOT NULL,
+            headline TEXT,
+            category TEXT,
+            region TEXT,
+            author TEXT,
+            story_date TEXT,
+            details TEXT,
+            sync_run TEXT,
+            PRIMARY KEY (agency_code, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS stories_cat_reg_date ON stories (category, region, story_date);
+        CREATE INDEX IF NOT EXISTS stories_reg_date ON stories (region, story_date);
+        CREATE INDEX IF NOT EXISTS stories_date ON stories (story_date);
+        CREATE TABLE IF NOT EXISTS agencies (
+            agency_code TEXT PRIMARY KEY,
+            cursor TEXT,
+            synced_at REAL
+        );
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(default_cache_dir(), "stories.sqlite3")
+        self._local = threading.local()
+
+    def connection(self):
+        # One connection per thread, since `sync` applies agencies in parallel.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def cursor(self, agency_code):
+        row = self.connection().execute("SELECT cursor FROM agencies WHERE agency_code = ?",
+                                        (agency_code,)).fetchone()
+        return row[0] if row else None
+
+    def status(self):
+        """agency_code -> (synced_at, stories) for every agency synced so far."""
+        counts = dict(self.connection().execute(
+            "SELECT agency_code, COUNT(*) FROM stories GROUP BY agency_code"))
+        return {code: (synced_at, counts.get(code, 0))
+                for code, synced_at in self.connection().execute("SELECT agency_code, synced_at FROM agencies")}
+
+    def apply(self, agency_code, stories, deleted, cursor, run):
+        # One transaction per page, cursor included, so an interrupted sync
+        # resumes from the last page applied.
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO stories VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(agency_code, str(story.get("key")), story.get("headline"), story.get("story_cat"),
+                  story.get("story_region"), story.get("author"), normalise_story_date(story.get("story_date")),
+                  story.get("story_details"), run) for story in stories])
+            conn.executemany("DELETE FROM stories WHERE agency_code = ? AND key = ?",
+                             [(agency_code, str(key)) for key in deleted])
+            conn.execute("INSERT OR REPLACE INTO agencies VALUES (?, ?, ?)", (agency_code, cursor, time.time()))
+
+    def drop_unseen(self, agency_code, run):
+        """After a full re-read, delete the agency's stories it didn't send; returns how many."""
+        conn = self.connection()
+        with conn:
+            return conn.execute("DELETE FROM stories WHERE agency_code = ? AND sync_run IS NOT ?",
+                                (agency_code, run)).rowcount
+
+    def query(self, agency_codes, category="*", region="*", date="*"):
+        """Stories from these agencies matching the `news` filters, newest first, as story dicts."""
+        if not agency_codes:
+            return []
+        sql = ["SELECT key, headline, category, region, author, story_date, details FROM stories",
+               f"WHERE agency_code IN ({', '.join('?' * len(agency_codes))})"]
+        params = list(agency_codes)
+        if category != "*":
+            sql.append("AND category = ?")
+            params.append(category)
+        if region != "*":
+            sql.append("AND region = ?")
+            params.append(region)
+        if date != "*":
+            sql.append("AND story_date >= ?")
+            params.append(datetime.strptime(date, "%d/%m/%Y").strftime("%Y-%m-%d"))
+        sql.append("ORDER BY story_date DESC, agency_code, key")
+        fields = ("key", "headline", "story_cat", "story_region", "author", "story_date", "story_details")
+        return [dict(zip(fields, row)) for row in self.connection().execute(" ".join(sql), params)]
 
 
 class Client:
     def __init__(self):
         self.session = requests.Session()
+        # Advertise every encoding urllib3 can decode here: gzip and deflate
+        # always, br with brotli installed, and zstd on Python 3.14 or with
+        # backports.zstd. requests decodes the bodies transparently.
+        self.session.headers["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
         self.logged_in = False
         self.news_service_url = None
+        # (url, params) -> validators and body of the last 200 for that page,
+        # so unchanged pages come back as a 304 with nothing to download.
+        # Holds at most VALIDATOR_CACHE_PAGES pages; agencies are fetched
+        # from several threads at once.
+        self.validators = OrderedDict()
+        self._validators_lock = threading.Lock()
+        self.directory = DirectoryCache()
+        self.feed_cursors = FeedCursors()
+        self.mirror = StoryMirror()
+        self.auth_token = None
 
     def login(self, command):
         try:
@@ -17,6 +377,9 @@ class Client:
         except:
             print("Invalid URL provided.")
             return
+        # `login <url> --token` asks for a stateless bearer token instead of a
+        # session cookie, which saves the server a session read per request.
+        use_token = "--token" in command.split()[2:]
         if url == "local":
             url = "http://localhost:8000/"
         if not url or not isinstance(url, str) or "http" not in url:
@@ -34,21 +397,31 @@ class Client:
             "username": username,
             "password": password
         }
+        if use_token:
+            payload["token"] = "1"
         try:
             response = self.session.post(self.news_service_url + "api/login", data=payload)
             response.raise_for_status()
             self.logged_in = True
             print("Logged in successfully.")
-            print("Session cookies:", self.session.cookies)
+            if use_token:
+                self.auth_token = response.json()["token"]
+            else:
+                print("Session cookies:", self.session.cookies)
         except requests.RequestException as e:
             print("Failed to log in:", str(e))
 
     def logout(self):
         if self.logged_in:
             self.logged_in = False
+            self.auth_token = None
             self.session.close()
             print("Logged out successfully.")
 
+    def auth_headers(self):
+        # Only ever sent to our own news service, never to other agencies.
+        return {"Authorization": f"Bearer {self.auth_token}"} if self.auth_token else {}
+
     def input_with_prompt(self, prompt):
         user_input = input(prompt)
         while not user_input.strip():
@@ -91,7 +464,7 @@ class Client:
             response_url = self.news_service_url + "api/stories"
             print(response_url)
             print(payload)
-            response = self.session.post(response_url, json=payload)
+            response = self.session.post(response_url, json=payload, headers=self.auth_headers())
             response.raise_for_status()
             print("Story posted successfully.")
         except requests.RequestException as e:
@@ -104,14 +477,26 @@ class Client:
 
         valid_categories = {'pol', 'art', 'tech', 'trivia'}
         valid_regions = {'uk', 'eu', 'w'}
-        params_dict = {"id": "*", "cat": "*", "reg": "*", "date": "*"}
+        params_dict = {"id": "*", "cat": "*", "reg": "*", "date": "*", "q": "*"}
+        offline = False
+        live = False
 
-        words = command.split()
+        try:
+            words = shlex.split(command)
+        except ValueError:
+            print("Error in parameter formatting. Use -key=value format.")
+            return
         if len(words) > 1:
             params = words[1:]
             for param in params:
+                if param == "--offline":
+                    offline = True
+                    continue
+                if param == "--live":
+                    live = True
+                    continue
                 try:
-                    key, value = param.split("=")
+                    key, value = param.split("=", 1)
                     key = key.strip("-")
                     if key in params_dict:
                         if key == "cat" and value not in valid_categories:
@@ -135,39 +520,401 @@ class Client:
                     print("Error in parameter formatting. Use -key=value format.")
                     return
 
-        url = "https://newssites.pythonanywhere.com/api/directory/"
-        # url = "http://127.0.0.1:8000/"
-        response = self.session.get(url)
-        if response.status_code != 200:
-            print("Failed to fetch agencies directory.")
+        try:
+            agencies = self.directory.get(offline=offline)
+        except (requests.RequestException, DirectoryUnavailable) as e:
+            print("Failed to fetch agencies directory:", str(e))
             return
 
-        agencies = response.json()
         agencies_list = {agency['agency_code']: agency for agency in agencies}
 
-        all_stories = []
-        for code, agency in agencies_list.items():
-            try:
-                if params_dict['id'] != "*" and params_dict['id'] != code:
+        selected = [agency for code, agency in agencies_list.items()
+                    if params_dict['id'] == "*" or params_dict['id'] == code]
+        # Agencies in the local mirror are answered from it; the rest (or
+        # all of them with --live) are fetched as before, unless --offline.
+        if offline or not live:
+            synced = self.mirror.status()
+            self.print_local_news([code for code in agencies_list if code in synced and
+                                   params_dict['id'] in ("*", code)], params_dict, synced)
+            selected = [agency for agency in selected if agency['agency_code'] not in synced]
+        if offline:
+            if selected:
+                print(f"Not mirrored, skipped offline: {', '.join(agency['agency_code'] for agency in selected)}")
+            return
+        for agency, stories, error in self.fetch_news_concurrently(selected, params_dict):
+            if error:
+                print(error)
+                continue
+            for story in stories:
+                if params_dict['q'] != "*" and not self.matches_search(story, params_dict['q']):
                     continue
+                self.print_story_details(story)
 
-                # agency_url = "http://localhost:8000/api/stories"
-                agency_url = f"{agency['url'].rstrip('/')}/api/stories"
-                stories_response = self.session.get(agency_url, params={
-                    "story_cat": params_dict['cat'] if params_dict['cat'] != "*" else "*",
-                    "story_region": params_dict['reg'] if params_dict['reg'] != "*" else "*",
-                    "story_date": params_dict['date'] if params_dict['date'] != "*" else "*",
-                })
-
-                if stories_response.status_code == 200:
-                    stories = stories_response.json().get('stories', [])
-                    all_stories.extend(stories)
-                    for story in stories:
-                        self.print_story_details(story)
-                else:
-                    print(f"Error retrieving stories from {agency['url']}: HTTP {stories_response.status_code} ")
+    def print_local_news(self, codes, params_dict, synced):
+        if not codes:
+            return
+        for story in self.mirror.query(codes, params_dict['cat'], params_dict['reg'], params_dict['date']):
+            if params_dict['q'] != "*" and not self.matches_search(story, params_dict['q']):
+                continue
+            self.print_story_details(story)
+        now = time.time()
+        stale = [code for code in codes if now - synced[code][0] > MIRROR_STALE_AFTER]
+        for code in stale:
+            print(f"Note: stories from {code} are from the local mirror, synced "
+                  f"{self.describe_age(synced[code][0])}; run `sync` to update them.")
+
+    def matches_search(self, story, text):
+        # Agencies without search support ignore `q` and return everything,
+        # so results are also checked here. Like the server's FTS5 query,
+        # every word must appear as a whole word in the headline or details.
+        fields = [search_tokens(story.get("headline") or ""), search_tokens(story.get("story_details") or "")]
+        phrases = [phrase for phrase in map(search_tokens, text.split()) if phrase]
+        return all(any(contains_phrase(tokens, phrase) for tokens in fields) for phrase in phrases)
+
+    def fetch_news_concurrently(self, agencies, params_dict):
+        # Queries up to NEWS_MAX_WORKERS agencies at once and yields
+        # (agency, stories, error) page by page in arrival order, so the
+        # command takes as long as the slowest agency rather than the sum of
+        # them all. The bounded queue keeps fast agencies from piling up pages
+        # faster than they are printed, and anything still running at
+        # NEWS_DEADLINE is abandoned.
+        results = queue.Queue(maxsize=NEWS_MAX_WORKERS * 2)
+        stop = threading.Event()
+
+        def deliver(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker(agency):
+            error = None
+            try:
+                for stories in self.iter_agency_pages(agency, params_dict):
+                    if not deliver((agency, stories, None)):
+                        return
+            except AgencyError as e:
+                error = f"Error retrieving stories from {agency['url']}: HTTP {e} "
             except requests.RequestException as e:
-                print(f"Failed to fetch stories from {agency['url']}: {str(e)}")
+                error = f"Failed to fetch stories from {agency['url']}: {str(e)}"
+            except LISTING_DECODE_ERRORS as e:
+                error = f"Could not read stories from {agency['url']}: {type(e).__name__}: {e}"
+            deliver((agency, None, error))
+
+        pending = {id(agency): agency for agency in agencies}
+        if not pending:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(NEWS_MAX_WORKERS, len(pending)))
+        for agency in agencies:
+            executor.submit(worker, agency)
+        deadline = time.monotonic() + NEWS_DEADLINE
+        try:
+            while pending:
+                try:
+                    agency, stories, error = results.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if stories is None:
+                    del pending[id(agency)]
+                    if error:
+                        yield agency, None, error
+                else:
+                    yield agency, stories, None
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+        for agency in pending.values():
+            yield agency, None, f"Gave up on {agency['url']} after {NEWS_DEADLINE}s."
+
+    def iter_agency_pages(self, agency, params_dict):
+        # Follows the agency's `next` cursor one page at a time so only a single
+        # page is ever held in memory. Agencies without pagination ignore
+        # `limit`, send no cursor, and so are read in one go as before.
+        # agency_url = "http://localhost:8000/api/stories"
+        agency_url = f"{agency['url'].rstrip('/')}/api/stories"
+        params = {
+            "story_cat": params_dict['cat'],
+            "story_region": params_dict['reg'],
+            "story_date": params_dict['date'],
+            "limit": NEWS_PAGE_SIZE,
+        }
+        if params_dict.get('q', "*") != "*":
+            params["q"] = params_dict['q']
+        while True:
+            status_code, body = self.conditional_get(agency_url, params)
+            if status_code != 200:
+                raise AgencyError(status_code)
+            yield body.get('stories', [])
+            next_cursor = body.get('next')
+            if not next_cursor:
+                return
+            params["cursor"] = next_cursor
+
+    def get_changes(self, command):
+        # `changes [-id=CODE] [--reset]` prints the stories added, updated or
+        # deleted at each agency since the last run, from the cursor saved
+        # per agency. --reset forgets the cursors and starts from the
+        # beginning of each agency's change log.
+        words = command.split()[1:]
+        reset = "--reset" in words
+        agency_id = "*"
+        for word in words:
+            if word.startswith("-id=") or word.startswith("--id="):
+                agency_id = word.split("=", 1)[1]
+            elif word != "--reset":
+                print(f"Invalid parameter: {word}")
+                return
+        try:
+            agencies = self.directory.get()
+        except (requests.RequestException, DirectoryUnavailable) as e:
+            print("Failed to fetch agencies directory:", str(e))
+            return
+
+        for agency in agencies:
+            code = agency.get("agency_code")
+            if agency_id != "*" and agency_id != code:
+                continue
+            if reset:
+                self.feed_cursors.set(code, None)
+            try:
+                try:
+                    self.print_changes(agency, self.feed_cursors.get(code))
+                except CursorExpired:
+                    print(f"{code}: saved cursor not recognised, starting again from the beginning.")
+                    self.feed_cursors.set(code, None)
+                    self.print_changes(agency, None)
+            except AgencyError as e:
+                print(f"No change feed from {agency['url']}: HTTP {e}")
+            except (requests.RequestException, ValueError, KeyError) as e:
+                print(f"Failed to fetch changes from {agency['url']}: {str(e)}")
+
+    def print_changes(self, agency, since):
+        # Saves the cursor after each page is printed, so an interrupted run
+        # resumes where it stopped.
+        code = agency.get("agency_code")
+        for body in self.iter_agency_changes(agency, since):
+            for story in body["stories"]:
+                self.print_story_details(story)
+            for key in body["deleted"]:
+                print(f"Deleted: {key} ({code})")
+                print("-" * 30)
+            self.feed_cursors.set(code, body["next"])
+
+    def iter_agency_changes(self, agency, since=None):
+        # Yields change feed pages from `since` on. A 400 means the agency
+        # doesn't recognise the cursor (e.g. its database was replaced), and
+        # the caller has to start again from the beginning.
+        url = f"{agency['url'].rstrip('/')}/api/stories/changes"
+        while True:
+            params = {"limit": CHANGES_PAGE_SIZE}
+            if since is not None:
+                params["since"] = since
+            response = self.session.get(url, params=params, timeout=NEWS_TIMEOUT)
+            if response.status_code == 400 and since is not None:
+                raise CursorExpired(since)
+            if response.status_code != 200:
+                raise AgencyError(response.status_code)
+            body = response.json()
+            yield body
+            if not body.get("more"):
+                return
+            since = body["next"]
+
+    def sync(self, command):
+        # `sync [-id=CODE]` brings the local mirror up to date with every
+        # agency (or one), NEWS_MAX_WORKERS at a time; `sync --status` shows
+        # when each was last synced.
+        words = command.split()[1:]
+        if "--status" in words:
+            self.print_sync_status()
+            return
+        agency_id = "*"
+        for word in words:
+            if word.startswith("-id=") or word.startswith("--id="):
+                agency_id = word.split("=", 1)[1]
+            else:
+                print(f"Invalid parameter: {word}")
+                return
+        try:
+            agencies = self.directory.get()
+        except (requests.RequestException, DirectoryUnavailable) as e:
+            print("Failed to fetch agencies directory:", str(e))
+            return
+        selected = [agency for agency in agencies if agency_id in ("*", agency.get("agency_code"))]
+        if not selected:
+            print("No agencies to sync.")
+            return
+
+        def worker(agency):
+            start = time.monotonic()
+            try:
+                return agency, self.sync_agency(agency), time.monotonic() - start, None
+            except AgencyError as e:
+                return agency, None, None, f"HTTP {e}"
+            except (requests.RequestException, sqlite3.Error, ValueError, KeyError) as e:
+                return agency, None, None, str(e)
+
+        with ThreadPoolExecutor(max_workers=min(NEWS_MAX_WORKERS, len(selected))) as executor:
+            for agency, summary, seconds, error in executor.map(worker, selected):
+                if error:
+                    print(f"Failed to sync {agency.get('agency_code')} ({agency['url']}): {error}")
+                else:
+                    print(f"Synced {agency.get('agency_code')} in {seconds:.2f}s: {summary}")
+
+    def sync_agency(self, agency):
+        # Incremental from the saved cursor where the agency has a change
+        # feed; a full re-read otherwise, or when the cursor has expired.
+        code = agency.get("agency_code")
+        since = self.mirror.cursor(code)
+        try:
+            try:
+                return self.sync_from_feed(agency, since)
+            except CursorExpired:
+                return self.sync_from_feed(agency, None)
+        except AgencyError as e:
+            if e.args[0] != 404:
+                raise
+        return self.sync_from_listing(agency)
+
+    def sync_from_feed(self, agency, since):
+        code = agency.get("agency_code")
+        run = uuid.uuid4().hex
+        updated = deleted = 0
+        for body in self.iter_agency_changes(agency, since):
+            self.mirror.apply(code, body["stories"], body["deleted"], body["next"], run)
+            updated += len(body["stories"])
+            deleted += len(body["deleted"])
+        if since is None:
+            deleted += self.mirror.drop_unseen(code, run)
+        return f"{updated} new or updated, {deleted} deleted"
+
+    def sync_from_listing(self, agency):
+        code = agency.get("agency_code")
+        run = uuid.uuid4().hex
+        params_dict = {"cat": "*", "reg": "*", "date": "*"}
+        stories = 0
+        try:
+            for page in self.iter_agency_pages(agency, params_dict):
+                self.mirror.apply(code, page, [], None, run)
+                stories += len(page)
+        except AgencyError as e:
+            # The listing 404s when an agency has no stories at all.
+            if e.args[0] != 404:
+                raise
+            self.mirror.apply(code, [], [], None, run)
+        deleted = self.mirror.drop_unseen(code, run)
+        return f"{stories} stories re-read in full (no change feed), {deleted} deleted"
+
+    def print_sync_status(self):
+        status = self.mirror.status()
+        if not status:
+            print("Nothing synced yet; run `sync` to mirror the agencies locally.")
+            return
+        for code, (synced_at, stories) in sorted(status.items()):
+            print(f"{code}: {stories} stories, synced {self.describe_age(synced_at)}")
+
+    def describe_age(self, timestamp):
+        age = time.time() - timestamp
+        if age < 60:
+            return "just now"
+        if age < 3600:
+            return f"{age // 60:.0f} min ago"
+        if age < 2 * 86400:
+            return f"{age / 3600:.1f} h ago"
+        return f"{age / 86400:.0f} days ago"
+
+    def upload_stories(self, command):
+        if not self.logged_in:
+            print("Please login first.")
+            return
+        try:
+            path = command.split()[1]
+        except IndexError:
+            print("Usage: upload <file.json|file.ndjson>")
+            return
+
+        created = failed = 0
+        try:
+            for offset, chunk in self.iter_upload_chunks(path):
+                response = self.session.post(f"{self.news_service_url}api/stories/batch",
+                                             data="".join(json.dumps(item) + "\n" for item in chunk),
+                                             headers={"Content-Type": "application/x-ndjson", **self.auth_headers()})
+                try:
+                    body = response.json()
+                except ValueError:
+                    body = {}
+                if "results" not in body:
+                    print("Failed to upload stories:", response.text)
+                    break
+                created += body["created"]
+                failed += body["failed"]
+                for result in body["results"]:
+                    if result["status"] == "error":
+                        print(f"Story {offset + result['index']}: {result['error']}")
+        except (OSError, ValueError) as e:
+            print("Failed to read stories:", str(e))
+        except requests.RequestException as e:
+            print("Network error occurred:", str(e))
+        print(f"Uploaded {created} stories, {failed} failed.")
+
+    def iter_upload_chunks(self, path):
+        # Yields (offset, stories) in UPLOAD_CHUNK_SIZE slices. NDJSON files
+        # are read line by line; a JSON array has to be loaded whole.
+        with open(path) as f:
+            first = f.read(1)
+            while first.isspace():
+                first = f.read(1)
+            f.seek(0)
+            if first == "[":
+                items = json.load(f)
+                for offset in range(0, len(items), UPLOAD_CHUNK_SIZE):
+                    yield offset, items[offset:offset + UPLOAD_CHUNK_SIZE]
+                return
+            chunk = []
+            offset = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                chunk.append(json.loads(line))
+                if len(chunk) == UPLOAD_CHUNK_SIZE:
+                    yield offset, chunk
+                    offset += len(chunk)
+                    chunk = []
+            if chunk:
+                yield offset, chunk
+
+    def conditional_get(self, url, params):
+        key = (url, tuple(sorted(params.items())))
+        with self._validators_lock:
+            cached = self.validators.get(key)
+            if cached:
+                self.validators.move_to_end(key)
+        headers = {"Accept": LISTING_ACCEPT}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self.session.get(url, params=params, headers=headers, timeout=NEWS_TIMEOUT)
+        if response.status_code == 304 and cached:
+            return 200, cached["body"]
+        if response.status_code != 200:
+            return response.status_code, None
+
+        body = decode_listing(response)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            with self._validators_lock:
+                self.validators[key] = {"etag": etag, "last_modified": last_modified, "body": body}
+                self.validators.move_to_end(key)
+                while len(self.validators) > VALIDATOR_CACHE_PAGES:
+                    self.validators.popitem(last=False)
+        return 200, body
 
     def print_story_details(self, story):
         # print(story)
@@ -180,11 +927,10 @@ class Client:
         print(f"Details: {story.get('story_details')}")
         print("-" * 30)
 
-    def list_agencies(self):
+    def list_agencies(self, command="list"):
+        offline = "--offline" in command.split()[1:]
         try:
-            response = requests.get(BASE_URL + "directory/")
-            response.raise_for_status()
-            agencies_list = response.json()
+            agencies_list = self.directory.get(offline=offline)
             if agencies_list:
                 for agency in agencies_list:
                     print("Agency Name:", agency.get("agency_name", "N/A"))
@@ -193,21 +939,35 @@ class Client:
                     print()
             else:
                 print("No agencies found.")
-        except requests.RequestException as e:
+        except (requests.RequestException, DirectoryUnavailable) as e:
             print("Failed to list agencies:", str(e))
 
     def delete_story(self, command):
-        story_key = command.split()[1]
+        # `delete <key>` deletes one story; `delete <key> <key> ...` or
+        # `delete [-author=...] [-before=dd/mm/yyyy] [-cat=...]` go through the
+        # bulk endpoint, which deletes in one request however many match.
         if not self.logged_in:
             print("Please login first.")
             return
-
-        if not story_key:
-            print("Invalid story key provided.")
+        try:
+            words = shlex.split(command)[1:]
+        except ValueError:
+            print("Error in parameter formatting. Use -key=value format.")
             return
+        if not words:
+            print("Usage: delete <key> [<key> ...] | delete [-author=name] [-before=dd/mm/yyyy] [-cat=category]")
+            return
+        if any(word.startswith("-") for word in words):
+            self.delete_matching(words)
+        elif len(words) > 1:
+            self.delete_stories({"keys": words})
+        else:
+            self.delete_one_story(words[0])
 
+    def delete_one_story(self, story_key):
         try:
-            response = self.session.delete(f"{self.news_service_url}/api/stories/{story_key}")
+            response = self.session.delete(f"{self.news_service_url}/api/stories/{story_key}",
+                                           headers=self.auth_headers())
             response.raise_for_status()  # Will raise an HTTPError for non-200 responses
             print("Story deleted successfully.")
         except requests.HTTPError:
@@ -215,6 +975,45 @@ class Client:
         except requests.RequestException as e:
             print("Network error occurred:", str(e))
 
+    def delete_matching(self, words):
+        names = {"author": "author", "before": "before", "cat": "category"}
+        spec = {}
+        for word in words:
+            try:
+                key, value = word.split("=", 1)
+            except ValueError:
+                print("Error in parameter formatting. Use -key=value format.")
+                return
+            key = key.strip("-")
+            if key not in names:
+                print(f"Invalid parameter: {key}")
+                return
+            if key == "cat" and value not in {'pol', 'art', 'tech', 'trivia'}:
+                print(f"Invalid category: {value}")
+                return
+            if key == "before":
+                try:
+                    datetime.strptime(value, "%d/%m/%Y")
+                except ValueError:
+                    print("Invalid date format. Use dd/mm/yyyy.")
+                    return
+            spec[names[key]] = value
+        self.delete_stories({"filter": spec})
+
+    def delete_stories(self, body):
+        try:
+            response = self.session.post(f"{self.news_service_url}api/stories/delete", json=body,
+                                         headers=self.auth_headers())
+            response.raise_for_status()
+            result = response.json()
+            print(f"Deleted {result['deleted']} stories.")
+            if result.get("not_found"):
+                print(f"{result['not_found']} keys were not found or are not yours.")
+        except requests.HTTPError:
+            print("Failed to delete stories:", response.text)
+        except requests.RequestException as e:
+            print("Network error occurred:", str(e))
+
     def handle_command(self, command):
         if command.startswith("login"):
             self.login(command)
@@ -224,10 +1023,16 @@ class Client:
             self.post_story()
         elif command.startswith("news"):
             self.get_news(command)
-        elif command == "list":
-            self.list_agencies()
+        elif command.startswith("sync"):
+            self.sync(command)
+        elif command.startswith("changes"):
+            self.get_changes(command)
+        elif command.startswith("list"):
+            self.list_agencies(command)
         elif command.startswith("delete"):
             self.delete_story(command)
+        elif command.startswith("upload"):
+            self.upload_stories(command)
         elif command == "exit":
             return True
         else:
@@ -238,7 +1043,7 @@ class Client:
 def main():
     client = Client()
     while True:
-        command = input("Enter command (login + URL, logout, post, news, list, delete, exit): ")
+        command = input("Enter command (login + URL [--token], logout, post, news [-q=...] [--offline] [--live], changes [-id=...] [--reset], sync [-id=...] [--status], list [--offline], delete + key(s) or filters, upload + file, exit): ")
         if client.handle_command(command):
             break
 
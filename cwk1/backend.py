@@ -1,5 +1,56 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
+
+
+class FailedLoginCache:
+    """Bounded, expiring memory of credentials that recently failed to log in.
+
+    Keys are an HMAC of the username, the stored password hash and the
+    attempted password, so a password change invalidates them and no
+    attempted password is kept in the clear. A username with no account has
+    an empty stored hash, so creating the account invalidates its keys too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def key(self, username, password_hash, password):
+        message = '\0'.join([username or '', password_hash, password or ''])
+        return hmac.new(settings.SECRET_KEY.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).digest()
+
+    def __contains__(self, key):
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, key):
+        with self._lock:
+            self._entries[key] = time.monotonic() + settings.LOGIN_FAILURE_CACHE_TTL
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.LOGIN_FAILURE_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+failed_logins = FailedLoginCache()
+
 
 class AuthorBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
@@ -8,11 +59,26 @@ class AuthorBackend(ModelBackend):
             username = kwargs.get(UserModel.USERNAME_FIELD)
         try:
             user = UserModel._default_manager.get_by_natural_key(username)
+            # Repeating credentials that just failed skips the deliberately
+            # slow hash. check_password re-hashes under the current
+            # PASSWORD_HASH_POLICY on success. A wrong password raises
+            # PermissionDenied so authenticate() doesn't hash it all over
+            # again in the ModelBackend listed after this one.
+            failure = failed_logins.key(user.get_username(), user.password, password)
+            if failure in failed_logins:
+                raise PermissionDenied
             if user.check_password(password):
                 return user
+            failed_logins.add(failure)
+            raise PermissionDenied
         except UserModel.DoesNotExist:
-            return None
-        return None
+            # Hash once, as ModelBackend does, so unknown usernames take as
+            # long as wrong passwords, then remember the failure the same way.
+            failure = failed_logins.key(username, '', password)
+            if failure not in failed_logins:
+                UserModel().set_password(password)
+                failed_logins.add(failure)
+            raise PermissionDenied
 
     def get_user(self, user_id):
         UserModel = get_user_model()
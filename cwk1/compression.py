@@ -0,0 +1,192 @@
+"""Response compression negotiated through ``Accept-Encoding``.
+
+gzip is always available. zstd is offered with Python 3.14's
+``compression.zstd``, ``backports.zstd`` or ``zstandard``, and brotli with
+``brotli`` or ``brotlicffi``.
+``COMPRESSION_LEVELS`` sets the level for each encoding, and its order is
+the server's preference when the client weights several equally.
+Responses smaller than ``COMPRESSION_MIN_SIZE`` go out as they are.
+Streamed responses, sync or async, are compressed chunk by chunk and
+flushed after each chunk, so clients can still read them as they arrive.
+"""
+import sys
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .negotiation import header_weights
+
+try:
+    if sys.version_info >= (3, 14):
+        from compression import zstd
+    else:
+        from backports import zstd
+except ImportError:
+    zstd = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/x-ndjson', 'application/vnd.cwk1.columns+json',
+                      'application/msgpack')
+
+
+class GzipCodec:
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def compressor(self):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return (lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+
+class ZstdCodec:
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        if zstd is not None:
+            return zstd.compress(data, level=self.level)
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def compressor(self):
+        if zstd is not None:
+            compressor = zstd.ZstdCompressor(level=self.level)
+            return (lambda data: compressor.compress(data, zstd.ZstdCompressor.FLUSH_BLOCK)), compressor.flush
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return ((lambda data: compressor.compress(data) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)),
+                compressor.flush)
+
+
+class BrotliCodec:
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def compressor(self):
+        compressor = brotli.Compressor(quality=self.level)
+        return (lambda data: compressor.process(data) + compressor.flush()), compressor.finish
+
+
+CODECS = {'gzip': GzipCodec}
+if zstd is not None or zstandard is not None:
+    CODECS['zstd'] = ZstdCodec
+if brotli is not None:
+    CODECS['br'] = BrotliCodec
+
+
+def available_codecs(levels=None):
+    """``{encoding: codec}`` for each configured encoding that is installed, in preference order."""
+    levels = settings.COMPRESSION_LEVELS if levels is None else levels
+    return {encoding: CODECS[encoding](level) for encoding, level in levels.items() if encoding in CODECS}
+
+
+def choose_encoding(accept_encoding, codecs):
+    """The encoding from ``codecs`` the client weights highest, or ``None``.
+
+    ``*`` covers encodings not named; ``q=0`` rules an encoding out. Ties go
+    to the earlier of ``codecs``.
+    """
+    weights = header_weights(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in codecs:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """Compress responses for clients that accept it.
+
+    Goes straight after ``RequestMetricsMiddleware``, so the metrics count
+    the bytes actually sent.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.codecs = available_codecs()
+        self.min_size = settings.COMPRESSION_MIN_SIZE
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or not self.codecs:
+            return response
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), self.codecs)
+        if encoding is None:
+            return response
+        codec = self.codecs[encoding]
+
+        if response.streaming:
+            compress, finish = codec.compressor()
+            if response.is_async:
+                response.streaming_content = self.aiter_compressed(response.streaming_content, compress, finish)
+            else:
+                response.streaming_content = self.iter_compressed(response.streaming_content, compress, finish)
+            del response.headers['Content-Length']
+        else:
+            compressed = codec.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The compressed body differs byte for byte from the plain one, so
+        # only a weak validator still describes both; If-None-Match compares
+        # weakly, so pollers keep getting 304s.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def iter_compressed(content, compress, finish):
+        for chunk in content:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+
+    @staticmethod
+    async def aiter_compressed(content, compress, finish):
+        async for chunk in content:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
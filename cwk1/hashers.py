@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+# Dotted paths of the hasher each PASSWORD_HASH_POLICY prefers. The others
+# stay installed so hashes made under another policy still verify and are
+# upgraded to the preferred one on the next successful login.
+POLICY_HASHERS = {
+    'pbkdf2': 'cwk1.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'cwk1.hashers.ScryptPasswordHasher',
+    'argon2': 'cwk1.hashers.Argon2PasswordHasher',
+}
+
+
+def password_hashers(policy):
+    """``PASSWORD_HASHERS`` for ``policy``, preferred hasher first."""
+    preferred = POLICY_HASHERS[policy]
+    return [preferred] + [path for path in POLICY_HASHERS.values() if path != preferred] + [
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    ]
+
+
+def _cost(name, default):
+    return getattr(settings, 'PASSWORD_HASH_COST', {}).get(name, default)
+
+
+# The cost parameters are read from settings on every use, so changing
+# PASSWORD_HASH_COST marks existing hashes for must_update and they are
+# re-hashed transparently the next time their owner logs in.
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return _cost('pbkdf2_iterations', hashers.PBKDF2PasswordHasher.iterations)
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return _cost('scrypt_work_factor', hashers.ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return _cost('scrypt_block_size', hashers.ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return _cost('scrypt_parallelism', hashers.ScryptPasswordHasher.parallelism)
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Needs the optional ``argon2-cffi`` package, like Django's own."""
+
+    @property
+    def time_cost(self):
+        return _cost('argon2_time_cost', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return _cost('argon2_memory_cost', hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return _cost('argon2_parallelism', hashers.Argon2PasswordHasher.parallelism)
@@ -0,0 +1,196 @@
+"""Per-view request metrics, collected by ``RequestMetricsMiddleware``.
+
+Every request is recorded against its URL name in fixed-bucket histograms
+of latency, database query count, database time and response size, plus a
+request counter by status. ``request_metrics.render()`` formats them in the
+Prometheus text format for ``/api/metrics``. Figures are per process; each
+worker is scraped (or summed) separately.
+
+With ``SLOW_REQUEST_SECONDS`` set, requests slower than that are logged to
+``cwk1.metrics`` along with every SQL statement they ran.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# (metric name, help, buckets), in the order of RequestMetrics.observe()'s
+# arguments.
+HISTOGRAMS = (
+    ('cwk1_request_duration_seconds', 'Time to produce the whole response.', LATENCY_BUCKETS),
+    ('cwk1_request_db_queries', 'Database queries run per request.', QUERY_COUNT_BUCKETS),
+    ('cwk1_request_db_seconds', 'Time spent in database queries per request.', LATENCY_BUCKETS),
+    ('cwk1_response_size_bytes', 'Response body size.', SIZE_BUCKETS),
+)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; cumulated only when rendered.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.statuses = {}
+
+    def observe(self, view, status, seconds, queries, query_seconds, size):
+        """Record one request. ``queries`` and ``query_seconds`` are ``None`` if unknown."""
+        with self.lock:
+            histograms = self.views.get(view)
+            if histograms is None:
+                histograms = self.views[view] = [Histogram(buckets) for _, _, buckets in HISTOGRAMS]
+            histograms[0].observe(seconds)
+            if queries is not None:
+                histograms[1].observe(queries)
+                histograms[2].observe(query_seconds)
+            histograms[3].observe(size)
+            self.statuses[view, status] = self.statuses.get((view, status), 0) + 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            lines = ['# HELP cwk1_requests_total Requests handled, by view and status.',
+                     '# TYPE cwk1_requests_total counter']
+            for (view, status), count in sorted(self.statuses.items()):
+                lines.append(f'cwk1_requests_total{{view="{view}",status="{status}"}} {count}')
+            for index, (name, help_text, _) in enumerate(HISTOGRAMS):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for view, histograms in sorted(self.views.items()):
+                    if histograms[index].count:
+                        lines += histograms[index].render(name, f'view="{view}"')
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+class QueryRecorder:
+    """``execute_wrapper`` counting and timing queries, and keeping the SQL if asked."""
+
+    __slots__ = ('count', 'seconds', 'statements')
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = [] if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if self.statements is not None:
+                self.statements.append((elapsed, sql))
+
+
+class RequestMetricsMiddleware:
+    """Record every request in ``request_metrics``. Goes first in ``MIDDLEWARE``.
+
+    Streamed responses are recorded when the stream ends, so their latency,
+    queries and size cover the whole body. In async middleware chains the
+    view's queries run on other threads and aren't counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_seconds = getattr(settings, 'SLOW_REQUEST_SECONDS', None)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        recorder = QueryRecorder(keep_sql=self.slow_seconds is not None)
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.iter_recorded(response.streaming_content, request, response, start,
+                                                            recorder)
+        else:
+            self.record(request, response, start, recorder, self.body_size(response))
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        if response.streaming and response.is_async:
+            response.streaming_content = self.aiter_recorded(response.streaming_content, request, response, start)
+        else:
+            self.record(request, response, start, None, self.body_size(response))
+        return response
+
+    def iter_recorded(self, content, request, response, start, recorder):
+        size = 0
+        with connection.execute_wrapper(recorder):
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        self.record(request, response, start, recorder, size)
+
+    async def aiter_recorded(self, content, request, response, start):
+        size = 0
+        async for chunk in content:
+            size += len(chunk)
+            yield chunk
+        self.record(request, response, start, None, size)
+
+    def body_size(self, response):
+        return 0 if response.streaming else len(response.content)
+
+    def record(self, request, response, start, recorder, size):
+        seconds = time.perf_counter() - start
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        queries = recorder.count if recorder else None
+        query_seconds = recorder.seconds if recorder else None
+        request_metrics.observe(view, response.status_code, seconds, queries, query_seconds, size)
+        if self.slow_seconds is not None and seconds >= self.slow_seconds:
+            statements = recorder.statements if recorder else []
+            logger.warning('Slow request: %s %s took %.3fs (%s queries, %.3fs in the database)\n%s',
+                           request.method, request.get_full_path(), seconds, queries,
+                           query_seconds or 0, '\n'.join(f'  [{elapsed * 1000:.1f}ms] {sql}'
+                                                         for elapsed, sql in statements))
@@ -0,0 +1,24 @@
+"""Parsing of the weighted lists in ``Accept`` and ``Accept-Encoding``."""
+
+
+def header_weights(value):
+    """``{name: q}`` for each entry of a weighted header, names lowercased.
+
+    Entries without ``q`` weigh 1; an unparseable ``q`` weighs 0, which rules
+    the entry out.
+    """
+    weights = {}
+    for item in value.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, param_value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(param_value)
+                except ValueError:
+                    q = 0.0
+        name = name.strip().lower()
+        if name:
+            weights[name] = q
+    return weights
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 
+from .hashers import password_hashers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,15 +45,28 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'cwk1.metrics.RequestMetricsMiddleware',
+    'cwk1.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'cwk1.tokens.BearerTokenMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Requests slower than this many seconds are logged to cwk1.metrics with the
+# SQL they ran (see cwk1.metrics). None turns the slow-request log off.
+SLOW_REQUEST_SECONDS = None
+
+# Response compression (see cwk1.compression): level per encoding, in order
+# of preference, and the smallest body worth compressing. zstd and br are
+# used only when their packages are installed.
+COMPRESSION_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+COMPRESSION_MIN_SIZE = 1024
+
 ROOT_URLCONF = 'cwk1.urls'
 
 TEMPLATES = [
@@ -72,6 +87,24 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'cwk1.wsgi.application'
 
+# Serve the story list/post/delete endpoints from webcwk1.async_views. Only
+# worth turning on under an ASGI server (cwk1.asgi); under WSGI every async
+# view is run through a per-request event loop.
+STORIES_ASYNC_VIEWS = False
+
+# Answer POST /api/stories with 202 and commit posted stories in batches from
+# a background thread (see webcwk1.writebehind). DURABILITY is 'memory',
+# 'journal' or 'fsync'. Each worker process locks a journal of its own: the
+# first takes JOURNAL, the others story-queue.1.jsonl, .2 and so on beside it,
+# and after a restart each replays the tail of the one it takes. Posts beyond
+# MAX_PENDING queued stories are refused with 429.
+STORY_WRITE_BEHIND = False
+STORY_WRITE_BEHIND_DURABILITY = 'journal'
+STORY_WRITE_BEHIND_JOURNAL = BASE_DIR / 'story-queue.jsonl'
+STORY_WRITE_BEHIND_MAX_PENDING = 10000
+STORY_WRITE_BEHIND_BATCH_SIZE = 500
+STORY_WRITE_BEHIND_INTERVAL = 0.05  # seconds to wait for a batch to fill
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -83,6 +116,62 @@ DATABASES = {
     }
 }
 
+# Opt-in tuning for serving concurrent readers and writers from SQLite,
+# applied to each new connection by cwk1.sqlite.configure_connection. WAL lets
+# readers carry on while a story is being written; journal_mode is stored in
+# the database file, so it stays WAL after the profile is turned off again.
+SQLITE_PRODUCTION_PROFILE = False
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -65536,  # negative means KiB: 64 MiB per connection
+    'mmap_size': 268435456,
+    'busy_timeout': 5000,  # ms
+    'temp_store': 'MEMORY',
+}
+
+# Replaces CONN_MAX_AGE while the profile is on (seconds, None = forever).
+SQLITE_CONN_MAX_AGE = 600
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# 'stories' holds serialised GET /api/stories bodies. Point it at any other
+# backend (memcached, redis, ...) to share it between processes, or set
+# STORY_CACHE_ALIAS = None to turn listing caching off.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'stories': {
+        'BACKEND': 'webcwk1.cache.CountingLocMemCache',
+        'LOCATION': 'stories',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+STORY_CACHE_ALIAS = 'stories'
+
+
+# Story retention
+# Days to keep stories per (category, region), enforced by
+# `manage.py prune_stories` (run it from cron). '*' matches anything, the most
+# specific rule wins, None keeps stories forever, and stories no rule covers
+# are kept.
+STORY_RETENTION = {
+    ('trivia', '*'): 30,
+    ('pol', '*'): None,
+}
+# Days of change log (GET /api/stories/changes) kept in full. prune_stories
+# trims older entries down to the latest one per story; mirrors with a
+# cursor older than that start over from the beginning.
+STORY_CHANGE_RETENTION_DAYS = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -103,6 +192,32 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# https://docs.djangoproject.com/en/3.2/topics/auth/passwords/
+
+# 'pbkdf2', 'scrypt' or 'argon2' (the latter needs argon2-cffi). Switching
+# policy or cost re-hashes each author's password on their next login.
+PASSWORD_HASH_POLICY = 'pbkdf2'
+
+# Keys left out fall back to Django's defaults for that hasher, e.g.
+# 'pbkdf2_iterations'.
+PASSWORD_HASH_COST = {
+    'scrypt_work_factor': 2 ** 14,
+    'scrypt_block_size': 8,
+    'scrypt_parallelism': 1,
+    'argon2_time_cost': 2,
+    'argon2_memory_cost': 65536,
+    'argon2_parallelism': 1,
+}
+
+PASSWORD_HASHERS = password_hashers(PASSWORD_HASH_POLICY)
+
+# Recently failed (username, password) pairs are remembered for this many
+# seconds, up to this many entries, and rejected again without hashing.
+LOGIN_FAILURE_CACHE_TTL = 300
+LOGIN_FAILURE_CACHE_SIZE = 4096
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -134,3 +249,9 @@ AUTHENTICATION_BACKENDS = [
 
 AUTH_USER_MODEL = 'webcwk1.Author'
 
+# Stateless bearer tokens issued by /api/login (see cwk1/tokens.py): lifetime
+# in seconds, and how long / how many resolved authors are cached in-process.
+AUTH_TOKEN_MAX_AGE = 12 * 3600
+AUTH_TOKEN_USER_CACHE_TTL = 60
+AUTH_TOKEN_USER_CACHE_SIZE = 1024
+
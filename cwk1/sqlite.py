@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+
+
+def production_pragmas():
+    """PRAGMA statements for the SQLite production profile, in order."""
+    return [f'PRAGMA {name} = {value}' for name, value in settings.SQLITE_PRAGMAS.items()]
+
+
+def configure_connection(sender, connection, **kwargs):
+    """``connection_created`` receiver applying ``SQLITE_PRODUCTION_PROFILE``.
+
+    Sets the pragmas on every new SQLite connection and keeps it open for
+    ``SQLITE_CONN_MAX_AGE`` seconds, so requests reuse a warm page cache and
+    mmap instead of reconnecting. A no-op for other vendors or with the
+    profile off.
+    """
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRODUCTION_PROFILE:
+        return
+    with connection.cursor() as cursor:
+        for statement in production_pragmas():
+            cursor.execute(statement)
+    # connect() has already derived close_at from CONN_MAX_AGE, so update
+    # both: close_at for this connection, the settings for the next ones.
+    max_age = settings.SQLITE_CONN_MAX_AGE
+    connection.settings_dict['CONN_MAX_AGE'] = max_age
+    connection.close_at = None if max_age is None else time.monotonic() + max_age
@@ -0,0 +1,117 @@
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+
+TOKEN_SALT = 'cwk1.tokens'
+
+_authors_lock = threading.Lock()
+_authors = {}
+
+
+def issue_token(user):
+    """Signed, timestamped bearer token naming ``user``; no server-side state."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def verify_token(token):
+    """The user id inside ``token``, or ``None`` if it is forged or expired.
+
+    Pure HMAC over ``SECRET_KEY``: no session row and no query.
+    """
+    try:
+        return int(signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.AUTH_TOKEN_MAX_AGE))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def cached_author(user_id):
+    """Resolve ``user_id`` through a short-lived in-process cache.
+
+    Entries live for ``AUTH_TOKEN_USER_CACHE_TTL`` seconds, which also bounds
+    how long a deactivated author's outstanding tokens keep working.
+    """
+    now = time.monotonic()
+    with _authors_lock:
+        entry = _authors.get(user_id)
+    if entry and entry[0] > now:
+        return entry[1]
+
+    UserModel = get_user_model()
+    try:
+        user = UserModel._default_manager.get(pk=user_id, is_active=True)
+    except UserModel.DoesNotExist:
+        user = None
+    with _authors_lock:
+        if len(_authors) >= settings.AUTH_TOKEN_USER_CACHE_SIZE:
+            _authors.clear()
+        _authors[user_id] = (now + settings.AUTH_TOKEN_USER_CACHE_TTL, user)
+    return user
+
+
+async def acached_author(user_id):
+    with _authors_lock:
+        entry = _authors.get(user_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return await sync_to_async(cached_author)(user_id)
+
+
+def clear_author_cache():
+    with _authors_lock:
+        _authors.clear()
+
+
+class BearerTokenMiddleware:
+    """Authenticate ``Authorization: Bearer <token>`` requests without sessions.
+
+    Must follow ``AuthenticationMiddleware``. It replaces the lazy session
+    user before anything reads it, so token requests never load the session.
+    Requests without a bearer token keep using cookie sessions. Works in
+    both sync and async middleware chains, so ASGI requests to the async
+    views never hop to a thread on its account.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user_id = self.token_user_id(request)
+        if user_id is not None:
+            self.set_user(request, cached_author(user_id) if user_id else None)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        user_id = self.token_user_id(request)
+        if user_id is not None:
+            self.set_user(request, await acached_author(user_id) if user_id else None)
+        return await self.get_response(request)
+
+    def token_user_id(self, request):
+        """``None`` without a bearer token, ``0`` for a bad one, else the user id."""
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return None
+        return verify_token(header[len('Bearer '):].strip()) or 0
+
+    def set_user(self, request, user):
+        from django.contrib.auth.models import AnonymousUser
+
+        user = user or AnonymousUser()
+
+        async def auser():
+            return user
+
+        request.user = user
+        request.auser = auser
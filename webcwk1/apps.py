@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class WebappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'webcwk1'
+
+    def ready(self):
+        from cwk1.sqlite import configure_connection
+        from . import signals  # noqa: F401
+
+        connection_created.connect(configure_connection, dispatch_uid='cwk1.sqlite.configure_connection')
@@ -0,0 +1,102 @@
+"""Async versions of the story views, for ASGI deployments.
+
+Selected instead of the ones in ``views`` when ``STORIES_ASYNC_VIEWS`` is on;
+see ``urls``. Behaviour and responses match the sync views exactly.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+
+from .cache import abump_generation, aread_through
+from .listing import Listing
+from .models import NewsStory
+from .queries import alatest_change, astory_page, listing_validators, story_rows
+from .streaming import NDJSON_CONTENT_TYPE, aiter_json, aiter_ndjson
+from .views import queue_story, story_payload_error
+
+
+async def list_stories(request):
+    try:
+        listing = Listing(request)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400, content_type='text/plain')
+    stories = listing.stories
+
+    change = await alatest_change()
+    etag, last_modified = listing_validators(listing.filters, change)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    async def render_listing():
+        rows = story_rows(stories, listing.columns)
+        if not listing.paginated:
+            return listing.render([row async for row in rows])
+        if listing.text:
+            return listing.render([row async for row in rows[:listing.page_size]])
+        return listing.render(*await astory_page(stories, listing.cursor, listing.page_size, listing.columns))
+
+    if listing.mode == 'ndjson':
+        body = StreamingHttpResponse(aiter_ndjson(stories), content_type=NDJSON_CONTENT_TYPE)
+    elif listing.mode == 'stream':
+        body = StreamingHttpResponse(aiter_json(stories), content_type='application/json')
+    else:
+        try:
+            body = await aread_through('listing', listing.filters, render_listing, revision=change[0])
+        except ValueError as e:
+            return HttpResponse(str(e), status=400, content_type='text/plain')
+    return listing.finish(body, etag, last_modified)
+
+
+@csrf_exempt
+async def post_story(request):
+    if request.method == 'POST':
+        author = await request.auser()
+        if not author.is_authenticated:
+            return HttpResponse('User not logged in', status=503, content_type='text/plain')
+        try:
+            json_data = json.loads(request.body.decode('utf-8'))
+            error = story_payload_error(json_data)
+            if error:
+                return HttpResponse(error, status=503, content_type='text/plain')
+            if settings.STORY_WRITE_BEHIND:
+                return await sync_to_async(queue_story)(author, json_data)
+            await NewsStory.objects.acreate(
+                headline=json_data['headline'],
+                category=json_data['category'],
+                region=json_data['region'],
+                author=author,
+                details=json_data['details'],
+            )
+            await abump_generation()
+            return HttpResponse(status=201, content_type='text/plain')
+        except Exception as e:
+            return HttpResponse(f'Failed to add story: {str(e)}', status=503, content_type='text/plain')
+
+    elif request.method == 'GET':
+        return await list_stories(request)
+
+    else:
+        return HttpResponse('Invalid request method', status=405, content_type='text/plain')
+
+
+@csrf_exempt
+@login_required
+async def delete_story(request, key):
+    if request.method != 'DELETE':
+        return HttpResponse('Invalid request method', status=503, content_type='text/plain')
+    try:
+        story = await NewsStory.objects.aget(pk=key, author=await request.auser())
+    except NewsStory.DoesNotExist:
+        raise Http404('No NewsStory matches the given query.')
+    try:
+        await story.adelete()
+        await abump_generation()
+        return HttpResponse(status=200, content_type='text/plain')
+    except Exception as e:
+        return HttpResponse(str(e), status=503, content_type='text/plain')
@@ -0,0 +1,129 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+GENERATION_KEY = 'stories:generation'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def cache_stats():
+    """Hit, miss and eviction counts for this process since start-up."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+class CountingLocMemCache(LocMemCache):
+    """``LocMemCache`` that reports entries dropped by culling as evictions.
+
+    Other backends are free to stand in for it through ``CACHES``; they just
+    won't contribute to the eviction count.
+    """
+
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        _count('evictions', before - len(self._cache))
+
+
+def story_cache():
+    alias = getattr(settings, 'STORY_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def current_generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Seed from the clock rather than 0 so a counter that was evicted can
+        # never come back at a value whose entries are still cached.
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def acurrent_generation(cache):
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """Make every cached listing unreachable. Call after each story write."""
+    cache = story_cache()
+    if cache is None:
+        return
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+async def abump_generation():
+    cache = story_cache()
+    if cache is None:
+        return
+    try:
+        await cache.aincr(GENERATION_KEY)
+    except ValueError:
+        await cache.aset(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def cache_key(generation, revision, kind, filters):
+    digest = hashlib.md5(repr(filters).encode('utf-8')).hexdigest()
+    return f'stories:{generation}:{revision}:{kind}:{digest}'
+
+
+def read_through(kind, filters, compute, revision=0):
+    """Read-through cache for values derived from a story listing.
+
+    ``kind`` names what is stored (a serialised body, ...),
+    ``filters`` is the normalised tuple of everything that shapes it and
+    ``compute`` produces it. ``None`` means "nothing to cache". Entries are
+    keyed under the current write generation, so a post or delete makes all
+    of them stale at once. The generation lives in this process's cache,
+    so writes from other processes (a cron ``prune_stories``, another
+    worker) only show through ``revision``: pass the change log id from
+    ``queries.latest_change()``.
+    """
+    cache = story_cache()
+    if cache is None:
+        return compute()
+    key = cache_key(current_generation(cache), revision, kind, filters)
+    value = cache.get(key)
+    if value is not None:
+        _count('hits')
+        return value
+    _count('misses')
+    value = compute()
+    if value is not None:
+        cache.set(key, value)
+    return value
+
+
+async def aread_through(kind, filters, compute, revision=0):
+    """``read_through`` for async views; ``compute`` is a coroutine function."""
+    cache = story_cache()
+    if cache is None:
+        return await compute()
+    key = cache_key(await acurrent_generation(cache), revision, kind, filters)
+    value = await cache.aget(key)
+    if value is not None:
+        _count('hits')
+        return value
+    _count('misses')
+    value = await compute()
+    if value is not None:
+        await cache.aset(key, value)
+    return value
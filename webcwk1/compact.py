@@ -0,0 +1,95 @@
+"""Compact story listing formats for bulk consumers.
+
+The default listing repeats all seven key names on every story. The compact
+formats send one array per field instead, and dictionary-encode the fields
+with few distinct values (category, region, author, date) as a list of
+values plus one small integer code per story::
+
+    {"count": 2,
+     "columns": {"key": [12, 11],
+                 "headline": ["...", "..."],
+                 "story_cat": {"values": ["pol", "art"], "codes": [0, 1]},
+                 ...},
+     "next": "..."}
+
+``next`` is present only on paginated requests. Keys are integers here,
+not strings. The same document is sent as JSON (``columns``) or
+MessagePack (``msgpack``, when the ``msgpack`` package is installed). The
+format is chosen with ``?format=`` or through ``Accept``.
+"""
+import json
+
+from cwk1.negotiation import header_weights
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+COLUMNS_CONTENT_TYPE = 'application/vnd.cwk1.columns+json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+CONTENT_TYPES = {'json': 'application/json', 'columns': COLUMNS_CONTENT_TYPE, 'msgpack': MSGPACK_CONTENT_TYPE}
+
+# id and date come first, as in STORY_LIST_COLUMNS, so keyset paging reads
+# the cursor from these rows the same way.
+COMPACT_COLUMNS = ('id', 'date', 'headline', 'category', 'region', 'author_username', 'details')
+
+
+def requested_format(request):
+    """``'json'``, ``'columns'`` or ``'msgpack'``; raises ``ValueError`` for a bad ``format``.
+
+    ``?format=`` wins over ``Accept``. Through ``Accept`` the compact formats
+    must be named, not matched by a wildcard, and the highest ``q`` wins,
+    ties going to the more compact format. MessagePack is left out when it
+    isn't installed, and JSON is the fallback.
+    """
+    name = request.GET.get('format')
+    if name is not None:
+        if name not in CONTENT_TYPES:
+            raise ValueError(f'format must be one of {", ".join(CONTENT_TYPES)}')
+        if name == 'msgpack' and msgpack is None:
+            raise ValueError('msgpack is not available on this server')
+        return name
+    weights = header_weights(request.headers.get('Accept', ''))
+    candidates = {
+        'msgpack': max(weights.get(MSGPACK_CONTENT_TYPE, 0), weights.get('application/x-msgpack', 0))
+        if msgpack is not None else 0,
+        'columns': weights.get(COLUMNS_CONTENT_TYPE, 0),
+        'json': weights.get('application/json', weights.get('application/*', weights.get('*/*', 0))),
+    }
+    best = max(candidates, key=candidates.get)
+    return best if candidates[best] > 0 else 'json'
+
+
+def dictionary_encode(values):
+    codes_by_value = {}
+    codes = [codes_by_value.setdefault(value, len(codes_by_value)) for value in values]
+    return {'values': list(codes_by_value), 'codes': codes}
+
+
+def story_columns(rows):
+    """The ``columns`` object for ``COMPACT_COLUMNS`` rows."""
+    keys, dates, headlines, categories, regions, authors, details = zip(*rows) if rows else ((),) * 7
+    # Dates are encoded before formatting, so strftime runs once per
+    # distinct day rather than once per story.
+    story_dates = dictionary_encode([date.date() for date in dates])
+    story_dates['values'] = [day.strftime('%Y-%m-%d') for day in story_dates['values']]
+    return {
+        'key': list(keys),
+        'headline': list(headlines),
+        'story_cat': dictionary_encode(categories),
+        'story_region': dictionary_encode(regions),
+        'author': dictionary_encode(authors),
+        'story_date': story_dates,
+        'story_details': list(details),
+    }
+
+
+def encode(format, rows, paginated=False, next_cursor=None):
+    """Serialise ``COMPACT_COLUMNS`` rows as a ``columns`` or ``msgpack`` body."""
+    document = {'count': len(rows), 'columns': story_columns(rows)}
+    if paginated:
+        document['next'] = next_cursor
+    if format == 'msgpack':
+        return msgpack.packb(document)
+    return json.dumps(document, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,82 @@
+import json
+from datetime import datetime
+
+from django.http import HttpResponse, HttpResponseBase
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+
+from . import compact
+from .queries import STORY_LIST_COLUMNS, parse_page_size, search_stories, stories_query, story_json
+from .streaming import wants_ndjson, wants_stream
+
+
+class Listing:
+    """A parsed GET /api/stories request, shared by the sync and async views.
+
+    Parsing touches no database; the views decide how to run the queries.
+    """
+
+    def __init__(self, request):
+        category = request.GET.get('story_cat', '*')
+        region = request.GET.get('story_region', '*')
+        date_str = request.GET.get('story_date', '*')
+
+        date = '*'
+        if date_str != '*':
+            try:
+                date = datetime.strptime(date_str, '%d/%m/%Y').date()
+            except ValueError:
+                raise ValueError('Invalid date format. Date must be in DD/MM/YYYY format.')
+
+        self.stories = stories_query(category, region, date)
+        self.text = request.GET.get('q', '').strip()
+        if self.text:
+            self.stories = search_stories(self.stories, self.text)
+        self.cursor = request.GET.get('cursor')
+        limit = request.GET.get('limit')
+        self.paginated = self.cursor is not None or limit is not None
+        self.page_size = parse_page_size(limit) if self.paginated else None
+        # Keyset cursors follow (date, id), which ranked search results don't;
+        # a search can be capped with limit but not paged through.
+        if self.text and self.cursor is not None:
+            raise ValueError('cursor cannot be combined with q')
+        self.format = compact.requested_format(request)
+        self.columns = STORY_LIST_COLUMNS if self.format == 'json' else compact.COMPACT_COLUMNS
+        if wants_ndjson(request):
+            self.mode = 'ndjson'
+        elif wants_stream(request):
+            self.mode = 'stream'
+        else:
+            self.mode = 'json'
+        if self.mode != 'json' and self.format != 'json':
+            raise ValueError(f'{self.format} listings cannot be streamed; page through them with limit')
+        if self.mode != 'json' and self.paginated:
+            raise ValueError('limit and cursor cannot be combined with a streamed listing')
+        self.filters = (category, region, str(date), self.text, self.mode, self.page_size, self.cursor, self.format)
+
+    def render(self, rows, next_cursor=None):
+        """Serialised body for ``rows``, or ``None`` when it should be a 404."""
+        # Only the first page 404s; a later page can legitimately come back
+        # empty if stories were deleted between requests.
+        if not rows and (not self.paginated or self.cursor is None):
+            return None
+        if self.format != 'json':
+            return compact.encode(self.format, rows, self.paginated, next_cursor)
+        stories = ', '.join([story_json(row) for row in rows])
+        if not self.paginated:
+            return ('{"stories": [%s]}' % stories).encode('utf-8')
+        return ('{"stories": [%s], "next": %s}' % (stories, json.dumps(next_cursor))).encode('utf-8')
+
+    def finish(self, body, etag, last_modified):
+        if body is None:
+            return HttpResponse('No stories found', status=404, content_type='text/plain')
+        if isinstance(body, HttpResponseBase):
+            response = body
+        else:
+            response = HttpResponse(body, content_type=compact.CONTENT_TYPES[self.format])
+        # The stream, NDJSON and compact formats are all chosen by Accept.
+        patch_vary_headers(response, ('Accept',))
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from webcwk1.cache import bump_generation
+from webcwk1.models import NewsStory
+from webcwk1.queries import rebuild_fragments
+
+
+class Command(BaseCommand):
+    help = ("Check that every story's denormalised author_username matches its author's username, "
+            "and with --fix, repair the ones that don't (and their fragments).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Update mismatched stories in place.')
+
+    def handle(self, *args, fix=False, **options):
+        stale = (NewsStory.objects.exclude(author_username=F('author__username'))
+                 .values_list('author_id', 'author__username').distinct())
+        authors = dict(stale)
+        if not authors:
+            self.stdout.write(self.style.SUCCESS('All story author usernames are consistent.'))
+            return
+
+        repaired = 0
+        for author_id, username in authors.items():
+            stories = NewsStory.objects.filter(author_id=author_id).exclude(author_username=username)
+            if fix:
+                count = stories.update(author_username=username)
+                rebuild_fragments(NewsStory.objects.filter(author_id=author_id))
+                repaired += count
+            else:
+                count = stories.count()
+            self.stdout.write(f'{username} (author {author_id}): {count} stories out of date')
+
+        if not fix:
+            raise CommandError(f'{len(authors)} authors have stories with a stale author_username; '
+                               'run with --fix to repair them.')
+        bump_generation()
+        self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} stories.'))
@@ -0,0 +1,84 @@
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from webcwk1.cache import bump_generation
+from webcwk1.queries import delete_in_chunks, trim_story_changes
+from webcwk1.retention import expired_stories
+
+
+class Command(BaseCommand):
+    help = ('Delete stories older than STORY_RETENTION allows, in batches with pauses so live requests '
+            'keep getting the SQLite write lock, then trim the change log to STORY_CHANGE_RETENTION_DAYS. '
+            'Meant to be run from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be deleted, delete nothing.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Stories deleted per statement.')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches.')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='Finish with PRAGMA incremental_vacuum to return freed pages to the OS '
+                                 '(needs auto_vacuum=INCREMENTAL).')
+        parser.add_argument('--json', action='store_true', help='Print the metrics as one JSON object.')
+
+    def handle(self, *args, dry_run=False, batch_size=1000, sleep=0.1, vacuum=False, **options):
+        started = time.monotonic()
+        metrics = {'dry_run': dry_run, 'rules': [], 'deleted': 0}
+        for category, region, cutoff, stories in expired_stories():
+            if dry_run:
+                count = stories.count()
+            else:
+                rule_started = time.monotonic()
+                count = delete_in_chunks(stories, batch_size, pause=sleep)
+            rule = {'category': category, 'region': region, 'cutoff': cutoff.isoformat(), 'stories': count}
+            if not dry_run:
+                rule['seconds'] = round(time.monotonic() - rule_started, 3)
+            metrics['rules'].append(rule)
+            metrics['deleted'] += count
+            if not options['json']:
+                verb = 'would delete' if dry_run else 'deleted'
+                self.stdout.write(f'{category}/{region}: {verb} {count} stories dated before {cutoff:%Y-%m-%d}')
+
+        before = timezone.now() - timedelta(days=settings.STORY_CHANGE_RETENTION_DAYS)
+        metrics['changes_trimmed'] = trim_story_changes(before, batch_size, dry_run)
+        if not options['json']:
+            verb = 'would trim' if dry_run else 'trimmed'
+            self.stdout.write(f"change log: {verb} {metrics['changes_trimmed']} entries before {before:%Y-%m-%d}")
+
+        if metrics['deleted'] and not dry_run:
+            bump_generation()
+            if vacuum:
+                metrics['vacuum'] = self.incremental_vacuum()
+        metrics['seconds'] = round(time.monotonic() - started, 3)
+
+        if options['json']:
+            self.stdout.write(json.dumps(metrics))
+            return
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {metrics['deleted']} stories in {metrics['seconds']}s."))
+        if 'vacuum' in metrics:
+            self.stdout.write(metrics['vacuum']['message'])
+
+    def incremental_vacuum(self):
+        if connection.vendor != 'sqlite':
+            return {'pages_freed': 0, 'message': 'Skipped VACUUM: not an SQLite database.'}
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] != 2:
+                # Switching modes needs a full VACUUM, which locks the whole
+                # database for its duration: an operator decision, not cron's.
+                return {'pages_freed': 0, 'message': 'Skipped VACUUM: auto_vacuum is not INCREMENTAL. Run '
+                                                     '"PRAGMA auto_vacuum = INCREMENTAL; VACUUM;" once to enable it.'}
+            cursor.execute('PRAGMA freelist_count')
+            before = cursor.fetchone()[0]
+            # sqlite3's execute() steps this pragma once, freeing a single
+            # page; executescript() runs it to completion.
+            connection.connection.executescript('PRAGMA incremental_vacuum')
+            cursor.execute('PRAGMA freelist_count')
+            freed = before - cursor.fetchone()[0]
+        return {'pages_freed': freed, 'message': f'Incremental VACUUM returned {freed} pages to the OS.'}
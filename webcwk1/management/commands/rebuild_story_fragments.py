@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from webcwk1.cache import bump_generation
+from webcwk1.models import NewsStory
+from webcwk1.queries import FRAGMENT_BATCH_SIZE, rebuild_fragments
+
+
+class Command(BaseCommand):
+    help = 'Re-render the pre-serialised listing fragment of every story.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='Only render stories that have no fragment (e.g. inserted with raw SQL).')
+        parser.add_argument('--batch-size', type=int, default=FRAGMENT_BATCH_SIZE)
+
+    def handle(self, *args, missing=False, batch_size=FRAGMENT_BATCH_SIZE, **options):
+        stories = NewsStory.objects.filter(fragment__isnull=True) if missing else NewsStory.objects.all()
+        count = rebuild_fragments(stories, batch_size)
+        if count:
+            bump_generation()
+        self.stdout.write(self.style.SUCCESS(f'Rendered {count} story fragments.'))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webcwk1', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='newsstory',
+            index=models.Index(fields=['category', 'region', 'date'], name='story_cat_reg_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsstory',
+            index=models.Index(fields=['category', 'date'], name='story_cat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsstory',
+            index=models.Index(fields=['region', 'date'], name='story_reg_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsstory',
+            index=models.Index(fields=['date'], name='story_date_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# An external-content FTS5 index over NewsStory.headline/details. Triggers keep
+# it in step with every insert, update and delete, including bulk_create and
+# queryset deletes that bypass model signals.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE webcwk1_newsstory_fts USING fts5(
+        headline, details, content='webcwk1_newsstory', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER webcwk1_newsstory_fts_insert AFTER INSERT ON webcwk1_newsstory BEGIN
+        INSERT INTO webcwk1_newsstory_fts(rowid, headline, details)
+        VALUES (new.id, new.headline, new.details);
+    END
+    """,
+    """
+    CREATE TRIGGER webcwk1_newsstory_fts_delete AFTER DELETE ON webcwk1_newsstory BEGIN
+        INSERT INTO webcwk1_newsstory_fts(webcwk1_newsstory_fts, rowid, headline, details)
+        VALUES ('delete', old.id, old.headline, old.details);
+    END
+    """,
+    """
+    CREATE TRIGGER webcwk1_newsstory_fts_update AFTER UPDATE OF headline, details ON webcwk1_newsstory BEGIN
+        INSERT INTO webcwk1_newsstory_fts(webcwk1_newsstory_fts, rowid, headline, details)
+        VALUES ('delete', old.id, old.headline, old.details);
+        INSERT INTO webcwk1_newsstory_fts(rowid, headline, details)
+        VALUES (new.id, new.headline, new.details);
+    END
+    """,
+    "INSERT INTO webcwk1_newsstory_fts(webcwk1_newsstory_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS webcwk1_newsstory_fts_update',
+    'DROP TRIGGER IF EXISTS webcwk1_newsstory_fts_delete',
+    'DROP TRIGGER IF EXISTS webcwk1_newsstory_fts_insert',
+    'DROP TABLE IF EXISTS webcwk1_newsstory_fts',
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webcwk1', '0002_newsstory_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(CREATE_SQL), run_sqlite(DROP_SQL)),
+    ]
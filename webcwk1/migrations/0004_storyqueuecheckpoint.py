@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webcwk1', '0003_newsstory_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryQueueCheckpoint',
+            fields=[
+                ('journal', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('offset', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:43
+
+import webcwk1.models
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_author_username(apps, schema_editor):
+    NewsStory = apps.get_model('webcwk1', 'NewsStory')
+    Author = apps.get_model('webcwk1', 'Author')
+    NewsStory.objects.update(
+        author_username=Subquery(Author.objects.filter(pk=OuterRef('author_id')).values('username')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webcwk1', '0004_storyqueuecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsstory',
+            name='author_username',
+            field=webcwk1.models.AuthorUsernameField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_author_username, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:45
+
+import json
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def story_fragment(headline, category, region, author, date, details):
+    # Frozen copy of queries.story_fragment as it was when this ran; the
+    # current format is applied by manage.py rebuild_story_fragments.
+    return json.dumps({
+        'headline': headline,
+        'story_cat': category,
+        'story_region': region,
+        'author': author,
+        'story_date': date.strftime('%Y-%m-%d'),
+        'story_details': details
+    })
+
+
+def render_fragments(apps, schema_editor):
+    NewsStory = apps.get_model('webcwk1', 'NewsStory')
+    connection = schema_editor.connection
+    rows = NewsStory.objects.using(connection.alias).order_by('pk').values_list(
+        'pk', 'headline', 'category', 'region', 'author_username', 'date', 'details')
+    sql = f'UPDATE {connection.ops.quote_name(NewsStory._meta.db_table)} SET fragment = %s WHERE id = %s'
+    last = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last)[:BATCH_SIZE])
+        if not batch:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [(story_fragment(*row[1:]), row[0]) for row in batch])
+        last = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webcwk1', '0005_newsstory_author_username'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsstory',
+            name='fragment',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(render_fragments, migrations.RunPython.noop),
+    ]
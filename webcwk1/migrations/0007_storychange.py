@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:07
+
+from django.db import migrations, models
+
+# Triggers fill the change log on every insert, delete and fragment change,
+# including bulk_create, queryset deletes and raw fragment rebuilds. 0009
+# widens the update trigger to every listed column. Like the FTS triggers, they are lost if a migration ever rebuilds
+# the webcwk1_newsstory table.
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+CREATE_SQL = [
+    # Existing stories go in as adds, so a mirror starting from cursor 0
+    # gets everything.
+    """
+    INSERT INTO webcwk1_storychange(story_key, action, changed_at)
+    SELECT id, 'add', date FROM webcwk1_newsstory ORDER BY id
+    """,
+    f"""
+    CREATE TRIGGER webcwk1_storychange_insert AFTER INSERT ON webcwk1_newsstory BEGIN
+        INSERT INTO webcwk1_storychange(story_key, action, changed_at) VALUES (new.id, 'add', {NOW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER webcwk1_storychange_delete AFTER DELETE ON webcwk1_newsstory BEGIN
+        INSERT INTO webcwk1_storychange(story_key, action, changed_at) VALUES (old.id, 'delete', {NOW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER webcwk1_storychange_update AFTER UPDATE OF fragment ON webcwk1_newsstory
+    WHEN old.fragment IS NOT new.fragment BEGIN
+        INSERT INTO webcwk1_storychange(story_key, action, changed_at) VALUES (new.id, 'update', {NOW});
+    END
+    """,
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS webcwk1_storychange_update',
+    'DROP TRIGGER IF EXISTS webcwk1_storychange_delete',
+    'DROP TRIGGER IF EXISTS webcwk1_storychange_insert',
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webcwk1', '0006_newsstory_fragment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('story_key', models.IntegerField()),
+                ('action', models.CharField(choices=[('add', 'Added'), ('update', 'Updated'), ('delete', 'Deleted')], max_length=6)),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(run_sqlite(CREATE_SQL), run_sqlite(DROP_SQL)),
+    ]
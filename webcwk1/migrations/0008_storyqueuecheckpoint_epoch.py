@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webcwk1', '0007_storychange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storyqueuecheckpoint',
+            name='epoch',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
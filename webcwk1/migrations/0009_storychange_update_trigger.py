@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:40
+
+from django.db import migrations
+
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+# Every column the listing shows, not just the fragment rendered from them,
+# so a QuerySet.update() that skips re-rendering still reaches the change
+# feed.
+LISTED_COLUMNS = ('headline', 'category', 'region', 'author_username', 'date', 'details', 'fragment')
+
+DROP_UPDATE_TRIGGER = 'DROP TRIGGER IF EXISTS webcwk1_storychange_update'
+
+CREATE_SQL = [
+    DROP_UPDATE_TRIGGER,
+    f"""
+    CREATE TRIGGER webcwk1_storychange_update AFTER UPDATE OF {', '.join(LISTED_COLUMNS)} ON webcwk1_newsstory
+    WHEN {' OR '.join(f'old.{column} IS NOT new.{column}' for column in LISTED_COLUMNS)} BEGIN
+        INSERT INTO webcwk1_storychange(story_key, action, changed_at) VALUES (new.id, 'update', {NOW});
+    END
+    """,
+]
+
+REVERSE_SQL = [
+    DROP_UPDATE_TRIGGER,
+    f"""
+    CREATE TRIGGER webcwk1_storychange_update AFTER UPDATE OF fragment ON webcwk1_newsstory
+    WHEN old.fragment IS NOT new.fragment BEGIN
+        INSERT INTO webcwk1_storychange(story_key, action, changed_at) VALUES (new.id, 'update', {NOW});
+    END
+    """,
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webcwk1', '0008_storyqueuecheckpoint_epoch'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(CREATE_SQL), run_sqlite(REVERSE_SQL)),
+    ]
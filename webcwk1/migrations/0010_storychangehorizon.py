@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webcwk1', '0009_storychange_update_trigger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryChangeHorizon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('change_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
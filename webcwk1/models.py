@@ -11,6 +11,46 @@ class Author(AbstractUser):
         return self.username
 
 
+class AuthorUsernameField(models.CharField):
+    """Copy of the story author's username, kept up to date on every save.
+
+    Filled in by ``pre_save``, which ``bulk_create`` calls too, so every way
+    of adding or saving stories through the ORM sets it; a new story may come
+    with it already set. Renames are carried over by
+    ``signals.sync_author_username`` and ``manage.py check_author_usernames``.
+    """
+
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        if not add or not value:
+            value = model_instance.author.username
+            setattr(model_instance, self.attname, value)
+        return value
+
+
+class StoryFragmentField(models.TextField):
+    """The story's listing entry, pre-serialised by ``queries.story_fragment``.
+
+    Rendered by ``pre_save`` on every save, after the date and author
+    username fields before it have been filled in, so edits (the admin's,
+    say) show up in the listing. ``QuerySet.update()`` skips it; follow one
+    with ``queries.rebuild_fragments``.
+    """
+
+    def deconstruct(self):
+        # Migrations only need the column, so they don't depend on this class.
+        name, path, args, kwargs = super().deconstruct()
+        return name, 'django.db.models.TextField', args, kwargs
+
+    def pre_save(self, model_instance, add):
+        from .queries import story_fragment
+
+        value = story_fragment(model_instance.headline, model_instance.category, model_instance.region,
+                               model_instance.author_username, model_instance.date, model_instance.details)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 class NewsStory(models.Model):
     POLITICAL = 'pol'
     ART = 'art'
@@ -37,8 +77,81 @@ class NewsStory(models.Model):
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, help_text="Select the category of the news story.")
     region = models.CharField(max_length=20, choices=REGION_CHOICES, help_text="Select the geographical region of the news story.")
     author = models.ForeignKey('Author', on_delete=models.CASCADE, help_text="Select the author of the news story.")
+    # Lets the listing serialise stories without joining Author. Nullable only
+    # so SQLite can add the column in place: a NOT NULL column means rebuilding
+    # the table, which would also drop the FTS triggers from migration 0003.
+    author_username = AuthorUsernameField(max_length=64, null=True, blank=True, editable=False)
     date = models.DateTimeField(auto_now_add=True, help_text="The date and time the story was added.")
     details = models.CharField(max_length=128, help_text="Enter the details of the news story.")
+    # Must stay the last field: it is rendered from all the others. Nullable
+    # for the same reason as author_username.
+    fragment = StoryFragmentField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.headline
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # Saving only some fields still re-renders the copies made from them.
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if update_fields & {'author', 'author_id'}:
+                update_fields.add('author_username')
+            update_fields.add('fragment')
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+    class Meta:
+        # Cover every shape the stories listing filters on, with date last so
+        # SQLite can walk the index backwards for the newest-first ordering.
+        indexes = [
+            models.Index(fields=['category', 'region', 'date'], name='story_cat_reg_date_idx'),
+            models.Index(fields=['category', 'date'], name='story_cat_date_idx'),
+            models.Index(fields=['region', 'date'], name='story_reg_date_idx'),
+            models.Index(fields=['date'], name='story_date_idx'),
+        ]
+
+
+class StoryQueueCheckpoint(models.Model):
+    """How far a write-behind journal has been committed (see ``writebehind``).
+
+    Updated in the same transaction as each batch of stories, so replaying a
+    journal after a crash never inserts a story twice.
+    """
+    journal = models.CharField(max_length=255, primary_key=True)
+    offset = models.BigIntegerField(default=0)
+    # The journal's header epoch; an offset from another epoch is stale.
+    epoch = models.CharField(max_length=32, blank=True, default='')
+
+
+class StoryChange(models.Model):
+    """One entry in the append-only log of story adds, updates and deletes.
+
+    Written only by the SQLite triggers from migration 0007, so every insert,
+    update and delete is logged, including bulk ones that skip model
+    signals. ``id`` is the cursor for ``GET /api/stories/changes``.
+    AUTOINCREMENT keeps it from going backwards, and keys are never reused,
+    so a mirror can apply the log in order. ``prune_stories`` trims old
+    entries (see ``StoryChangeHorizon``).
+    """
+    ADD = 'add'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+    ACTION_CHOICES = [
+        (ADD, 'Added'),
+        (UPDATE, 'Updated'),
+        (DELETE, 'Deleted'),
+    ]
+
+    story_key = models.IntegerField()
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES)
+    changed_at = models.DateTimeField()
+
+
+class StoryChangeHorizon(models.Model):
+    """How far back ``prune_stories`` has trimmed the change log; one row.
+
+    Changes up to ``change_id`` are kept only as the latest entry of each
+    story still present, so a mirror can start over from cursor 0 but not
+    resume from a cursor below it: tombstones it needs may be gone.
+    """
+    change_id = models.BigIntegerField(default=0)
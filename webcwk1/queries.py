@@ -0,0 +1,323 @@
+import base64
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.db.models import F, Func, Max, Q, TextField, Value
+from django.db.models.functions import Coalesce
+from django.utils.http import quote_etag
+
+from .models import NewsStory, StoryChange, StoryChangeHorizon
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def story_filters(category='*', region='*', date='*'):
+    """Translate the '*'-wildcarded listing parameters into ORM lookups."""
+    filters = {}
+    if category != '*':
+        filters['category'] = category
+    if region != '*':
+        filters['region'] = region
+    if date != '*' and date is not None:
+        filters['date__gte'] = date
+    return filters
+
+
+def fts_query(text):
+    """Quote each word of free text as an FTS5 string, ANDed together.
+
+    Keeps user input from being parsed as FTS5 query syntax (``-``, ``*``,
+    ``NEAR``, unbalanced quotes...), which would otherwise be a SQL error.
+    """
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+
+def search_stories(queryset, text):
+    """Narrow ``queryset`` to stories matching ``text``, best matches first.
+
+    Joins the ``webcwk1_newsstory_fts`` index from migration 0003, so the
+    listing filters and the full-text match run as one query ordered by FTS5
+    ``rank`` (bm25), then newest first. The unary ``+`` stops SQLite from
+    driving the join off a category/region index and re-running the MATCH
+    for every story in it; the match is scanned once and stories are looked
+    up by primary key.
+    """
+    return queryset.extra(
+        tables=['webcwk1_newsstory_fts'],
+        where=['+webcwk1_newsstory_fts.rowid = webcwk1_newsstory.id', 'webcwk1_newsstory_fts MATCH %s'],
+        params=[fts_query(text)],
+        select={'rank': 'webcwk1_newsstory_fts.rank'},
+        order_by=['rank', '-date', '-id'],
+    )
+
+
+def stories_query(category='*', region='*', date='*'):
+    """Build the stories listing queryset, newest first.
+
+    Equality filters come before the date range and the ordering follows the
+    ``(category, region, date)`` family of indexes on ``NewsStory``, so every
+    filter combination is answered by a backwards index walk instead of a
+    table scan plus sort. ``id`` breaks ties between stories posted in the
+    same instant.
+    """
+    return NewsStory.objects.filter(**story_filters(category, region, date)).order_by('-date', '-id')
+
+
+# Everything the listing needs: the key and date for paging, and the rest of
+# the story pre-serialised (see ``story_fragment``). One join-free SELECT of
+# three columns, and no per-story dicts, strftime or JSON encoding.
+STORY_LIST_COLUMNS = ('id', 'date', 'fragment')
+FRAGMENT_BATCH_SIZE = 1000
+DELETE_CHUNK_SIZE = 2000
+
+
+def story_rows(queryset, columns=STORY_LIST_COLUMNS):
+    if 'fragment' in columns:
+        # A row inserted with raw SQL has no fragment until
+        # ``rebuild_story_fragments --missing`` runs; SQLite renders it from
+        # the columns meanwhile, so one such row can't break the listing.
+        queryset = queryset.annotate(listing_fragment=Coalesce('fragment', fallback_fragment()))
+        columns = tuple('listing_fragment' if column == 'fragment' else column for column in columns)
+    return queryset.values_list(*columns)
+
+
+def fallback_fragment():
+    """SQL for what ``story_fragment`` renders, from the story's own columns."""
+    return Func(
+        Value('headline'), F('headline'),
+        Value('story_cat'), F('category'),
+        Value('story_region'), F('region'),
+        Value('author'), F('author_username'),
+        Value('story_date'), Func(Value('%Y-%m-%d'), F('date'), function='strftime'),
+        Value('story_details'), F('details'),
+        function='json_object', output_field=TextField(),
+    )
+
+
+def story_fragment(headline, category, region, author, date, details):
+    """A story's listing entry minus its key, as a JSON object.
+
+    Rendered whenever the story is saved (``StoryFragmentField``) and spliced
+    into every listing by ``story_json``; ``manage.py rebuild_story_fragments``
+    re-renders them if this format changes.
+    """
+    return json.dumps({
+        'headline': headline,
+        'story_cat': category,
+        'story_region': region,
+        'author': author,
+        'story_date': date.strftime('%Y-%m-%d'),
+        'story_details': details
+    })
+
+
+def story_json(row):
+    """The JSON listing entry for a ``story_rows`` row."""
+    return '{"key": "%d", %s' % (row[0], row[2][1:])
+
+
+def rebuild_fragments(queryset, batch_size=FRAGMENT_BATCH_SIZE):
+    """Re-render the fragment of every story in ``queryset``; returns how many.
+
+    Walks the stories in primary key order, one transaction per batch, so a
+    rebuild of a large table never holds the write lock for long.
+    """
+    rows = queryset.order_by('pk').values_list('pk', 'headline', 'category', 'region', 'author_username', 'date',
+                                               'details')
+    sql = f'UPDATE {NewsStory._meta.db_table} SET fragment = %s WHERE id = %s'
+    total = 0
+    last = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return total
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, [(story_fragment(*row[1:]), row[0]) for row in batch])
+        total += len(batch)
+        last = batch[-1][0]
+
+
+
+def delete_in_chunks(queryset, chunk_size=DELETE_CHUNK_SIZE, pause=0):
+    """Delete every story in ``queryset`` a chunk at a time; returns how many.
+
+    Each chunk of keys is deleted by its own short statement, so other
+    writers get the database between chunks; ``pause`` seconds of sleep
+    after each full chunk give them longer. ``QuerySet.delete()`` runs a
+    chunk as one plain DELETE when nothing needs the rows first (no delete
+    signal receivers, nothing cascading), and falls back to the collector
+    if that ever changes.
+    """
+    keys = queryset.order_by().values_list('pk', flat=True)
+    total = 0
+    while True:
+        chunk = list(keys[:chunk_size])
+        if not chunk:
+            return total
+        total += NewsStory.objects.filter(pk__in=chunk).delete()[1].get(NewsStory._meta.label, 0)
+        if len(chunk) < chunk_size:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
+def encode_cursor(date, key):
+    """Opaque cursor pointing just past the story with this ``(date, key)``."""
+    raw = json.dumps([date.isoformat(), key]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of ``encode_cursor``; raises ``ValueError`` on anything malformed."""
+    try:
+        date, key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(date), int(key)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_page_size(limit):
+    """Validate a ``limit`` query parameter, defaulting when it is absent."""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError('Limit must be a positive integer')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def story_page_query(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE, columns=STORY_LIST_COLUMNS):
+    """Rows query for one keyset page; one extra row tells whether more follow.
+
+    ``queryset`` must be ordered by ``('-date', '-id')`` as ``stories_query``
+    does, so seeking past the cursor stays on the same index as the filters.
+    ``columns`` must start with ``('id', 'date')``.
+    """
+    if cursor is not None:
+        date, key = decode_cursor(cursor)
+        queryset = queryset.filter(Q(date__lt=date) | Q(date=date, id__lt=key))
+    return story_rows(queryset, columns)[:limit + 1]
+
+
+def split_page(rows, limit):
+    """Trim the look-ahead row off ``rows``; the cursor is ``None`` on the last page."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last[1], last[0])
+
+
+def story_page(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE, columns=STORY_LIST_COLUMNS):
+    """Return one keyset page of listing rows and the cursor for the next one."""
+    return split_page(list(story_page_query(queryset, cursor, limit, columns)), limit)
+
+
+async def astory_page(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE, columns=STORY_LIST_COLUMNS):
+    return split_page([row async for row in story_page_query(queryset, cursor, limit, columns)], limit)
+
+
+def parse_change_cursor(since):
+    """Validate a ``since`` query parameter; absent means from the start."""
+    if since is None:
+        return 0
+    try:
+        since = int(since)
+    except ValueError:
+        since = -1
+    if since < 0:
+        raise ValueError('since must be a change cursor from a previous response')
+    return since
+
+
+def story_changes(since=0, limit=DEFAULT_PAGE_SIZE):
+    """``(rows, deleted, next_cursor, more)`` for changes logged after ``since``.
+
+    ``rows`` are ``story_rows`` for stories added or updated since then and
+    still present, ``deleted`` the keys of those deleted since then. Keys are
+    never reused, so the order between the two doesn't matter. The cursor
+    moves past every change read, including adds of stories that were
+    deleted again before this poll.
+    """
+    if since and since < change_horizon():
+        raise ValueError('since is older than the change log goes back; start again from 0')
+    changes = list(StoryChange.objects.filter(id__gt=since).order_by('id')
+                   .values_list('id', 'story_key', 'action')[:limit + 1])
+    more = len(changes) > limit
+    changes = changes[:limit]
+    if not changes:
+        # A cursor past the end of the log came from some other database
+        # (or one since restored from backup); the mirror has to start over.
+        if since and not StoryChange.objects.filter(id=since).exists():
+            raise ValueError('since is not a cursor from this change log; start again from 0')
+        return [], [], since, False
+    deleted = {key for _, key, action in changes if action == StoryChange.DELETE}
+    changed = {key for _, key, action in changes if action != StoryChange.DELETE} - deleted
+    rows = list(story_rows(NewsStory.objects.filter(pk__in=changed).order_by('id'))) if changed else []
+    return rows, sorted(deleted), changes[-1][0], more
+
+
+def change_horizon():
+    """The newest change id trimmed by ``trim_story_changes``, or 0."""
+    return StoryChangeHorizon.objects.values_list('change_id', flat=True).first() or 0
+
+
+def trim_story_changes(before, chunk_size=DELETE_CHUNK_SIZE, dry_run=False):
+    """Drop change log entries from before ``before`` that cursor 0 doesn't need; returns how many.
+
+    Every story still present keeps its latest entry, so a mirror starting
+    over from 0 still gets them all; superseded entries and tombstones go.
+    The horizon moves first, so cursors that could miss a trimmed tombstone
+    get a 400 rather than a silently incomplete feed. The newest entry stays
+    too: its id is the table revision behind listing ETags.
+    """
+    horizon = StoryChange.objects.filter(changed_at__lt=before).aggregate(horizon=Max('id'))['horizon']
+    if horizon is None:
+        return 0
+    newest = latest_change()[0]
+    latest = StoryChange.objects.values('story_key').annotate(latest=Max('id')).values('latest')
+    stale = list(StoryChange.objects.filter(id__lte=horizon).exclude(id=newest)
+                 .filter(Q(action=StoryChange.DELETE) | ~Q(id__in=latest)).values_list('id', flat=True))
+    if dry_run:
+        return len(stale)
+    if horizon > change_horizon():
+        StoryChangeHorizon.objects.update_or_create(pk=1, defaults={'change_id': horizon})
+    for start in range(0, len(stale), chunk_size):
+        StoryChange.objects.filter(id__in=stale[start:start + chunk_size]).delete()
+    return len(stale)
+
+
+def latest_change():
+    """``(id, changed_at)`` of the newest ``StoryChange``, or ``(0, None)`` before the first write.
+
+    The id moves on every add, delete and fragment rewrite, bulk ones
+    included, so it serves as the revision of the whole story table.
+    """
+    return StoryChange.objects.order_by('-id').values_list('id', 'changed_at').first() or (0, None)
+
+
+async def alatest_change():
+    return await StoryChange.objects.order_by('-id').values_list('id', 'changed_at').afirst() or (0, None)
+
+
+def listing_validators(filters, change):
+    """``(etag, last_modified)`` for a listing, from ``latest_change()`` alone.
+
+    The ETag covers the request's ``filters`` and the table revision.
+    ``last_modified`` is the time of the last write in epoch seconds, but
+    only once that second is over: HTTP dates have no finer resolution, so
+    a story written later in the same second would otherwise get a 304.
+    It is ``None`` then, and before the first write.
+    """
+    revision, changed_at = change
+    etag = quote_etag(hashlib.md5(repr((filters, revision)).encode('utf-8')).hexdigest())
+    if changed_at is None or int(changed_at.timestamp()) >= int(time.time()):
+        return etag, None
+    return etag, int(changed_at.timestamp())
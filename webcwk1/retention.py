@@ -0,0 +1,39 @@
+"""Per category/region retention of stories, enforced by ``manage.py prune_stories``.
+
+``STORY_RETENTION`` maps ``(category, region)`` to the number of days a story
+is kept, with ``'*'`` matching any category or region and ``None`` meaning
+forever. The most specific rule wins: an exact pair, then the category, then
+the region, then ``('*', '*')``, and stories no rule covers are kept.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import NewsStory
+
+
+def retention_days(category, region, rules=None):
+    """Days to keep stories in ``category``/``region``, or ``None`` for forever."""
+    rules = settings.STORY_RETENTION if rules is None else rules
+    for key in ((category, region), (category, '*'), ('*', region), ('*', '*')):
+        if key in rules:
+            return rules[key]
+    return None
+
+
+def expired_stories(now=None, rules=None):
+    """``(category, region, cutoff, queryset)`` for every pair with a limit.
+
+    One queryset per pair, so each is an equality lookup plus a date range on
+    the ``(category, region, date)`` index.
+    """
+    now = now or timezone.now()
+    for category, _ in NewsStory.CATEGORY_CHOICES:
+        for region, _ in NewsStory.REGION_CHOICES:
+            days = retention_days(category, region, rules)
+            if days is None:
+                continue
+            cutoff = now - timedelta(days=days)
+            yield category, region, cutoff, NewsStory.objects.filter(category=category, region=region,
+                                                                     date__lt=cutoff)
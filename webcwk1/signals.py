@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .cache import bump_generation
+from .models import Author, NewsStory
+from .queries import rebuild_fragments
+
+
+@receiver(post_save, sender=Author, dispatch_uid='webcwk1.signals.sync_author_username')
+def sync_author_username(sender, instance, created, update_fields=None, **kwargs):
+    """Carry a renamed author's username over to their stories and fragments.
+
+    One UPDATE over the author's stories (plus re-rendering them), skipped for new authors and for
+    saves that can't have touched the username (``update_last_login`` on
+    every login, for one). Renames through ``QuerySet.update()`` bypass this;
+    ``manage.py check_author_usernames --fix`` repairs those.
+    """
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    stories = NewsStory.objects.filter(author=instance)
+    if stories.exclude(author_username=instance.username).update(author_username=instance.username):
+        rebuild_fragments(stories)
+        bump_generation()
@@ -0,0 +1,99 @@
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from cwk1.negotiation import header_weights
+
+from .queries import story_json, story_rows
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+# Rows pulled from SQLite per fetch, and rows encoded into each chunk sent to
+# the client. Both bound the memory a streamed listing holds at any moment.
+STREAM_FETCH_SIZE = 2000
+STREAM_CHUNK_ROWS = 500
+
+
+def wants_stream(request):
+    """True for ``?stream=1`` or an NDJSON ``Accept`` header."""
+    return request.GET.get('stream') == '1' or wants_ndjson(request)
+
+
+def wants_ndjson(request):
+    """True when ``Accept`` names NDJSON with a weight above 0."""
+    return header_weights(request.headers.get('Accept', '')).get(NDJSON_CONTENT_TYPE, 0) > 0
+
+
+def iter_story_json(queryset):
+    for row in story_rows(queryset).iterator(chunk_size=STREAM_FETCH_SIZE):
+        yield story_json(row)
+
+
+def iter_json(queryset):
+    """Yield the ``{"stories": [...]}`` document a few hundred rows at a time."""
+    yield '{"stories": ['
+    batch = []
+    first = True
+    for story in iter_story_json(queryset):
+        batch.append(story)
+        if len(batch) == STREAM_CHUNK_ROWS:
+            yield ('' if first else ', ') + ', '.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ('' if first else ', ') + ', '.join(batch)
+    yield ']}'
+
+
+def iter_ndjson(queryset):
+    """Yield one JSON object per line, a few hundred lines at a time."""
+    batch = []
+    for story in iter_story_json(queryset):
+        batch.append(story + '\n')
+        if len(batch) == STREAM_CHUNK_ROWS:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+async def aiter_story_json(queryset):
+    # QuerySet.aiterator() starts values_list() queries on the event loop
+    # thread, which Django refuses, so chunks are pulled through
+    # sync_to_async by hand; sync_to_async is thread-sensitive, so every
+    # chunk reads from the same connection and cursor.
+    rows = story_rows(queryset).iterator(chunk_size=STREAM_FETCH_SIZE)
+    fetch = sync_to_async(lambda: list(islice(rows, STREAM_FETCH_SIZE)))
+    while True:
+        chunk = await fetch()
+        for row in chunk:
+            yield story_json(row)
+        if len(chunk) < STREAM_FETCH_SIZE:
+            return
+
+
+async def aiter_json(queryset):
+    """``iter_json`` for async views."""
+    yield '{"stories": ['
+    batch = []
+    first = True
+    async for story in aiter_story_json(queryset):
+        batch.append(story)
+        if len(batch) == STREAM_CHUNK_ROWS:
+            yield ('' if first else ', ') + ', '.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ('' if first else ', ') + ', '.join(batch)
+    yield ']}'
+
+
+async def aiter_ndjson(queryset):
+    """``iter_ndjson`` for async views."""
+    batch = []
+    async for story in aiter_story_json(queryset):
+        batch.append(story + '\n')
+        if len(batch) == STREAM_CHUNK_ROWS:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
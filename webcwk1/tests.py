@@ -1,3 +1,1109 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import include, path
+from django.utils import timezone
+
+import client
+from cwk1.backend import failed_logins
+from cwk1.compression import CompressionMiddleware, choose_encoding
+from cwk1.hashers import password_hashers
+from cwk1.metrics import request_metrics
+from cwk1.negotiation import header_weights
+from cwk1.tokens import clear_author_cache, issue_token
+
+from . import async_views, compact
+from .cache import GENERATION_KEY, bump_generation, cache_stats
+from .models import Author, NewsStory, StoryChange, StoryQueueCheckpoint
+from .queries import delete_in_chunks
+from .retention import retention_days
+from .urls import story_urlpatterns
+from .writebehind import StoryWriteQueue
+
+
+class StoryTestCase(TestCase):
+    # The listing, token author and failed login caches outlive each test's
+    # rolled-back transaction.
+    def setUp(self):
+        caches['stories'].clear()
+        clear_author_cache()
+        failed_logins.clear()
+
+
+def make_author(username='author', password='secret'):
+    author = Author(username=username, name=username.title())
+    author.set_password(password)
+    author.save()
+    return author
+
+
+def make_stories(author, count, category='pol', region='uk'):
+    return NewsStory.objects.bulk_create([
+        NewsStory(headline=f'Headline {i}', category=category, region=region, author=author,
+                  details=f'Details {i}')
+        for i in range(count)
+    ])
+
+
+class StoryListQueryTests(StoryTestCase):
+    def test_query_count_is_constant(self):
+        authors = [make_author(f'author{i}') for i in range(5)]
+        for count in (1, 50, 500):
+            NewsStory.objects.all().delete()
+            caches['stories'].clear()
+            for author in authors:
+                make_stories(author, count // len(authors) or 1)
+            # The change log revision for the ETag, one SELECT for the rows.
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/stories', {'story_cat': '*', 'story_region': '*',
+                                                            'story_date': '*'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_payload_includes_author_username(self):
+        author = make_author('alice')
+        story = make_stories(author, 1, category='tech', region='eu')[0]
+        response = self.client.get('/api/stories')
+        self.assertEqual(response.json(), {'stories': [{
+            'key': str(story.pk),
+            'headline': 'Headline 0',
+            'story_cat': 'tech',
+            'story_region': 'eu',
+            'author': 'alice',
+            'story_date': story.date.strftime('%Y-%m-%d'),
+            'story_details': 'Details 0',
+        }]})
+
+    def test_empty_result_is_404_in_fixed_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/stories', {'story_cat': 'art'})
+        self.assertEqual(response.status_code, 404)
+
+
+class AuthorUsernameTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author('alice')
+        make_stories(self.author, 3)
+
+    def usernames(self):
+        return set(NewsStory.objects.values_list('author_username', flat=True))
+
+    def test_listing_reads_only_the_story_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/stories')
+        self.assertEqual({story['author'] for story in response.json()['stories']}, {'alice'})
+        self.assertTrue(all('webcwk1_author' not in query['sql'] for query in queries))
+
+    def test_rename_is_carried_over(self):
+        self.client.get('/api/stories')
+        self.author.username = 'bob'
+        self.author.save()
+        self.assertEqual(self.usernames(), {'bob'})
+        response = self.client.get('/api/stories')
+        self.assertEqual({story['author'] for story in response.json()['stories']}, {'bob'})
+
+    def test_backfill(self):
+        module = __import__('webcwk1.migrations.0005_newsstory_author_username', fromlist=['*'])
+        NewsStory.objects.update(author_username='')
+        module.backfill_author_username(apps, None)
+        self.assertEqual(self.usernames(), {'alice'})
+
+    def test_checker_reports_and_fixes_stale_rows(self):
+        call_command('check_author_usernames', stdout=io.StringIO())
+        NewsStory.objects.filter(pk=NewsStory.objects.first().pk).update(author_username=None)
+        with self.assertRaises(CommandError):
+            call_command('check_author_usernames', stdout=io.StringIO())
+        # QuerySet.update() skips the post_save signal.
+        Author.objects.filter(pk=self.author.pk).update(username='carol')
+        with self.assertRaises(CommandError):
+            call_command('check_author_usernames', stdout=io.StringIO())
+        call_command('check_author_usernames', '--fix', stdout=io.StringIO())
+        self.assertEqual(self.usernames(), {'carol'})
+
+
+class StoryFragmentTests(StoryTestCase):
+    def test_fragment_is_rendered_on_insert(self):
+        story = make_stories(make_author('alice'), 1)[0]
+        story.refresh_from_db()
+        self.assertEqual(json.loads(story.fragment), {
+            'headline': 'Headline 0', 'story_cat': 'pol', 'story_region': 'uk', 'author': 'alice',
+            'story_date': story.date.strftime('%Y-%m-%d'), 'story_details': 'Details 0',
+        })
+
+    def test_edit_is_rendered(self):
+        story = make_stories(make_author('alice'), 1)[0]
+        story.headline = 'Edited'
+        story.category = 'art'
+        story.save()
+        listing = self.client.get('/api/stories').json()['stories']
+        self.assertEqual((listing[0]['headline'], listing[0]['story_cat']), ('Edited', 'art'))
+        columns = self.client.get('/api/stories', {'format': 'columns'}).json()['columns']
+        self.assertEqual(columns['headline'], ['Edited'])
+        self.assertEqual(self.client.get('/api/stories', {'q': 'Edited'}).status_code, 200)
+
+    def test_moving_a_story_to_another_author(self):
+        story = make_stories(make_author('alice'), 1)[0]
+        story.author = make_author('bob')
+        story.save(update_fields=['author'])
+        story.refresh_from_db()
+        self.assertEqual(story.author_username, 'bob')
+        self.assertEqual(json.loads(story.fragment)['author'], 'bob')
+
+    def test_missing_fragment_is_rendered_by_the_query(self):
+        make_stories(make_author('alice'), 2)
+        expected = self.client.get('/api/stories').json()
+        NewsStory.objects.update(fragment=None)
+        caches['stories'].clear()
+        self.assertEqual(self.client.get('/api/stories').json(), expected)
+        streamed = self.client.get('/api/stories', {'stream': '1'})
+        self.assertEqual(json.loads(b''.join(streamed.streaming_content)), expected)
+
+    def test_migration_renders_with_its_own_copy(self):
+        module = __import__('webcwk1.migrations.0006_newsstory_fragment', fromlist=['*'])
+        make_stories(make_author('alice'), 2)
+        expected = self.client.get('/api/stories').json()
+        NewsStory.objects.update(fragment=None)
+        module.render_fragments(apps, mock.Mock(connection=connection))
+        self.assertFalse(NewsStory.objects.filter(fragment=None).exists())
+        self.assertEqual(self.client.get('/api/stories').json(), expected)
+
+    def test_rebuild_command(self):
+        make_stories(make_author(), 3)
+        expected = self.client.get('/api/stories').json()
+        NewsStory.objects.update(fragment=None)
+        out = io.StringIO()
+        call_command('rebuild_story_fragments', '--missing', '--batch-size', '2', stdout=out)
+        self.assertIn('Rendered 3 story fragments', out.getvalue())
+        self.assertEqual(self.client.get('/api/stories').json(), expected)
+
+
+class StoryPaginationTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author()
+        make_stories(self.author, 25)
+
+    def test_unpaginated_shape_is_unchanged(self):
+        body = self.client.get('/api/stories').json()
+        self.assertEqual(list(body), ['stories'])
+        self.assertEqual(len(body['stories']), 25)
+
+    def test_cursor_walks_every_story_once_newest_first(self):
+        keys = []
+        params = {'limit': 10}
+        while True:
+            body = self.client.get('/api/stories', params).json()
+            self.assertLessEqual(len(body['stories']), 10)
+            keys.extend(int(story['key']) for story in body['stories'])
+            if body['next'] is None:
+                break
+            params['cursor'] = body['next']
+        expected = list(NewsStory.objects.order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(keys, expected)
+
+    def test_invalid_limit_and_cursor_are_rejected(self):
+        self.assertEqual(self.client.get('/api/stories', {'limit': 'ten'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/stories', {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/api/stories', {'cursor': 'garbage'}).status_code, 400)
+
+
+class StoryStreamingTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        make_stories(make_author(), 1203)
+
+    def test_stream_matches_buffered_listing(self):
+        buffered = self.client.get('/api/stories').json()
+        response = self.client.get('/api/stories', {'stream': '1'})
+        self.assertTrue(response.streaming)
+        streamed = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(streamed, buffered)
+
+    def test_ndjson_stream_has_one_story_per_line(self):
+        response = self.client.get('/api/stories', HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 1203)
+        self.assertEqual(set(json.loads(lines[0])), {'key', 'headline', 'story_cat', 'story_region',
+                                                     'author', 'story_date', 'story_details'})
+
+    def test_ndjson_refused_with_q_0_is_not_streamed(self):
+        response = self.client.get('/api/stories', HTTP_ACCEPT='application/x-ndjson;q=0, application/json')
+        self.assertFalse(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_empty_stream_is_an_empty_listing(self):
+        response = self.client.get('/api/stories', {'stream': '1', 'story_cat': 'art'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), {'stories': []})
+
+    def test_stream_rejects_limit_and_cursor(self):
+        self.assertEqual(self.client.get('/api/stories', {'stream': '1', 'limit': '5'}).status_code, 400)
+        response = self.client.get('/api/stories', {'cursor': 'abc'}, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+
+class StoryCacheTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author(password='secret')
+        make_stories(self.author, 3)
+        self.client.login(username='author', password='secret')
+
+    def listing_keys(self, **params):
+        return [story['key'] for story in self.client.get('/api/stories', params).json()['stories']]
+
+    def test_repeat_read_is_served_from_cache(self):
+        before = cache_stats()
+        self.listing_keys()
+        # Only the change log revision, which keys the cache, is read.
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/stories')
+        self.assertEqual(response.status_code, 200)
+        after = cache_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_read_after_post_is_fresh(self):
+        self.assertEqual(len(self.listing_keys()), 3)
+        response = self.client.post('/api/stories', {'headline': 'New', 'category': 'pol', 'region': 'uk',
+                                                      'details': 'Fresh'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.listing_keys()), 4)
+
+    def test_read_after_delete_is_fresh(self):
+        keys = self.listing_keys(limit=10)
+        response = self.client.delete(f'/api/stories/{keys[0]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(keys[0], self.listing_keys(limit=10))
+
+    def test_write_from_another_process_is_fresh(self):
+        # A cron job or another worker can't bump this process's generation.
+        keys = self.listing_keys()
+        NewsStory.objects.filter(pk=keys[0]).delete()
+        self.assertNotIn(keys[0], self.listing_keys())
+
+    def test_evicted_generation_never_reuses_old_entries(self):
+        self.listing_keys()
+        NewsStory.objects.all().delete()
+        bump_generation()
+        caches['stories'].delete(GENERATION_KEY)
+        self.assertEqual(self.client.get('/api/stories').status_code, 404)
+
+
+class StoryConditionalGetTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author(password='secret')
+        make_stories(self.author, 3)
+
+    def backdate_changes(self):
+        StoryChange.objects.update(changed_at=timezone.now() - timedelta(minutes=1))
+        caches['stories'].clear()
+
+    def test_matching_etag_is_not_modified_without_reading_rows(self):
+        response = self.client.get('/api/stories')
+        etag = response['ETag']
+        caches['stories'].clear()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/stories', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_is_not_modified(self):
+        self.backdate_changes()
+        last_modified = self.client.get('/api/stories')['Last-Modified']
+        response = self.client.get('/api/stories', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_sees_a_delete(self):
+        self.backdate_changes()
+        last_modified = self.client.get('/api/stories')['Last-Modified']
+        NewsStory.objects.order_by('date').first().delete()
+        StoryChange.objects.filter(action=StoryChange.DELETE).update(changed_at=timezone.now() - timedelta(seconds=30))
+        caches['stories'].clear()
+        response = self.client.get('/api/stories', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['stories']), 2)
+
+    def test_no_last_modified_within_the_second_of_a_write(self):
+        # A story posted later in the same second would share the date.
+        response = self.client.get('/api/stories')
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_etag_changes_after_a_rename(self):
+        response = self.client.get('/api/stories')
+        self.assertEqual({story['author'] for story in response.json()['stories']}, {'author'})
+        self.author.username = 'renamed'
+        self.author.save()
+        response = self.client.get('/api/stories', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({story['author'] for story in response.json()['stories']}, {'renamed'})
+
+    def test_etag_changes_after_a_write(self):
+        etag = self.client.get('/api/stories')['ETag']
+        story = NewsStory.objects.first()
+        self.client.login(username='author', password='secret')
+        self.client.delete(f'/api/stories/{story.pk}')
+        response = self.client.get('/api/stories', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_filters(self):
+        first = self.client.get('/api/stories', {'limit': 2})['ETag']
+        self.assertNotEqual(first, self.client.get('/api/stories')['ETag'])
+
+
+class StoryBatchTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author(password='secret')
+        self.client.login(username='author', password='secret')
+
+    def story(self, **overrides):
+        return dict({'headline': 'Wire', 'category': 'pol', 'region': 'uk', 'details': 'From the wire'},
+                    **overrides)
+
+    def test_json_array_reports_each_item(self):
+        items = [self.story(), self.story(region='mars'), self.story(headline='Second')]
+        response = self.client.post('/api/stories/batch', items, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (2, 1))
+        self.assertEqual([r['status'] for r in body['results']], ['created', 'error', 'created'])
+        self.assertEqual(body['results'][1]['error'], 'Invalid region')
+        stored = NewsStory.objects.get(pk=body['results'][2]['key'])
+        self.assertEqual((stored.headline, stored.author), ('Second', self.author))
+
+    def test_ndjson_body(self):
+        lines = [json.dumps(self.story()), 'not json', json.dumps(self.story(category='art'))]
+        response = self.client.post('/api/stories/batch', '\n'.join(lines) + '\n',
+                                    content_type='application/x-ndjson')
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (2, 1))
+        self.assertEqual(body['results'][1], {'index': 1, 'status': 'error', 'error': 'Invalid JSON'})
+        self.assertEqual(NewsStory.objects.count(), 2)
+
+    def test_batch_invalidates_listing_cache(self):
+        self.assertEqual(self.client.get('/api/stories').status_code, 404)
+        self.client.post('/api/stories/batch', [self.story()], content_type='application/json')
+        self.assertEqual(len(self.client.get('/api/stories').json()['stories']), 1)
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.post('/api/stories/batch', [self.story()], content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(NewsStory.objects.exists())
+
+
+class BulkDeleteTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author('alice')
+        self.other = make_author('bob')
+        self.client.force_login(self.author)
+
+    def delete(self, body):
+        return self.client.post('/api/stories/delete', body, content_type='application/json')
+
+    def test_keys_only_delete_own_stories(self):
+        mine = make_stories(self.author, 3)
+        theirs = make_stories(self.other, 1)
+        response = self.delete({'keys': [mine[0].pk, str(mine[1].pk), theirs[0].pk, 999999]})
+        self.assertEqual(response.json(), {'deleted': 2, 'not_found': 2})
+        self.assertEqual(set(NewsStory.objects.values_list('pk', flat=True)), {mine[2].pk, theirs[0].pk})
+
+    def test_filter(self):
+        old = make_stories(self.author, 3, category='art')
+        make_stories(self.author, 2, category='pol')
+        make_stories(self.other, 2, category='art')
+        NewsStory.objects.filter(pk__in=[story.pk for story in old]).update(date='2020-01-01T00:00:00Z')
+        make_stories(self.author, 1, category='art')
+        response = self.delete({'filter': {'category': 'art', 'before': '01/01/2021'}})
+        self.assertEqual(response.json(), {'deleted': 3})
+        self.assertEqual(NewsStory.objects.count(), 5)
+        self.assertEqual(self.delete({'filter': {'author': 'alice'}}).json(), {'deleted': 3})
+        self.assertEqual(set(NewsStory.objects.values_list('author_username', flat=True)), {'bob'})
+
+    def test_other_authors_need_staff(self):
+        make_stories(self.other, 2)
+        self.assertEqual(self.delete({'filter': {'author': 'bob'}}).status_code, 403)
+        Author.objects.filter(pk=self.author.pk).update(is_staff=True)
+        self.assertEqual(self.delete({'filter': {'author': 'bob'}}).json(), {'deleted': 2})
+
+    def test_invalid_requests(self):
+        make_stories(self.author, 1)
+        for body in ({}, {'filter': {}}, {'keys': [1], 'filter': {'category': 'pol'}}, {'keys': 'all'},
+                     {'filter': {'before': '2020-01-01'}}, {'filter': {'region': 'uk'}}):
+            self.assertEqual(self.delete(body).status_code, 400, body)
+        self.assertEqual(NewsStory.objects.count(), 1)
+
+    def test_deletes_in_chunks(self):
+        make_stories(self.author, 5)
+        with self.assertNumQueries(6):  # three chunks of (SELECT keys, DELETE); the short one is the last
+            self.assertEqual(delete_in_chunks(NewsStory.objects.all(), chunk_size=2), 5)
+        self.assertFalse(NewsStory.objects.exists())
+
+
+class StoryChangeFeedTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author('alice')
+
+    def changes(self, since=None, limit=None):
+        params = {key: value for key, value in (('since', since), ('limit', limit)) if value is not None}
+        return self.client.get('/api/stories/changes', params)
+
+    def test_adds_updates_and_tombstones(self):
+        start = self.changes().json()['next']
+        stories = make_stories(self.author, 3)
+        keys = [str(story.pk) for story in stories]
+        body = self.changes(start).json()
+        self.assertEqual([story['key'] for story in body['stories']], keys)
+        self.assertEqual(body['stories'][0]['author'], 'alice')
+        self.assertEqual((body['deleted'], body['more']), ([], False))
+
+        cursor = body['next']
+        stories[0].delete()
+        Author.objects.filter(pk=self.author.pk).update(username='alicia')
+        self.author.refresh_from_db()
+        self.author.save(update_fields=['username'])
+        body = self.changes(cursor).json()
+        self.assertEqual(body['deleted'], keys[:1])
+        self.assertEqual([story['author'] for story in body['stories']], ['alicia', 'alicia'])
+        self.assertEqual(self.changes(body['next']).json(),
+                         {'stories': [], 'deleted': [], 'next': body['next'], 'more': False})
+
+    def test_pages_and_skips_stories_deleted_since(self):
+        start = self.changes().json()['next']
+        stories = make_stories(self.author, 5)
+        keys = [str(story.pk) for story in stories]
+        stories[1].delete()
+        body = self.changes(start, limit=2).json()
+        self.assertEqual([story['key'] for story in body['stories']], keys[:1])
+        self.assertTrue(body['more'])
+        body = self.changes(body['next'], limit=10).json()
+        self.assertEqual([story['key'] for story in body['stories']], keys[2:])
+        self.assertEqual((body['deleted'], body['more']), (keys[1:2], False))
+
+    def test_edits_are_logged(self):
+        story = make_stories(self.author, 1)[0]
+        cursor = self.changes().json()['next']
+        story.headline = 'Edited'
+        story.save()
+        body = self.changes(cursor).json()
+        self.assertEqual([s['headline'] for s in body['stories']], ['Edited'])
+        # A bulk update that skips re-rendering is still logged.
+        NewsStory.objects.filter(pk=story.pk).update(category='art')
+        self.assertEqual(len(self.changes(body['next']).json()['stories']), 1)
+
+    def test_trimmed_log_still_starts_from_zero(self):
+        stories = make_stories(self.author, 3)
+        keys = [str(story.pk) for story in stories]
+        stale_cursor = self.changes().json()['next']
+        stories[0].headline = 'Edited'
+        stories[0].save()
+        stories[1].delete()
+        cursor = self.changes().json()['next']
+        StoryChange.objects.update(changed_at=timezone.now() - timedelta(days=60))
+        newest = make_stories(self.author, 1)[0]
+
+        out = io.StringIO()
+        call_command('prune_stories', '--json', stdout=out)
+        # The superseded adds of the edited and deleted stories, and the tombstone.
+        self.assertEqual(json.loads(out.getvalue())['changes_trimmed'], 3)
+        body = self.changes().json()
+        self.assertEqual([story['key'] for story in body['stories']], [keys[0], keys[2], str(newest.pk)])
+        self.assertEqual(body['stories'][0]['headline'], 'Edited')
+        self.assertEqual(self.changes(stale_cursor).status_code, 400)
+        self.assertEqual([story['key'] for story in self.changes(cursor).json()['stories']], [str(newest.pk)])
+
+    def test_invalid_cursors(self):
+        for since in ('-1', 'abc', '999999'):
+            self.assertEqual(self.changes(since).status_code, 400, since)
+
+
+@override_settings(STORY_RETENTION={('trivia', '*'): 30, ('trivia', 'uk'): None, ('*', 'w'): 365})
+class RetentionTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        author = make_author()
+        self.old = {}
+        for category, region in (('trivia', 'eu'), ('trivia', 'uk'), ('pol', 'eu'), ('pol', 'w')):
+            self.old[category, region] = make_stories(author, 2, category=category, region=region)
+            NewsStory.objects.filter(category=category, region=region).update(date='2020-01-01T00:00:00Z')
+        make_stories(author, 1, category='trivia', region='eu')
+
+    def remaining(self):
+        return sorted(NewsStory.objects.values_list('category', 'region').distinct())
+
+    def test_most_specific_rule_wins(self):
+        self.assertEqual(retention_days('trivia', 'eu'), 30)
+        self.assertIsNone(retention_days('trivia', 'uk'))
+        self.assertEqual(retention_days('pol', 'w'), 365)
+        self.assertIsNone(retention_days('pol', 'eu'))
+
+    def test_dry_run_deletes_nothing(self):
+        out = io.StringIO()
+        call_command('prune_stories', '--dry-run', '--json', stdout=out)
+        metrics = json.loads(out.getvalue())
+        self.assertEqual(metrics['deleted'], 4)
+        self.assertEqual(NewsStory.objects.count(), 9)
+
+    def test_prune(self):
+        out = io.StringIO()
+        call_command('prune_stories', '--batch-size', '1', '--sleep', '0', '--json', stdout=out)
+        metrics = json.loads(out.getvalue())
+        self.assertEqual(metrics['deleted'], 4)
+        by_rule = {(rule['category'], rule['region']): rule['stories'] for rule in metrics['rules']}
+        self.assertEqual((by_rule['trivia', 'eu'], by_rule['pol', 'w']), (2, 2))
+        self.assertEqual(NewsStory.objects.count(), 5)
+        self.assertEqual(self.remaining(), [('pol', 'eu'), ('trivia', 'eu'), ('trivia', 'uk')])
+
+    def test_vacuum_needs_incremental_auto_vacuum(self):
+        out = io.StringIO()
+        call_command('prune_stories', '--sleep', '0', '--vacuum', stdout=out)
+        self.assertIn('Skipped VACUUM: auto_vacuum is not INCREMENTAL', out.getvalue())
+
+
+class RequestMetricsTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        request_metrics.reset()
+        make_stories(make_author(), 3)
+
+    def metrics(self):
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_are_recorded_per_view(self):
+        listing = self.client.get('/api/stories')
+        missing = self.client.get('/api/stories', {'story_cat': 'art'})
+        self.client.get('/api/nowhere')
+        text = self.metrics()
+        self.assertIn('cwk1_requests_total{view="post_story",status="200"} 1', text)
+        self.assertIn('cwk1_requests_total{view="post_story",status="404"} 1', text)
+        self.assertIn('cwk1_requests_total{view="unmatched",status="404"} 1', text)
+        self.assertIn('cwk1_request_db_queries_sum{view="post_story"} 4', text)
+        self.assertIn('cwk1_request_duration_seconds_bucket{view="post_story",le="+Inf"} 2', text)
+        self.assertIn(f'cwk1_response_size_bytes_sum{{view="post_story"}} {len(listing.content) + len(missing.content)}', text)
+        self.assertIn('cwk1_story_cache_events_total{event="misses"}', text)
+
+    def test_streamed_responses_are_recorded_when_finished(self):
+        response = self.client.get('/api/stories', headers={'Accept': 'application/x-ndjson'})
+        self.assertNotIn('view="post_story"', self.metrics())
+        body = b''.join(response.streaming_content)
+        text = self.metrics()
+        self.assertIn(f'cwk1_response_size_bytes_sum{{view="post_story"}} {len(body)}', text)
+        self.assertIn('cwk1_request_db_queries_sum{view="post_story"} 2', text)
+
+    @override_settings(SLOW_REQUEST_SECONDS=0)
+    def test_slow_request_log_includes_sql(self):
+        with self.assertLogs('cwk1.metrics', 'WARNING') as logs:
+            self.client.get('/api/stories')
+        self.assertIn('Slow request: GET /api/stories', logs.output[0])
+        self.assertIn('FROM "webcwk1_newsstory"', logs.output[0])
+
+
+class CompressionTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        make_stories(make_author(), 30)
+
+    def get(self, params=None, **headers):
+        return self.client.get('/api/stories', params, headers={'Accept-Encoding': 'gzip', **headers})
+
+    def test_listing_is_gzipped(self):
+        plain = self.client.get('/api/stories')
+        response = self.get()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        self.assertEqual(self.get(**{'If-None-Match': response['ETag']}).status_code, 304)
+
+    def test_small_and_unaccepted_responses_are_left_alone(self):
+        self.assertFalse(self.get({'limit': 1}).has_header('Content-Encoding'))
+        self.assertFalse(self.client.get('/api/stories').has_header('Content-Encoding'))
+        self.assertFalse(self.get(**{'Accept-Encoding': 'gzip;q=0, identity'}).has_header('Content-Encoding'))
+
+    def test_streams_are_compressed(self):
+        for params, headers in (({'stream': '1'}, {}), (None, {'Accept': 'application/x-ndjson'})):
+            plain = b''.join(self.client.get('/api/stories', params, headers=headers).streaming_content)
+            response = self.get(params, **headers)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    async def test_async_streams_are_compressed(self):
+        async def body():
+            for i in range(3):
+                yield f'{{"n": {i}}}\n'
+
+        async def get_response(request):
+            return StreamingHttpResponse(body(), content_type='application/x-ndjson')
+
+        request = RequestFactory().get('/', headers={'Accept-Encoding': 'gzip'})
+        response = await CompressionMiddleware(get_response)(request)
+        chunks = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(gzip.decompress(chunks), b'{"n": 0}\n{"n": 1}\n{"n": 2}\n')
+
+    def test_choose_encoding(self):
+        codecs = {'zstd': None, 'br': None, 'gzip': None}
+        self.assertEqual(choose_encoding('gzip, deflate, br, zstd', codecs), 'zstd')
+        self.assertEqual(choose_encoding('gzip;q=1.0, br;q=0.5', codecs), 'gzip')
+        self.assertEqual(choose_encoding('*;q=0.1, zstd;q=0', codecs), 'br')
+        self.assertIsNone(choose_encoding('identity', codecs))
+        self.assertIsNone(choose_encoding('', codecs))
+
+    def test_header_weights(self):
+        self.assertEqual(header_weights('Application/JSON ; Q=0.5, text/html,, x;q=nope'),
+                         {'application/json': 0.5, 'text/html': 1.0, 'x': 0.0})
+
+
+class CompactFormatTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        make_stories(make_author('alice'), 3, category='art')
+        make_stories(make_author('bob'), 2, region='eu')
+
+    def expand(self, columns):
+        def values(column):
+            return [column['values'][code] for code in column['codes']] if isinstance(column, dict) else column
+        fields = ('headline', 'story_cat', 'story_region', 'author', 'story_date', 'story_details')
+        return [{'key': str(key), **dict(zip(fields, story))}
+                for key, *story in zip(columns['key'], *(values(columns[field]) for field in fields))]
+
+    def test_columns_match_json(self):
+        expected = self.client.get('/api/stories').json()['stories']
+        response = self.client.get('/api/stories', {'format': 'columns'})
+        self.assertEqual(response['Content-Type'], compact.COLUMNS_CONTENT_TYPE)
+        self.assertIn('Accept', response['Vary'])
+        body = response.json()
+        self.assertEqual(body['count'], 5)
+        self.assertEqual(body['columns']['author']['values'], ['bob', 'alice'])
+        self.assertEqual(self.expand(body['columns']), expected)
+
+    def test_columns_pages(self):
+        headers = {'Accept': compact.COLUMNS_CONTENT_TYPE}
+        first = self.client.get('/api/stories', {'limit': 3}, headers=headers).json()
+        second = self.client.get('/api/stories', {'limit': 3, 'cursor': first['next']}, headers=headers).json()
+        self.assertEqual((first['count'], second['count'], second['next']), (3, 2, None))
+        expected = self.client.get('/api/stories').json()['stories']
+        self.assertEqual(self.expand(first['columns']) + self.expand(second['columns']), expected)
+
+    @skipIf(compact.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        response = self.client.get('/api/stories', headers={'Accept': 'application/msgpack'})
+        self.assertEqual(response['Content-Type'], compact.MSGPACK_CONTENT_TYPE)
+        expected = self.client.get('/api/stories', {'format': 'columns'}).json()
+        self.assertEqual(compact.msgpack.unpackb(response.content), expected)
+
+    def test_accept_weights_are_honoured(self):
+        factory = RequestFactory()
+        cases = [
+            (f'{compact.COLUMNS_CONTENT_TYPE}', 'columns'),
+            (f'{compact.COLUMNS_CONTENT_TYPE};q=0', 'json'),
+            ('application/msgpack;q=0', 'json'),
+            (f'application/json, {compact.COLUMNS_CONTENT_TYPE};q=0.5', 'json'),
+            (f'application/json;q=0.8, {compact.COLUMNS_CONTENT_TYPE};q=0.9', 'columns'),
+            ('text/html, */*;q=0.8', 'json'),
+        ]
+        for accept, expected in cases:
+            request = factory.get('/api/stories', HTTP_ACCEPT=accept)
+            self.assertEqual(compact.requested_format(request), expected, accept)
+
+    def test_invalid_requests(self):
+        for params in ({'format': 'xml'}, {'format': 'columns', 'stream': '1'}):
+            self.assertEqual(self.client.get('/api/stories', params).status_code, 400, params)
+        self.assertEqual(self.client.get('/api/stories', {'format': 'columns', 'story_cat': 'tech'}).status_code, 404)
+
+
+class ClientNewsTests(TestCase):
+    def response(self, content_type, content):
+        response = mock.Mock(status_code=200, headers={'Content-Type': content_type}, content=content)
+        response.json.side_effect = lambda: json.loads(content)
+        return response
+
+    def test_undecodable_agency_is_reported_not_waited_for(self):
+        responses = {
+            'http://good': self.response('application/json', b'{"stories": [{"key": "1"}]}'),
+            'http://columns': self.response(client.COLUMNS_CONTENT_TYPE, b'{"count": 1}'),
+            'http://garbled': self.response('application/json', b'<html>'),
+        }
+        if client.msgpack:
+            responses['http://msgpack'] = self.response(client.MSGPACK_CONTENT_TYPE, b'\xc1')
+        news = client.Client()
+        news.session.get = lambda url, **kwargs: responses[url.rsplit('/api/', 1)[0]]
+        agencies = [{'url': url} for url in responses]
+        params = {'cat': '*', 'reg': '*', 'date': '*'}
+        with mock.patch.object(client, 'NEWS_DEADLINE', 5):
+            results = {agency['url']: (stories, error)
+                       for agency, stories, error in news.fetch_news_concurrently(agencies, params)}
+        self.assertEqual(results.pop('http://good'), ([{'key': '1'}], None))
+        for url, (stories, error) in results.items():
+            self.assertIsNone(stories)
+            self.assertTrue(error.startswith(f'Could not read stories from {url}: '), error)
+
+
+class BearerTokenTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author(password='secret')
+
+    def story(self):
+        return {'headline': 'Token', 'category': 'pol', 'region': 'uk', 'details': 'Posted with a token'}
+
+    def login_for_token(self):
+        response = self.client.post('/api/login', {'username': 'author', 'password': 'secret', 'token': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('sessionid', response.cookies)
+        return response.json()['token']
+
+    def test_token_login_and_post_without_session(self):
+        token = self.login_for_token()
+        response = self.client.post('/api/stories', self.story(), content_type='application/json',
+                                    HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(NewsStory.objects.get().author, self.author)
+
+    def test_resolved_author_is_cached(self):
+        token = self.login_for_token()
+        self.client.post('/api/stories', self.story(), content_type='application/json',
+                         HTTP_AUTHORIZATION=f'Bearer {token}')
+        # Only the INSERT: no session read and no Author lookup.
+        with self.assertNumQueries(1):
+            self.client.post('/api/stories', self.story(), content_type='application/json',
+                             HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_tampered_token_is_anonymous(self):
+        token = self.login_for_token()
+        response = self.client.post('/api/stories', self.story(), content_type='application/json',
+                                    HTTP_AUTHORIZATION=f'Bearer {token[:-1]}x')
+        self.assertEqual(response.status_code, 503)
+
+    @override_settings(AUTH_TOKEN_MAX_AGE=-1)
+    def test_expired_token_is_anonymous(self):
+        response = self.client.post('/api/stories', self.story(), content_type='application/json',
+                                    HTTP_AUTHORIZATION=f'Bearer {issue_token(self.author)}')
+        self.assertEqual(response.status_code, 503)
+
+    def test_cookie_login_still_works(self):
+        response = self.client.post('/api/login', {'username': 'author', 'password': 'secret'})
+        self.assertEqual(response.content, b'Login successful')
+        response = self.client.post('/api/stories', self.story(), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+
+class LoginHashingTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author(password='secret')
+
+    def login(self, password):
+        return self.client.post('/api/login', {'username': 'author', 'password': password})
+
+    @override_settings(PASSWORD_HASHERS=password_hashers('scrypt'),
+                       PASSWORD_HASH_COST={'scrypt_work_factor': 2 ** 10})
+    def test_login_rehashes_under_new_policy(self):
+        self.assertTrue(self.author.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.login('secret').status_code, 200)
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.password.startswith('scrypt$1024$'))
+
+    @override_settings(PASSWORD_HASH_COST={'pbkdf2_iterations': 1000})
+    def test_login_rehashes_when_cost_changes(self):
+        self.assertEqual(self.login('secret').status_code, 200)
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_repeated_bad_password_is_rejected_without_hashing(self):
+        with mock.patch.object(Author, 'check_password', autospec=True,
+                               side_effect=Author.check_password) as check_password:
+            self.assertEqual(self.login('wrong').status_code, 401)
+            self.assertEqual(self.login('wrong').status_code, 401)
+            self.assertEqual(check_password.call_count, 1)
+            self.assertEqual(self.login('secret').status_code, 200)
+            self.assertEqual(check_password.call_count, 2)
+
+    def test_repeated_unknown_username_is_rejected_without_hashing(self):
+        with mock.patch.object(Author, 'set_password', autospec=True,
+                               side_effect=Author.set_password) as set_password:
+            for _ in range(3):
+                response = self.client.post('/api/login', {'username': 'nobody', 'password': 'secret'})
+                self.assertEqual(response.status_code, 401)
+            self.assertEqual(set_password.call_count, 1)
+        make_author('nobody', 'secret')
+        response = self.client.post('/api/login', {'username': 'nobody', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_password_change_forgets_failures(self):
+        self.assertEqual(self.login('newpass').status_code, 401)
+        self.author.set_password('newpass')
+        self.author.save()
+        self.assertEqual(self.login('newpass').status_code, 200)
+
+
+class StorySearchTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        author = make_author()
+        self.stories = NewsStory.objects.bulk_create([
+            NewsStory(headline='Election results', category='pol', region='uk', author=author,
+                      details='Votes counted overnight'),
+            NewsStory(headline='Gallery opening', category='art', region='uk', author=author,
+                      details='An election themed exhibition'),
+            NewsStory(headline='Election election', category='pol', region='eu', author=author,
+                      details='Election called'),
+            NewsStory(headline='Chip launch', category='tech', region='w', author=author,
+                      details='Faster silicon'),
+        ])
+
+    def headlines(self, **params):
+        response = self.client.get('/api/stories', params)
+        if response.status_code == 404:
+            return []
+        return [story['headline'] for story in response.json()['stories']]
+
+    def test_results_are_ranked(self):
+        self.assertEqual(self.headlines(q='election'),
+                         ['Election election', 'Election results', 'Gallery opening'])
+
+    def test_filters_still_apply(self):
+        self.assertEqual(self.headlines(q='election', story_cat='pol', story_region='uk'), ['Election results'])
+        self.assertEqual(self.headlines(q='election', limit=1), ['Election election'])
+
+    def test_index_follows_deletes(self):
+        self.stories[2].delete()
+        self.assertEqual(self.headlines(q='called'), [])
+
+    def test_query_syntax_is_treated_as_text(self):
+        # '-' would be NOT in FTS5 syntax; here it is just punctuation.
+        self.assertEqual(self.headlines(q='"chip -launch'), ['Chip launch'])
+        self.assertEqual(self.client.get('/api/stories', {'q': 'NEAR( AND'}).status_code, 404)
+
+    def test_cursor_is_rejected_with_search(self):
+        self.assertEqual(self.client.get('/api/stories', {'q': 'election', 'cursor': 'x'}).status_code, 400)
+
+
+# Serves the story endpoints from async_views, as STORIES_ASYNC_VIEWS does.
+urlpatterns = [path('api/', include(story_urlpatterns(async_views)))]
+
+
+@override_settings(ROOT_URLCONF='webcwk1.tests')
+class AsyncStoryViewTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author(password='secret')
+        make_stories(self.author, 5)
+        self.token = issue_token(self.author)
+
+    async def test_list_matches_sync_view(self):
+        response = await self.async_client.get('/api/stories', {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertEqual(len(body['stories']), 2)
+        self.assertIsNotNone(body['next'])
+        etag = response['ETag']
+        response = await self.async_client.get('/api/stories', {'limit': 2}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_stream(self):
+        response = await self.async_client.get('/api/stories', headers={'Accept': 'application/x-ndjson'})
+        lines = b''.join([chunk async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual(len(lines), 5)
+
+    async def test_post_and_delete_with_token(self):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        response = await self.async_client.post('/api/stories', {'headline': 'Async', 'category': 'art',
+                                                                  'region': 'eu', 'details': 'Via ASGI'},
+                                                content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 201)
+        story = await NewsStory.objects.aget(headline='Async')
+        response = await self.async_client.delete(f'/api/stories/{story.pk}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(await NewsStory.objects.filter(pk=story.pk).aexists())
+
+    async def test_anonymous_post_and_delete_are_refused(self):
+        response = await self.async_client.post('/api/stories', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        response = await self.async_client.delete('/api/stories/1')
+        self.assertEqual(response.status_code, 302)
+
+
+# The background writer is never started here; tests drain the queue
+# themselves, inside the test transaction.
+@override_settings(STORY_WRITE_BEHIND=True)
+@mock.patch.object(StoryWriteQueue, 'start')
+class WriteBehindTests(StoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = make_author()
+        self.client.force_login(self.author)
+
+    def post(self, queue, headline):
+        with mock.patch('webcwk1.views.write_queue', return_value=queue):
+            return self.client.post('/api/stories', {'headline': headline, 'category': 'pol', 'region': 'uk',
+                                                     'details': 'Queued'}, content_type='application/json')
+
+    def journal_queue(self, path, batch_size=100):
+        queue = StoryWriteQueue(100, batch_size, 0.01, 'journal', path)
+        queue.recover()
+        return queue
+
+    def test_posts_are_committed_in_order(self, start):
+        queue = StoryWriteQueue(100, 2, 0.01)
+        for i in range(5):
+            response = self.post(queue, f'Story {i}')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['status'], 'queued')
+        self.assertFalse(NewsStory.objects.exists())
+        self.assertEqual(queue.write_batch(), 2)
+        queue.flush()
+        self.assertEqual(list(NewsStory.objects.order_by('id').values_list('headline', flat=True)),
+                         [f'Story {i}' for i in range(5)])
+        start.assert_called()
+
+    def test_full_queue_applies_backpressure(self, start):
+        queue = StoryWriteQueue(1, 10, 0.01)
+        self.assertEqual(self.post(queue, 'First').status_code, 202)
+        response = self.post(queue, 'Second')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        queue.flush()
+        self.assertEqual(self.post(queue, 'Third').status_code, 202)
+
+    def test_crash_recovery_replays_only_uncommitted_stories(self, start):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        path = os.path.join(workdir.name, 'queue.jsonl')
+        queue = self.journal_queue(path, batch_size=2)
+        for i in range(3):
+            self.post(queue, f'Story {i}')
+        queue.write_batch()
+        # Crash: the third story is only in the journal, and a fourth was cut
+        # off mid-append.
+        queue.journal.write(b'{"key": "torn", "headl')
+        queue.journal.close()
+
+        recovered = self.journal_queue(path)
+        self.assertEqual(len(recovered), 1)
+        recovered.flush()
+        self.assertEqual(list(NewsStory.objects.order_by('id').values_list('headline', flat=True)),
+                         ['Story 0', 'Story 1', 'Story 2'])
+        # Only the header of a fresh epoch is left.
+        with open(path, 'rb') as journal:
+            self.assertEqual(list(json.loads(journal.read())), ['epoch'])
+        recovered.close()
+        restarted = self.journal_queue(path)
+        self.assertEqual(len(restarted), 0)
+        restarted.close()
+
+    def test_crash_after_journal_restart_replays_new_stories(self, start):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        path = os.path.join(workdir.name, 'queue.jsonl')
+        queue = self.journal_queue(path)
+        self.post(queue, 'Story 0 with a long enough headline to push the checkpoint well into the journal')
+        queue.write_batch()
+        # Crash after the journal started over but before any batch recorded
+        # the new epoch: the checkpoint still holds the old offset, which is
+        # past the end of the first post and the middle of the last.
+        for i in range(1, 4):
+            self.post(queue, f'Story {i}')
+        queue.journal.close()
+
+        recovered = self.journal_queue(path)
+        self.addCleanup(recovered.close)
+        self.assertEqual(len(recovered), 3)
+        recovered.flush()
+        self.assertEqual(NewsStory.objects.count(), 4)
+
+    def test_torn_header_is_an_empty_journal(self, start):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        path = os.path.join(workdir.name, 'queue.jsonl')
+        with open(path, 'wb') as journal:
+            journal.write(b'{"epoch": "ab')
+        queue = self.journal_queue(path)
+        self.addCleanup(queue.close)
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(self.post(queue, 'Story 0').status_code, 202)
+        queue.flush()
+        self.assertEqual(NewsStory.objects.count(), 1)
+
+    def test_unreadable_line_is_set_aside(self, start):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        path = os.path.join(workdir.name, 'queue.jsonl')
+        queue = self.journal_queue(path)
+        self.post(queue, 'Story 0')
+        queue.journal.write(b'not json\n')
+        self.post(queue, 'Story 1')
+        queue.journal.close()
+
+        with self.assertLogs('webcwk1.writebehind', 'ERROR'):
+            recovered = self.journal_queue(path)
+        self.addCleanup(recovered.close)
+        self.assertEqual(len(recovered), 2)
+        with open(f'{path}.rejected', 'rb') as rejected:
+            self.assertEqual(rejected.read(), b'not json\n')
+
+    def test_close_gives_up_on_a_failing_database(self, start):
+        queue = StoryWriteQueue(100, 10, 0.01)
+        self.post(queue, 'Story 0')
+        with mock.patch.object(queue, 'insert', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('webcwk1.writebehind', 'ERROR'):
+            queue.close()
+        self.assertEqual(len(queue), 1)
+
+    def test_each_process_locks_its_own_journal(self, start):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        path = os.path.join(workdir.name, 'queue.jsonl')
+        first = self.journal_queue(path)
+        self.addCleanup(first.close)
+        second = self.journal_queue(path)
+        self.addCleanup(second.close)
+        self.assertEqual(first.journal_path, path)
+        self.assertEqual(second.journal_path, os.path.join(workdir.name, 'queue.1.jsonl'))
+
+
+class SQLiteProfileTests(TestCase):
+    def new_connection(self):
+        from django.db import connection
+
+        # A second connection, so connection_created fires on a fresh one.
+        other = connection.copy()
+        other.ensure_connection()
+        self.addCleanup(other.close)
+        return other
+
+    def pragma(self, conn, name):
+        with conn.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PRODUCTION_PROFILE=True, SQLITE_CONN_MAX_AGE=60)
+    def test_profile_configures_new_connections(self):
+        conn = self.new_connection()
+        self.assertEqual(self.pragma(conn, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(conn, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(conn, 'cache_size'), -65536)
+        self.assertEqual(conn.settings_dict['CONN_MAX_AGE'], 60)
+        self.assertIsNotNone(conn.close_at)
+
+    def test_profile_is_off_by_default(self):
+        conn = self.new_connection()
+        self.assertEqual(self.pragma(conn, 'synchronous'), 2)  # FULL
+        self.assertEqual(conn.settings_dict['CONN_MAX_AGE'], 0)
@@ -1,11 +1,22 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+
+def story_urlpatterns(story_views):
+    return [
+        path('stories', story_views.post_story, name='post_story'),
+        path('stories/batch', views.post_stories_batch, name='post_stories_batch'),
+        path('stories/delete', views.delete_stories, name='delete_stories'),
+        path('stories/changes', views.list_story_changes, name='story_changes'),
+        path('stories/<int:key>', story_views.delete_story, name='delete_story'),
+    ]
+
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('login', views.login, name='login'),
     # path('/register', views.register, name='register'),
     path('logout', views.logout, name='logout'),
-    path('stories', views.post_story, name='post_story'),
-    path('stories/<int:key>', views.delete_story, name='delete_story'),
-]
+    path('metrics', views.metrics, name='metrics'),
+] + story_urlpatterns(async_views if settings.STORIES_ASYNC_VIEWS else views)
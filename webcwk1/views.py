@@ -1,14 +1,28 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, logout
 from django.contrib.auth import login as login_dj
+from django.db import transaction
+from django.conf import settings
 from datetime import datetime
 from django.utils.timezone import make_aware
+from django.utils.cache import get_conditional_response
 import json
 
+from cwk1.metrics import request_metrics
+from cwk1.tokens import issue_token
+
+from .cache import bump_generation, cache_stats, read_through
 from .models import Author, NewsStory
+from .listing import Listing
+from .queries import (
+    delete_in_chunks, latest_change, listing_validators, parse_change_cursor, parse_page_size, story_changes,
+    story_json, story_page, story_rows,
+)
+from .streaming import NDJSON_CONTENT_TYPE, iter_json, iter_ndjson
+from .writebehind import QueueFull, queued_stories, write_queue
 
 
 # Create your views here.
@@ -31,6 +45,9 @@ def login(request):
     def perform_authentication(request, username, password):
         user = authenticate(request, username=username, password=password)
         if user is not None:
+            # token=1 asks for a stateless bearer token instead of a session.
+            if request.POST.get('token') == '1':
+                return JsonResponse({'token': issue_token(user), 'expires_in': settings.AUTH_TOKEN_MAX_AGE})
             login_dj(request, user)
             return HttpResponse('Login successful', status=200, content_type='text/plain')
         else:
@@ -61,6 +78,114 @@ def logout_view(request):
     return perform_logout(request)
 
 
+def metrics(request):
+    """This process's request metrics and story cache counters, as Prometheus text."""
+    if request.method != 'GET':
+        return HttpResponse('Invalid request method', status=405, content_type='text/plain')
+    lines = ['# HELP cwk1_story_cache_events_total Story listing cache hits, misses and evictions.',
+             '# TYPE cwk1_story_cache_events_total counter']
+    for event, count in cache_stats().items():
+        lines.append(f'cwk1_story_cache_events_total{{event="{event}"}} {count}')
+    lines += ['# HELP cwk1_story_write_queue_pending Stories accepted but not yet committed.',
+              '# TYPE cwk1_story_write_queue_pending gauge',
+              f'cwk1_story_write_queue_pending {queued_stories()}']
+    return HttpResponse(request_metrics.render() + '\n'.join(lines) + '\n',
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def list_stories(request):
+    try:
+        listing = Listing(request)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400, content_type='text/plain')
+    stories = listing.stories
+
+    # Pollers that already hold the current listing get a 304 off the
+    # validators alone, before any story rows are read. The change log
+    # revision also keys the cache, so writes made by other processes are
+    # never served stale.
+    change = latest_change()
+    etag, last_modified = listing_validators(listing.filters, change)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    def render_listing():
+        rows = story_rows(stories, listing.columns)
+        if not listing.paginated:
+            return listing.render(list(rows))
+        if listing.text:
+            return listing.render(list(rows[:listing.page_size]))
+        return listing.render(*story_page(stories, listing.cursor, listing.page_size, listing.columns))
+
+    # A stream has committed to 200 before the first row is read, so an
+    # empty result streams as an empty listing rather than a 404.
+    if listing.mode == 'ndjson':
+        body = StreamingHttpResponse(iter_ndjson(stories), content_type=NDJSON_CONTENT_TYPE)
+    elif listing.mode == 'stream':
+        body = StreamingHttpResponse(iter_json(stories), content_type='application/json')
+    else:
+        try:
+            body = read_through('listing', listing.filters, render_listing, revision=change[0])
+        except ValueError as e:
+            return HttpResponse(str(e), status=400, content_type='text/plain')
+    return listing.finish(body, etag, last_modified)
+
+
+def list_story_changes(request):
+    """Stories added, updated and deleted after the ``since`` cursor, oldest first.
+
+    Lets mirrors poll for what changed instead of re-reading listings. Pass
+    ``next`` back as ``since``; ``more`` says whether to ask again straight
+    away. A cursor older than the trimmed log is a 400, and the mirror
+    starts over without one.
+    """
+    if request.method != 'GET':
+        return HttpResponse('Invalid request method', status=405, content_type='text/plain')
+    try:
+        since = parse_change_cursor(request.GET.get('since'))
+        limit = parse_page_size(request.GET.get('limit'))
+        rows, deleted, next_cursor, more = story_changes(since, limit)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400, content_type='text/plain')
+    body = '{"stories": [%s], "deleted": %s, "next": "%d", "more": %s}' % (
+        ', '.join([story_json(row) for row in rows]), json.dumps([str(key) for key in deleted]), next_cursor,
+        json.dumps(more))
+    return HttpResponse(body.encode('utf-8'), content_type='application/json')
+
+
+STORY_FIELDS = ('headline', 'category', 'region', 'details')
+BATCH_MAX_STORIES = 10000
+BATCH_CHUNK_SIZE = 500
+BULK_DELETE_MAX_KEYS = 10000
+
+
+def story_payload_error(json_data):
+    """Why a posted story can't be stored, or ``None`` if it can."""
+    if not isinstance(json_data, dict):
+        return 'Story must be a JSON object'
+    for field in STORY_FIELDS:
+        if not isinstance(json_data.get(field), str):
+            return f'Missing field: {field}'
+    if json_data['region'] not in {'uk', 'eu', 'w'}:
+        return 'Invalid region'
+    if json_data['category'] not in {'pol', 'art', 'tech', 'trivia'}:
+        return 'Invalid category'
+    return None
+
+
+def queue_story(author, json_data):
+    """Accept a validated story for the write-behind queue (``STORY_WRITE_BEHIND``)."""
+    try:
+        key = write_queue().put(author, json_data)
+    except QueueFull as e:
+        response = HttpResponse(str(e), status=429, content_type='text/plain')
+        response['Retry-After'] = '1'
+        return response
+    # The key only identifies the queued story; it is not the eventual story key.
+    return JsonResponse({'key': key, 'status': 'queued'}, status=202)
+
+
 #  if request.user.authenticated
 @csrf_exempt
 def post_story(request):
@@ -70,12 +195,11 @@ def post_story(request):
         try:
             author = request.user
             json_data = json.loads(request.body.decode('utf-8'))
-            region = json_data['region']
-            category = json_data['category']
-            if region not in {'uk', 'eu', 'w'}:
-                return HttpResponse('Invalid region', status=503, content_type='text/plain')
-            if category not in {'pol', 'art', 'tech', 'trivia'}:
-                return HttpResponse('Invalid category', status=503, content_type='text/plain')
+            error = story_payload_error(json_data)
+            if error:
+                return HttpResponse(error, status=503, content_type='text/plain')
+            if settings.STORY_WRITE_BEHIND:
+                return queue_story(author, json_data)
             NewsStory.objects.create(
                 headline=json_data['headline'],
                 category=json_data['category'],
@@ -84,50 +208,75 @@ def post_story(request):
                 details=json_data['details'],
                 date=datetime.now()
             )
+            bump_generation()
             return HttpResponse(status=201, content_type='text/plain')
         except Exception as e:
             return HttpResponse(f'Failed to add story: {str(e)}', status=503, content_type='text/plain')
 
     elif request.method == 'GET':
-        category = request.GET.get('story_cat', '*')
-        region = request.GET.get('story_region', '*')
-        date_str = request.GET.get('story_date', '*')
+        return list_stories(request)
 
-        date = '*'
-        if date_str != '*':
-            try:
-                date = datetime.strptime(date_str, '%d/%m/%Y').date()
-            except ValueError:
-                return HttpResponse('Invalid date format. Date must be in DD/MM/YYYY format.', status=400,
-                                    content_type='text/plain')
+    else:
+        return HttpResponse('Invalid request method', status=405, content_type='text/plain')
 
-        filters = {}
-        if category != '*':
-            filters['category'] = category
-        if region != '*':
-            filters['region'] = region
-        if date != '*' and date != None:
-            filters['date__gte'] = date
-
-        stories = NewsStory.objects.filter(**filters)
-        if stories.exists():
-            stories_list = [
-                {
-                    'key': str(story.pk),
-                    'headline': story.headline,
-                    'story_cat': story.category,
-                    'story_region': story.region,
-                    'author': story.author.username,
-                    'story_date': story.date.strftime('%Y-%m-%d'),
-                    'story_details': story.details
-                } for story in stories
-            ]
-            return JsonResponse({'stories': stories_list})
-        else:
-            return HttpResponse('No stories found', status=404, content_type='text/plain')
 
-    else:
+@csrf_exempt
+def post_stories_batch(request):
+    def parse_items(request):
+        # A JSON array, or one story per line for NDJSON bodies. Lines that
+        # don't parse become per-item failures rather than failing the batch.
+        body = request.body.decode('utf-8')
+        if NDJSON_CONTENT_TYPE in request.content_type:
+            items = []
+            for line in body.splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    items.append(None)
+            return items
+        items = json.loads(body)
+        if not isinstance(items, list):
+            raise ValueError('Body must be a JSON array of stories')
+        return items
+
+    if request.method != 'POST':
         return HttpResponse('Invalid request method', status=405, content_type='text/plain')
+    if not request.user.is_authenticated:
+        return HttpResponse('User not logged in', status=503, content_type='text/plain')
+    try:
+        items = parse_items(request)
+    except ValueError as e:
+        return HttpResponse(f'Invalid batch: {str(e)}', status=400, content_type='text/plain')
+    if len(items) > BATCH_MAX_STORIES:
+        return HttpResponse(f'Batch exceeds {BATCH_MAX_STORIES} stories', status=413, content_type='text/plain')
+
+    results = []
+    stories = []
+    for index, item in enumerate(items):
+        error = story_payload_error(item) if item is not None else 'Invalid JSON'
+        if error:
+            results.append({'index': index, 'status': 'error', 'error': error})
+            continue
+        results.append({'index': index, 'status': 'created'})
+        stories.append(NewsStory(headline=item['headline'], category=item['category'], region=item['region'],
+                                 author=request.user, details=item['details']))
+
+    try:
+        with transaction.atomic():
+            NewsStory.objects.bulk_create(stories, batch_size=BATCH_CHUNK_SIZE)
+    except Exception as e:
+        return HttpResponse(f'Failed to add stories: {str(e)}', status=503, content_type='text/plain')
+    if stories:
+        bump_generation()
+
+    created = iter(stories)
+    for result in results:
+        if result['status'] == 'created':
+            result['key'] = str(next(created).pk)
+    return JsonResponse({'created': len(stories), 'failed': len(results) - len(stories), 'results': results},
+                        status=201 if stories else 400)
 
 
 @csrf_exempt
@@ -142,6 +291,7 @@ def delete_story(request, key):
         try:
             story = get_object_or_404(NewsStory, pk=key, author=request.user)
             story.delete()
+            bump_generation()
             return HttpResponse(status=200, content_type='text/plain')
         except NewsStory.DoesNotExist:
             return HttpResponse('Story not found', status=404, content_type='text/plain')
@@ -152,3 +302,75 @@ def delete_story(request, key):
     if response:
         return response
     return delete_user_story(request, key)
+
+
+@csrf_exempt
+def delete_stories(request):
+    """Delete many stories at once: ``{"keys": [...]}`` or ``{"filter": {...}}``.
+
+    Filters are ``author`` (a username), ``before`` (DD/MM/YYYY; stories
+    dated earlier than that day) and ``category``, ANDed together. Authors
+    can only delete their own stories; staff may name any author.
+    """
+    def parse_filter(spec, user):
+        if not isinstance(spec, dict) or not spec:
+            raise ValueError('filter must be a non-empty object')
+        unknown = set(spec) - {'author', 'before', 'category'}
+        if unknown:
+            raise ValueError(f'Unknown filter: {", ".join(sorted(unknown))}')
+        filters = {}
+        if 'author' in spec:
+            filters['author__username'] = spec['author']
+        if not user.is_staff:
+            if filters.pop('author__username', user.username) != user.username:
+                raise PermissionError('You can only delete your own stories')
+            filters['author'] = user
+        if 'before' in spec:
+            try:
+                filters['date__lt'] = make_aware(datetime.strptime(spec['before'], '%d/%m/%Y'))
+            except (TypeError, ValueError):
+                raise ValueError('Invalid date format. Date must be in DD/MM/YYYY format.')
+        if 'category' in spec:
+            filters['category'] = spec['category']
+        return filters
+
+    def parse_keys(keys, user):
+        if not isinstance(keys, list) or not all(isinstance(key, (int, str)) for key in keys):
+            raise ValueError('keys must be a list of story keys')
+        if len(keys) > BULK_DELETE_MAX_KEYS:
+            raise ValueError(f'At most {BULK_DELETE_MAX_KEYS} keys per request')
+        try:
+            keys = {int(key) for key in keys}
+        except ValueError:
+            raise ValueError('keys must be a list of story keys')
+        return keys, {'pk__in': keys} if user.is_staff else {'pk__in': keys, 'author': user}
+
+    if request.method != 'POST':
+        return HttpResponse('Invalid request method', status=405, content_type='text/plain')
+    if not request.user.is_authenticated:
+        return HttpResponse('User not logged in', status=503, content_type='text/plain')
+    keys = None
+    try:
+        body = json.loads(request.body.decode('utf-8'))
+        if not isinstance(body, dict) or ('keys' in body) == ('filter' in body):
+            raise ValueError('Body must have either keys or filter')
+        if 'keys' in body:
+            keys, filters = parse_keys(body['keys'], request.user)
+        else:
+            filters = parse_filter(body['filter'], request.user)
+    except PermissionError as e:
+        return HttpResponse(str(e), status=403, content_type='text/plain')
+    except ValueError as e:
+        return HttpResponse(f'Invalid delete: {str(e)}', status=400, content_type='text/plain')
+
+    try:
+        deleted = delete_in_chunks(NewsStory.objects.filter(**filters))
+    except Exception as e:
+        return HttpResponse(f'Failed to delete stories: {str(e)}', status=503, content_type='text/plain')
+    if deleted:
+        bump_generation()
+    result = {'deleted': deleted}
+    if keys is not None:
+        # Keys that didn't exist or belong to someone else.
+        result['not_found'] = len(keys) - deleted
+    return JsonResponse(result)
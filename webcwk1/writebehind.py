@@ -0,0 +1,324 @@
+"""Write-behind queue for posted stories, used when ``STORY_WRITE_BEHIND`` is on.
+
+``post_story`` validates a story, hands it to ``write_queue().put()`` and
+answers 202 straight away. A background thread commits queued stories in
+batches of up to ``STORY_WRITE_BEHIND_BATCH_SIZE``, one transaction each, so
+many posts share a single fsync. Stories are committed in the order they
+were accepted.
+
+``STORY_WRITE_BEHIND_DURABILITY`` decides what an accepted story survives:
+
+- ``'memory'``: nothing; stories still queued when the process dies are lost.
+- ``'journal'``: a crash of the process. Each story is appended to
+  ``STORY_WRITE_BEHIND_JOURNAL`` before the 202, and the uncommitted tail is
+  replayed on the next start.
+- ``'fsync'``: as ``'journal'``, and also a crash of the machine. Each append
+  is fsynced, which is still one fsync per post rather than SQLite's several.
+
+A journal starts with a header line naming its epoch, which is stored with
+the checkpoint. Once everything in it is committed the journal starts over
+under a new epoch, so a checkpoint left over from the old one is recognised
+as stale rather than trusted.
+
+Each process locks its journal. Worker processes sharing one
+``STORY_WRITE_BEHIND_JOURNAL`` take ``story-queue.1.jsonl``,
+``story-queue.2.jsonl`` and so on next to it, and a restarted worker replays
+whichever journal it ends up with.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import count, islice
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+
+from .cache import bump_generation
+from .models import NewsStory, StoryQueueCheckpoint
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, one process per journal.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_LEVELS = ('memory', 'journal', 'fsync')
+# Attempts close() makes to commit what is left before giving up on it; a
+# journal keeps those stories for the next start.
+CLOSE_ATTEMPTS = 3
+# Longest the writer thread waits between retries of a failing batch.
+MAX_RETRY_DELAY = 5.0
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    """More than ``STORY_WRITE_BEHIND_MAX_PENDING`` stories are waiting."""
+
+
+class StoryWriteQueue:
+    """A bounded, optionally journalled queue of stories awaiting commit.
+
+    ``journal_path`` is required unless ``durability`` is ``'memory'``, and
+    ``recover()`` must run before the first ``put()`` to open it. When another
+    process holds that journal, ``recover()`` moves on to the first free
+    numbered one beside it.
+    """
+
+    def __init__(self, max_pending, batch_size, interval, durability='memory', journal_path=None):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f'Unknown write-behind durability: {durability!r}')
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.interval = interval
+        self.durability = durability
+        self.journal_path = str(journal_path) if durability != 'memory' else None
+        self.journal = None
+        self.epoch = ''
+        # Entries are (journal offset just past the story, story).
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.thread = None
+        self.closed = False
+
+    def recover(self):
+        """Queue stories left in the journal by a previous process.
+
+        Anything past the committed checkpoint is replayed, or the whole
+        journal when the checkpoint belongs to an earlier epoch. A torn final
+        line (the process died mid-append, before the 202) is cut off, and a
+        line that doesn't parse is moved to ``<journal>.rejected``.
+        """
+        if self.journal_path is None:
+            return 0
+        self.journal = self.open_journal()
+        self.journal.seek(0)
+        header = self.journal.readline()
+        if not header.endswith(b'\n'):
+            # Empty, or torn while starting over: nothing was queued after it.
+            self.start_journal()
+            return 0
+        try:
+            self.epoch, start = json.loads(header)['epoch'], len(header)
+        except (ValueError, KeyError, TypeError):
+            # Written before journals had epochs.
+            self.epoch, start = '', 0
+        checkpoint = StoryQueueCheckpoint.objects.filter(journal=self.journal_path).first()
+        offset = start
+        if checkpoint is not None and checkpoint.epoch == self.epoch:
+            offset = max(checkpoint.offset, start)
+        self.journal.seek(offset)
+        end = offset
+        for line in self.journal:
+            if not line.endswith(b'\n'):
+                break
+            end += len(line)
+            try:
+                self.pending.append((end, json.loads(line)))
+            except ValueError:
+                self.reject(line)
+        self.journal.truncate(end)
+        self.journal.seek(0, os.SEEK_END)
+        if self.pending:
+            logger.info('Replaying %d queued stories from %s', len(self.pending), self.journal_path)
+        return len(self.pending)
+
+    def start_journal(self):
+        """Empty the journal and head it with a new epoch."""
+        self.epoch = uuid.uuid4().hex
+        self.journal.truncate(0)
+        self.journal.seek(0)
+        self.journal.write(json.dumps({'epoch': self.epoch}).encode('utf-8') + b'\n')
+        self.journal.flush()
+        if self.durability == 'fsync':
+            os.fsync(self.journal.fileno())
+
+    def reject(self, line):
+        logger.error('Moving an unreadable line of %s to %s.rejected', self.journal_path, self.journal_path)
+        with open(f'{self.journal_path}.rejected', 'ab') as rejected:
+            rejected.write(line)
+
+    def open_journal(self):
+        """Open and lock the first journal no other process holds."""
+        base, ext = os.path.splitext(self.journal_path)
+        for slot in count():
+            path = f'{base}.{slot}{ext}' if slot else self.journal_path
+            journal = open(path, 'a+b')
+            if fcntl is None:
+                break
+            try:
+                fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                journal.close()
+        if path != self.journal_path:
+            logger.info('%s is in use by another process; journalling to %s', self.journal_path, path)
+            self.journal_path = path
+        return journal
+
+    def put(self, author, story):
+        """Queue ``story`` (already validated) and return its provisional key.
+
+        Raises ``QueueFull`` instead of blocking when the queue is at its limit.
+        """
+        record = {'key': uuid.uuid4().hex, 'author_id': author.pk, 'author_username': author.username,
+                  **{field: story[field] for field in ('headline', 'category', 'region', 'details')}}
+        with self.condition:
+            if self.closed:
+                raise QueueFull('Write-behind queue is shut down')
+            if len(self.pending) >= self.max_pending:
+                raise QueueFull(f'{len(self.pending)} stories are already waiting to be written')
+            self.pending.append((self.append(record), record))
+            self.condition.notify()
+        self.start()
+        return record['key']
+
+    def append(self, record):
+        if self.journal is None:
+            return 0
+        self.journal.write(json.dumps(record).encode('utf-8') + b'\n')
+        self.journal.flush()
+        if self.durability == 'fsync':
+            os.fsync(self.journal.fileno())
+        return self.journal.tell()
+
+    def __len__(self):
+        with self.condition:
+            return len(self.pending)
+
+    def write_batch(self):
+        """Commit the oldest batch of queued stories; returns how many."""
+        with self.write_lock:
+            with self.condition:
+                batch = list(islice(self.pending, self.batch_size))
+            if not batch:
+                return 0
+            try:
+                with transaction.atomic():
+                    self.insert([record for _, record in batch])
+                    self.checkpoint(batch[-1][0])
+            except IntegrityError:
+                # Most likely the author was deleted after posting. Commit the
+                # rest one at a time so one story can't wedge the queue.
+                for end, record in batch:
+                    try:
+                        with transaction.atomic():
+                            self.insert([record])
+                            self.checkpoint(end)
+                    except IntegrityError:
+                        logger.warning('Dropping queued story %s', record['key'], exc_info=True)
+                        self.checkpoint(end)
+            with self.condition:
+                for _ in batch:
+                    self.pending.popleft()
+                if not self.pending and self.journal is not None:
+                    # Fully committed: start the journal over. No post can
+                    # append until the new header is down, and the new epoch
+                    # makes the checkpoint stale, so a crash at any point
+                    # leaves recover() replaying exactly what is uncommitted.
+                    # The next batch records the new epoch with its offset.
+                    self.start_journal()
+                self.condition.notify_all()
+        bump_generation()
+        return len(batch)
+
+    def insert(self, records):
+        NewsStory.objects.bulk_create([
+            NewsStory(author_id=record['author_id'], author_username=record['author_username'],
+                      headline=record['headline'], category=record['category'], region=record['region'],
+                      details=record['details'])
+            for record in records
+        ])
+
+    def checkpoint(self, offset):
+        if self.journal_path is not None:
+            StoryQueueCheckpoint.objects.update_or_create(journal=self.journal_path,
+                                                          defaults={'offset': offset, 'epoch': self.epoch})
+
+    def flush(self):
+        """Commit everything queued so far, in the calling thread."""
+        while self.write_batch():
+            pass
+
+    def start(self):
+        if self.thread is None:
+            with self.condition:
+                if self.thread is None and not self.closed:
+                    self.thread = threading.Thread(target=self.run, name='story-write-behind', daemon=True)
+                    self.thread.start()
+
+    def run(self):
+        failures = 0
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.pending or self.closed)
+                    if self.closed:
+                        return
+                    # Give a burst of posts a moment to fill the batch.
+                    self.condition.wait_for(lambda: len(self.pending) >= self.batch_size or self.closed,
+                                            timeout=self.interval)
+                try:
+                    self.write_batch()
+                    failures = 0
+                except Exception:
+                    logger.exception('Write-behind batch failed; retrying')
+                    failures += 1
+                    with self.condition:
+                        self.condition.wait(timeout=min(self.interval * 2 ** failures, MAX_RETRY_DELAY))
+        finally:
+            connection.close()
+
+    def close(self):
+        """Stop the writer thread, commit what is left and close the journal."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        try:
+            for attempt in range(1, CLOSE_ATTEMPTS + 1):
+                try:
+                    self.flush()
+                    break
+                except DatabaseError:
+                    if attempt == CLOSE_ATTEMPTS:
+                        logger.exception('Giving up on %d queued stories at shutdown%s', len(self),
+                                         '; they stay in the journal' if self.journal else '')
+                    else:
+                        time.sleep(self.interval)
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+
+def write_queue():
+    """The process-wide queue, recovered on first use and flushed at exit."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                queue = StoryWriteQueue(settings.STORY_WRITE_BEHIND_MAX_PENDING,
+                                        settings.STORY_WRITE_BEHIND_BATCH_SIZE,
+                                        settings.STORY_WRITE_BEHIND_INTERVAL,
+                                        settings.STORY_WRITE_BEHIND_DURABILITY,
+                                        settings.STORY_WRITE_BEHIND_JOURNAL)
+                if queue.recover():
+                    queue.start()
+                atexit.register(queue.close)
+                _queue = queue
+    return _queue
+
+
+def queued_stories():
+    """Stories waiting in this process's queue; 0 if it was never started."""
+    return len(_queue) if _queue is not None else 0